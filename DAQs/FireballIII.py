@@ -2,8 +2,13 @@ import os, sys
 from pathlib import Path
 import csv
 import re
+import logging
 import numpy as np
 from LAMP.DAQ import DAQ
+from .csv_frames import read_csv_frame
+from .shot_loader import run_jobs, default_workers, _init_worker, _load_in_worker
+
+logger = logging.getLogger(__name__)
 
 class FireballIII(DAQ):
     """Interface layer for HRMT68
@@ -16,7 +21,22 @@ class FireballIII(DAQ):
     def __init__(self, exp_obj):
         """Initiate parent base Diagnostic class to get all shared attributes and funcs"""
         super().__init__(exp_obj)
+
+        # sorted shot numbers and filenames of each diagnostic's data folder, see shot_index()
+        self._shot_indexes = {}
+
+        # Parallel loading of many shots, see get_shot_data()
+        loading_config = self.ex.config.get('loading', {})
+        self.backend = loading_config.get('backend', 'thread')
+        self.workers = loading_config.get('workers', default_workers(self.backend))
         return
+
+    def __getstate__(self):
+        # the experiment object is not needed (or picklable) in process pool workers, which only load files
+        state = self.__dict__.copy()
+        state['ex'] = None
+        state['_shot_indexes'] = {}
+        return state
     
     def load_csv_image(self, path:str)->tuple[np.ndarray, list, list]:
         """Loads image object from .csv given by DigiCam. Due to the way that the DigiCams store image data,
@@ -41,20 +61,113 @@ class FireballIII(DAQ):
 
         #Remove top row and first column, as this is coordinate data
         try:
-            img = np.genfromtxt(path, delimiter=',')
-            x_coords = img[0, 1:]
-            y_coords = img[1:, 0]
-            img = img[1:, 1:]
-
-            return {"IMG":img, "X":x_coords, "Y":y_coords}
+            return read_csv_frame(path)
 
         except Exception as e:
             ValueError(f"Error: DIGICAM image generation from {path} failed. {e}")
 
 
-    def get_shot_data(self, diag_name, shot_dict):
+    def shot_index(self, diag_name):
+        """Sorted shot numbers and filenames of a diagnostic's data files. The shot number of a file
+        is the first 10 digits of the fifth '_' separated part of its name. The folder is listed once,
+        and again only when its modification time changes.
 
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+
+        Returns
+        -------
+            shots : np.ndarray
+                The shot numbers, sorted (then by filename).
+            filenames : np.ndarray
+                The corresponding filenames.
+        """
         diag_config = self.ex.diags[diag_name].config
+        folder = self.data_folder + diag_config['data_folder']
+        dir_mtime = os.stat(folder).st_mtime_ns
+
+        cached = self._shot_indexes.get(diag_name)
+        if cached is not None and cached[0] == (folder, dir_mtime):
+            return cached[1], cached[2]
+
+        shots, filenames = [], []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                filename = entry.name
+                if not (filename.endswith(diag_config['data_ext']) and filename.startswith(diag_config['data_stem'])):
+                    continue
+                try:
+                    shots.append(int(filename.replace('.csv', '').split('_')[4][0:10]))
+                except (IndexError, ValueError):
+                    logger.debug(f"shot_index(): no shot number in {filename}, skipping")
+                    continue
+                filenames.append(filename)
+
+        shots = np.array(shots, dtype=np.int64)
+        filenames = np.array(filenames, dtype=str)
+        order = np.lexsort((filenames, shots))
+        shots, filenames = shots[order], filenames[order]
+        self._shot_indexes[diag_name] = ((folder, dir_mtime), shots, filenames)
+        return shots, filenames
+
+    def find_nearest_files(self, diag_name, shots):
+        """Filenames of the files with the nearest shot number to each requested shot (compared on
+        the first 10 digits), matched in a single binary search over the sorted shot_index().
+        Equally near files go to the earlier shot number.
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            shots : list
+                The requested shot numbers.
+
+        Returns
+        -------
+            filenames : np.ndarray
+                The nearest file for each requested shot, in the order requested.
+        """
+        index_shots, filenames = self.shot_index(diag_name)
+        if len(index_shots) == 0:
+            raise ValueError(f"find_nearest_files() error: no {diag_name} files found in {self.data_folder + self.ex.diags[diag_name].config['data_folder']}")
+
+        shots = np.array([int(str(shot)[0:10]) for shot in np.atleast_1d(shots)], dtype=np.int64)
+        above = np.searchsorted(index_shots, shots, side='left').clip(max=len(index_shots) - 1)
+        below = (above - 1).clip(min=0)
+        nearest = np.where(np.abs(index_shots[above] - shots) < np.abs(shots - index_shots[below]), above, below)
+        # first file of that shot number, if there are several
+        nearest = np.searchsorted(index_shots, index_shots[nearest], side='left')
+        return filenames[nearest]
+
+    def load_data(self, shot_filepath, file_type=None):
+        """Loads a single file, as 'image' or DigiCam 'csv' data, or otherwise as the base DAQ"""
+        if file_type == 'image':
+            return self.load_imdata(shot_filepath)
+        elif file_type == 'csv':
+            return np.array(self.load_csv_image(shot_filepath)["IMG"])
+        return super().load_data(shot_filepath, file_type=file_type)
+
+    def get_shot_data(self, diag_name, shot_dict, workers=None, backend=None):
+        """Data of the files nearest to the shot numbers in shot_dict["shot"] (see find_nearest_files()),
+        loaded in parallel. A list of shot numbers returns a list with the data of every shot, in
+        the order requested (None for any that failed to load); a single shot number its data.
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            shot_dict : dict or str
+                {"shot": shot number(s)}, or a raw filepath relative to the data folder.
+            workers : int, optional
+                Number of parallel workers, 1 to load serially. Defaults to [loading] workers in the config.
+            backend : str, optional
+                'thread' or 'process'. Defaults to [loading] backend in the config.
+        """
+
+        diag_config = self.ex.diags[diag_name].config
+        shot_data = None
 
         # Double check if shot_dict is dictionary; could just be filepath
         if isinstance(shot_dict, dict):
@@ -64,31 +177,32 @@ class FireballIII(DAQ):
                 if param not in diag_config:
                     print(f"get_shot_data() error: {self.__name} DAQ requires a config['setup'] parameter '{param}' for {diag_name}")
                     return None
-    
-            filepath=self.data_folder+diag_config['data_folder']
-            csv_files = np.array([f for f in os.listdir(filepath) if f.endswith(diag_config['data_ext']) and f.startswith(diag_config['data_stem'])])
-                
-            
-            parts = np.array([int(filename.replace('.csv', '').split('_')[4][0:10]) for filename in csv_files])
-            
-            #shot_no_=shot_dict["shot"]
-            closest_indxs=np.array([np.argmin(abs(parts-int(str(shot_no)[0:10]))) for shot_no in shot_dict["shot"]])
+            if diag_config['data_type'] not in ['image', 'csv']:
+                print('Non-image data loading not yet supported... probably need to add text at least?')
+                return None
 
-            in_files=csv_files[closest_indxs]
+            filepath = self.data_folder + diag_config['data_folder']
+            in_files = self.find_nearest_files(diag_name, shot_dict["shot"])
+            jobs = [(filepath + file, diag_config['data_type']) for file in in_files]
 
-            for file in in_files:
-  
-                shot_filepath=filepath+file
-                if diag_config['data_type'] == 'image':
-                    shot_data = self.load_imdata(shot_filepath)
-#                 else:
-#                     print('Non-image data loading not yet supported... probably need to add text at least?')
+            if backend is None:
+                backend = self.backend
+            if workers is None:
+                workers = self.workers
+            workers = min(workers, len(jobs))
+            if backend == 'process':
+                results = run_jobs(_load_in_worker, jobs, workers=workers, backend=backend, initializer=_init_worker, initargs=(self,))
+            else:
+                results = run_jobs(self.load_data, jobs, workers=workers, backend=backend)
 
-                elif diag_config['data_type'] == 'csv':
-                    shot_data = np.array(self.load_csv_image(shot_filepath)["IMG"])
-                else:
-                    print('Non-image data loading not yet supported... probably need to add text at least?')
+            shot_data = [None] * len(jobs)
+            for index, data, error in results:
+                if error is not None:
+                    logger.warning(f"Could not load {diag_name} shot {in_files[index]}: {error}")
+                shot_data[index] = data
 
+            if np.ndim(shot_dict["shot"]) == 0:
+                shot_data = shot_data[0]
 
         # raw filepath?
         else:
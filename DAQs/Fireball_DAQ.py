@@ -2,8 +2,19 @@ import os
 from pathlib import Path
 import re
 import numpy as np
+import pandas as pd
 from LAMP.DAQ import DAQ
 import logging
+from .shot_index import ShotIndex, TIMESTAMP_PATTERN
+from .scope_cache import ScopeCache
+from .csv_frames import read_csv_frame
+from .shot_loader import ShotResult, Done, run_jobs, default_workers, _init_worker, _load_in_worker, _load_staged_in_worker
+from .shot_cache import ShotCache
+from .shot_watcher import ShotWatcher
+from .shot_table import build_shot_table
+from .scope_catalogue import ScopeCatalogue
+from .shot_pack import ShotPack, ShotPackWriter
+from .staging_cache import StagingCache
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,6 +32,8 @@ class Fireball_DAQ(DAQ):
 
     # These file_types can be used so far
     supported_file_types = ['pickle', 'json', 'csv', 'numpy', 'npy', 'toml', 'tif','scope','image', 'asc', 'csv_image']
+    # data_type of diagnostics whose data_folder is a pack of shots (see pack_shots()) rather than a folder
+    packed_file_type = 'packed'
 
     def __init__(self, exp_obj):
         """Initiate parent base Diagnostic class to get all shared attributes and funcs"""
@@ -36,8 +49,63 @@ class Fireball_DAQ(DAQ):
 
         logging.getLogger().setLevel(level)
         logger.info(f"Logging level set to {level_str.upper()}")
+
+        # Local folder for shot indexes etc. (relative to root, like the other non-data paths)
+        cache_folder = self.ex.config['paths'].get('cache_folder')
+        if cache_folder:
+            self.cache_folder = Path(self.ex.config['paths']['root']) / cache_folder
+        else:
+            self.cache_folder = None
+        self._shot_indexes = {}
+        self._scope_catalogues = {}
+        self._packs = {}
+
+        # Opt-in binary cache of parsed scope .csv files
+        cache_config = self.ex.config.get('cache', {})
+        if cache_config.get('scope', False) and self.cache_folder is not None:
+            self.scope_cache = ScopeCache(self.cache_folder / 'scope')
+        else:
+            self.scope_cache = None
+
+        # In-memory LRU cache of loaded shots, shared by the diagnostics (opt in with cache=True)
+        self.shot_cache = ShotCache(max_bytes=cache_config.get('memory_mb', 512) * 1e6)
+
+        # Parallel loading of many shots, see get_shots_data()
+        loading_config = self.ex.config.get('loading', {})
+        self.backend = loading_config.get('backend', 'thread')
+        self.workers = loading_config.get('workers', default_workers(self.backend))
+
+        # Following new shots during a run, see watch_shots()
+        self.watch_config = self.ex.config.get('watch', {})
+
+        # Matching shots across diagnostics, see get_shot_table()
+        self.alignment_tolerance = self.ex.config.get('alignment', {}).get('tolerance', 1.0)
+
+        # Packing a campaign into one HDF5/Zarr file, see pack_shots()
+        self.packing_config = self.ex.config.get('packing', {})
+
+        # Opt-in local copies of files on slow data folders (e.g. EOS on SWAN), see stage_file()
+        staging_config = self.ex.config.get('staging', {})
+        self.staging_prefetch = staging_config.get('prefetch', 32)
+        if staging_config.get('enabled', False):
+            staging_folder = Path(self.ex.config['paths']['root']) / staging_config.get('folder', './staging/')
+            self.staging_cache = StagingCache(staging_folder, max_bytes=staging_config.get('size_gb', 20) * 1e9,
+                                              workers=staging_config.get('workers', 2))
+        else:
+            self.staging_cache = None
         return
 
+    def __getstate__(self):
+        # the experiment object is not needed (or picklable) in process pool workers, which only load files
+        state = self.__dict__.copy()
+        state['ex'] = None
+        state['_shot_indexes'] = {}
+        state['_scope_catalogues'] = {}
+        state['_packs'] = {}
+        state['shot_cache'] = None
+        state['staging_cache'] = None
+        return state
+
 
     def load_asc(self, filepath):
         """Loads data from .asc files, which are used for spectroscopy in the Fireball
@@ -67,7 +135,8 @@ class Fireball_DAQ(DAQ):
     def load_scope(self, filepath):
         """
             Loads data from .csv scope files, which are used for Bdot diagnostic. 
-            Skips first 16 rows.
+            Skips first 16 rows. If the scope cache is switched on ([cache] scope = true
+            in global.toml), previously parsed files are read back from the cache instead.
 
             Parameters
             ----------
@@ -90,6 +159,11 @@ class Fireball_DAQ(DAQ):
         if not Path(filepath).suffix == '.csv':
             raise ValueError(f"Error: load_scope() function only supports .csv files, "
                             f"but {filepath} has extension {Path(filepath).suffix}")
+
+        if self.scope_cache is not None:
+            cached = self.scope_cache.get(filepath)
+            if cached is not None:
+                return cached
             
         # Read all lines
         with open(filepath, 'r') as f:
@@ -164,7 +238,7 @@ class Fireball_DAQ(DAQ):
         # N = len(time)
         # dt = np.mean(np.diff(time))  # robust even if slightly nonuniform
     
-        return {
+        scope_data = {
             "time": time,
             "channels": channels,
             "channel_names": channel_names,
@@ -173,8 +247,34 @@ class Fireball_DAQ(DAQ):
             "dt": dt
                
         }
+
+        if self.scope_cache is not None:
+            self.scope_cache.put(filepath, scope_data)
+
+        return scope_data
     
     
+    def load_csv_image(self, filepath):
+        """Loads a DigiCam .csv image (HRM5/HRM6) in a single pass. The first row and
+        first column of the file hold the pixel coordinates and are split off.
+
+        Parameters
+        ----------
+            filepath : str
+                The path to the .csv file where the DigiCam image is stored.
+
+        Returns
+        -------
+            dict
+                {
+                    "IMG": np.ndarray,  # image data
+                    "X": np.ndarray,    # x coordinates (top row)
+                    "Y": np.ndarray     # y coordinates (first column)
+                }
+        """
+        logger.debug(f"Loading csv image from {filepath} in Fireball DAQ.")
+        return read_csv_frame(filepath)
+
     # Overwrite DAQ load_data to handle custom data types, e.g. asc files from spectroscopy
     def load_data(self, shot_filepath, file_type):
         """Loads data from a given filepath, with support for custom file types such as .asc files used for spectroscopy in the Fireball series.
@@ -203,19 +303,17 @@ class Fireball_DAQ(DAQ):
         elif file_type == 'image':
             data = super().load_imdata(shot_filepath)
         elif file_type =="csv_image":
-            img = np.genfromtxt(Path(shot_filepath), delimiter=',')
-            data = img[1:, 1:]
+            data = self.load_csv_image(Path(shot_filepath))["IMG"]
         else:
             raise ValueError(f"Error: file_type {file_type} not supported in Fireball DAQ.")
 
         return data
 
 
-    def get_shot_data(self, diag_name, shot_dict):
+    def get_shot_data(self, diag_name, shot_dict, cache=False):
         """Provides shot data for a given diagnostic and shot_dict, which can be in the form of a dictionary 
-        with keys 'filename' or 'timestamp', or a raw filepath string. The function constructs the appropriate
-        file path(s) based on the input and loads the data using the load_data function. It also includes error
-        handling for invalid inputs and missing files.
+        with keys 'filename' or 'timestamp', or a raw filepath string. The file path is found with
+        get_filepath() and the data loaded using the load_data function.
 
         Parameters
         ----------
@@ -223,17 +321,125 @@ class Fireball_DAQ(DAQ):
                 The name of the diagnostic for which we want to get the shot data.
             shot_dict : dict or str
                 A dictionary containing information about the shot, which can have keys 'filename' or 'timestamp',
-                or a raw filepath string.
+                or a raw filepath string. For packed diagnostics, also 'timeframe'.
+            cache : bool, optional
+                Use the in-memory shot cache (self.shot_cache). Cached data is read-only.
         Returns
         -------
             shot_data : np.ndarray or dict
                 The data for the specified shot, loaded from the appropriate file(s) based on the input shot_dict.
+                A list of the shots of a timeframe, for packed diagnostics.
         """
 
         logger.debug(f"Getting shot data for diagnostic {diag_name} with shot_dict {shot_dict} in Fireball DAQ.")
+        if self.ex.diags[diag_name].config['data_type'] == self.packed_file_type:
+            return self.get_packed_shot_data(diag_name, shot_dict, cache=cache)
+
+        shot_filepath = self.get_filepath(diag_name, shot_dict)
+        data_type = self.ex.diags[diag_name].config['data_type']
+
+        if cache:
+            cache_key = self.shot_cache.make_key(shot_filepath, data_type)
+            shot_data = self.shot_cache.get(cache_key)
+            if shot_data is None:
+                shot_data = self.load_staged(shot_filepath, data_type)
+                self.shot_cache.put(cache_key, shot_data)
+        else:
+            shot_data = self.load_staged(shot_filepath, data_type)
+        self.prefetch_following(diag_name, shot_filepath)
+
+        return shot_data
+
+    def stage_file(self, shot_filepath):
+        """Returns the path to read a data file from: its local copy in the staging folder if the
+        staging cache is on ([staging] enabled in the config), copied on first access, else the file itself."""
+        if self.staging_cache is None:
+            return shot_filepath
+        return self.staging_cache.stage(shot_filepath)
+
+    def load_staged(self, shot_filepath, file_type, local_filepath=None):
+        """load_data() from the local copy of a data file (staged here unless local_filepath is
+        given), falling back to the file itself if the copy has been removed, see stage_file()"""
+        if local_filepath is None:
+            local_filepath = self.stage_file(shot_filepath)
+        try:
+            return self.load_data(local_filepath, file_type)
+        except FileNotFoundError:
+            if Path(local_filepath) == Path(shot_filepath):
+                raise
+            # the copy was removed from the staging folder in the meantime
+            return self.load_data(shot_filepath, file_type)
+
+    def prefetch_following(self, diag_name, shot_filepath):
+        """Copies the next [staging] prefetch files of a diagnostic after shot_filepath (in time order)
+        to the staging folder in the background, so a loop over the shots of a timeframe finds them
+        locally. Does nothing if the staging cache is off."""
+        if self.staging_cache is None or not self.staging_prefetch:
+            return
+        diag_config = self.ex.diags[diag_name].config
+        data_path = Path(self.data_folder) / diag_config['data_folder'].lstrip("/\\")
+        shot_index = self.get_shot_index(data_path)
+        if len(shot_index.stamps) == 0:
+            shot_index.refresh()
+        state = shot_index.state
+        filename = Path(shot_filepath).name
+        match = TIMESTAMP_PATTERN.search(filename)
+        if match is None:
+            return
+        lo = np.searchsorted(state.stamps, match.group(0), side='left')
+        data_ext = diag_config.get('data_ext')
+        following = [name for name in state.filenames[lo:lo + self.staging_prefetch + 1].tolist()
+                     if name != filename and (not data_ext or name.endswith(data_ext))]
+        self.staging_cache.prefetch([data_path / name for name in following])
+        return
+
+    def prefetch_shots(self, diag_name, timeframe):
+        """Copies the files of a timeframe (or list of shot dictionaries) to the staging folder in the
+        background, e.g. before a long analysis. Shots whose file cannot be found are skipped.
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            timeframe : dict or list
+                As for get_shot_dicts().
+        """
+        if self.staging_cache is None:
+            logger.warning("prefetch_shots: the staging cache is off, set [staging] enabled = true in the config")
+            return
+        shot_filepaths = []
+        for shot_dict in self.get_shot_dicts(diag_name, timeframe):
+            try:
+                shot_filepaths.append(self.get_filepath(diag_name, shot_dict))
+            except (ValueError, TypeError) as e:
+                logger.debug(f"prefetch_shots: skipping {diag_name} shot {shot_dict}: {e}")
+        self.staging_cache.prefetch(shot_filepaths)
+        return
+
+    def get_filepath(self, diag_name, shot_dict):
+        """Returns the path of the file for a given diagnostic and shot_dict, which can be in the form of a
+        dictionary with keys 'filename' or 'timestamp', or a raw filepath string. It includes error
+        handling for invalid inputs and missing files.
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            shot_dict : dict or str
+                A dictionary containing information about the shot, which can have keys 'filename' or 'timestamp',
+                or a raw filepath string.
+        Returns
+        -------
+            shot_filepath : Path
+                The path to the existing data file.
+        """
         diag_config = self.ex.diags[diag_name].config
         
         data_type = diag_config['data_type']
+
+        if data_type == self.packed_file_type:
+            raise ValueError(f"Error: {diag_name} is packed into {self.get_pack_path(diag_name)}, so its shots have "
+                             f"no file of their own. Use get_shot_data() to read them.")
         
         if data_type not in self.supported_file_types:
             raise ValueError(f"Error: data_type '{data_type}' not supported in Fireball DAQ.")
@@ -298,16 +504,216 @@ class Fireball_DAQ(DAQ):
         # Convert to Path objects for easier handling
         shot_filepath = Path(shot_filepath)        
 
-        if os.path.exists(shot_filepath) and os.path.isfile(shot_filepath):
-            shot_data = self.load_data(shot_filepath, data_type)
-        else:
+        if not (os.path.exists(shot_filepath) and os.path.isfile(shot_filepath)):
             raise ValueError(f"Error: No data could be loaded for {diag_name} with "
                              f"shot_dict {shot_dict} in Fireball DAQ. Please "
                              f"check the provided shot_dict and ensure that the "
                              f"corresponding files exist and are in the correct format.")
 
-        return shot_data
+        return shot_filepath
+
+    def get_shots_data(self, diag_name, shot_dicts, workers=None, backend=None, cache=False):
+        """Loads the data for a list of shots in parallel. Errors are caught per shot, so one
+        missing or corrupt file does not stop the rest from loading.
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            shot_dicts : list
+                Shot dictionaries (or filepath strings), as for get_shot_data().
+            workers : int, optional
+                Number of parallel workers, 1 to load serially. Defaults to [loading] workers in the config.
+            backend : str, optional
+                'thread' or 'process'. Defaults to [loading] backend in the config. Threads suit
+                file reading; processes suit slow text parsing (e.g. scope .csv files).
+            cache : bool, optional
+                Use the in-memory shot cache (self.shot_cache). Cached data is read-only.
+
+        Returns
+        -------
+            results : list
+                ShotResult(index, shot_dict, data, error) for each shot, in the order of shot_dicts.
+        """
+        return list(self.stream_shots_data(diag_name, shot_dicts, workers=workers, backend=backend, ordered=True, cache=cache))
+
+    def stream_shots_data(self, diag_name, shot_dicts, workers=None, backend=None, ordered=False, cache=False):
+        """Generator version of get_shots_data(), yielding each ShotResult as soon as the shot has
+        loaded (or in the order of shot_dicts if ordered=True), so shots can be processed while
+        the rest are still loading. Only a few shots per worker are held in memory at once.
+
+        Yields
+        ------
+            result : ShotResult
+                (index, shot_dict, data, error), where index is the position in shot_dicts.
+        """
+        if backend is None:
+            backend = self.backend
+        if workers is None:
+            workers = self.workers
+        data_type = self.ex.diags[diag_name].config['data_type']
+        shot_dicts = list(shot_dicts)
+        if data_type == self.packed_file_type:
+            yield from self.stream_packed_shots_data(diag_name, shot_dicts, cache=cache)
+            return
+
+        # files are found (and looked up in the shot cache) here, and only loaded by the workers
+        cache_keys = {}
+        def find_files():
+            for index, shot_dict in enumerate(shot_dicts):
+                try:
+                    shot_filepath = self.get_filepath(diag_name, shot_dict)
+                except Exception as e:
+                    yield Done(None, e)
+                    continue
+                if cache:
+                    cache_key = self.shot_cache.make_key(shot_filepath, data_type)
+                    shot_data = self.shot_cache.get(cache_key)
+                    if shot_data is not None:
+                        yield Done(shot_data, None)
+                        continue
+                    cache_keys[index] = cache_key
+                yield (shot_filepath, data_type)
+
+        def jobs():
+            if self.staging_cache is None:
+                yield from find_files()
+                return
+            # once the first shot is requested, the rest are copied to the staging folder in the background
+            found = list(find_files())
+            self.staging_cache.prefetch([job[0] for job in found[1:] if not isinstance(job, Done)])
+            for job in found:
+                # process pool workers have no staging cache of their own, so files are staged here
+                if backend == 'process' and not isinstance(job, Done):
+                    job = job + (self.stage_file(job[0]),)
+                yield job
+
+        if backend == 'process':
+            load_func = _load_in_worker if self.staging_cache is None else _load_staged_in_worker
+            results = run_jobs(load_func, jobs(), workers=workers, backend=backend, ordered=ordered,
+                               initializer=_init_worker, initargs=(self,))
+        else:
+            results = run_jobs(self.load_staged, jobs(), workers=workers, backend=backend, ordered=ordered)
+
+        for index, data, error in results:
+            if error is not None:
+                logger.warning(f"Could not load {diag_name} shot {shot_dicts[index]}: {error}")
+            if index in cache_keys:
+                self.shot_cache.put(cache_keys.pop(index), data)
+            yield ShotResult(index, shot_dicts[index], data, error)
+
+
+    def iter_shots(self, diag_name, timeframe, exceptions=None, chunk_size=None, workers=None, backend=None, cache=False):
+        """Generator over the shots of a timeframe, loading them in parallel (see stream_shots_data())
+        but yielding them one at a time, in time order, so a timeframe of any length can be
+        processed at constant memory. Shots that fail to load are logged and skipped.
 
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            timeframe : dict or list
+                As for get_shot_dicts().
+            exceptions : list, optional
+                Timestamps to leave out.
+            chunk_size : int, optional
+                If set, yield lists of up to chunk_size shots at a time instead.
+            workers, backend, cache : optional
+                As for get_shots_data().
+
+        Yields
+        ------
+            shot_dict : dict
+                The shot dictionary (list of shot dictionaries if chunk_size is set).
+            shot_data : np.ndarray or dict
+                The shot data (list of shot data if chunk_size is set).
+        """
+        shot_dicts = self.get_shot_dicts(diag_name, timeframe, exceptions=exceptions)
+
+        chunk_shot_dicts, chunk_data = [], []
+        for result in self.stream_shots_data(diag_name, shot_dicts, workers=workers, backend=backend, ordered=True, cache=cache):
+            if result.error is not None:
+                continue
+            if not chunk_size:
+                yield result.shot_dict, result.data
+                continue
+            chunk_shot_dicts.append(result.shot_dict)
+            chunk_data.append(result.data)
+            if len(chunk_data) >= chunk_size:
+                yield chunk_shot_dicts, chunk_data
+                chunk_shot_dicts, chunk_data = [], []
+
+        if chunk_data:
+            yield chunk_shot_dicts, chunk_data
+
+
+    def watch_shot_dicts(self, diag_name, since=None, timeout=None, poll_interval=None, use_inotify=None):
+        """Generator following a diagnostic's data folder during a run, yielding the shot
+        dictionaries of newly arrived files only. The shot index is updated incrementally,
+        so the folder is not rescanned and old shots are not reloaded (see ShotWatcher).
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            since : str, optional
+                Timestamp (YYYYMMDD or YYYYMMDDHHMMSS) to start from: shots already taken since then
+                are yielded first. If None, only shots arriving after the call are.
+            timeout : float, optional
+                Stop after this many seconds without a new shot. Runs until interrupted if None.
+            poll_interval, use_inotify : optional
+                Defaults from the [watch] section of the config (1 s, True). inotify needs the
+                inotify_simple package, otherwise the folder is polled.
+
+        Yields
+        ------
+            shot_dicts : list
+                {'timestamp': [timestamp]} dictionaries of the new shots, sorted by timestamp.
+        """
+        diag_config = self.ex.diags[diag_name].config
+        data_path = Path(self.data_folder) / diag_config['data_folder'].lstrip("/\\")
+        if since is not None:
+            since = self.normalize_timestamp(str(since), 'DOWN')
+        if poll_interval is None:
+            poll_interval = self.watch_config.get('poll_interval', 1.0)
+        if use_inotify is None:
+            use_inotify = self.watch_config.get('inotify', True)
+
+        with ShotWatcher(self.get_shot_index(data_path), since=since, poll_interval=poll_interval,
+                         settle=self.watch_config.get('settle', 0.5), use_inotify=use_inotify) as watcher:
+            logger.info(f"Watching {data_path} for new {diag_name} shots ({watcher.backend})")
+            data_ext = diag_config.get('data_ext')
+            yielded = set()
+            while True:
+                filenames = watcher.poll(timeout=timeout)
+                if not filenames:
+                    logger.info(f"No new {diag_name} shots for {timeout} s, stopped watching")
+                    return
+                # skip temporary files, and shots already yielded (several files can share a timestamp)
+                keys = []
+                for filename in filenames:
+                    if data_ext and not filename.endswith(data_ext):
+                        continue
+                    key = TIMESTAMP_PATTERN.search(filename).group(0)[0:14]
+                    if key not in yielded:
+                        yielded.add(key)
+                        keys.append(key)
+                if keys:
+                    yield [{'timestamp': [key]} for key in keys]
+
+    def watch_shots(self, diag_name, since=None, timeout=None, chunk_size=None, poll_interval=None, use_inotify=None, workers=None, backend=None, cache=False):
+        """Generator loading each new shot of a diagnostic as it arrives, see watch_shot_dicts().
+        Shots that fail to load are logged and skipped.
+
+        Yields
+        ------
+            shot_dict : dict
+                The shot dictionary (list of the shot dictionaries that arrived together, if chunk_size is set).
+            shot_data : np.ndarray or dict
+                The shot data (list of shot data if chunk_size is set).
+        """
+        for shot_dicts in self.watch_shot_dicts(diag_name, since=since, timeout=timeout, poll_interval=poll_interval, use_inotify=use_inotify):
+            yield from self.iter_shots(diag_name, shot_dicts, chunk_size=chunk_size, workers=workers, backend=backend, cache=cache)
 
     def build_time_point(self, shot_dict):
         """Universal function to return a point in time for DAQ, for comparison, say in calibrations
@@ -326,6 +732,253 @@ class Fireball_DAQ(DAQ):
             raise ValueError("Error reading data, please provide timestamp")
             
     
+    def get_shot_index(self, data_path):
+        """Returns the ShotIndex for a data folder, creating it on first use. Indexes are
+        kept for the lifetime of the DAQ and saved to the cache folder (if set), and only
+        rescan the folder when its modification time changes.
+
+        Parameters
+        ----------
+            data_path : str or Path
+                The path to the data directory
+
+        Returns
+        -------
+            shot_index : ShotIndex
+                The index of timestamped files in the data directory.
+        """
+        data_path = Path(data_path)
+        if data_path not in self._shot_indexes:
+            self._shot_indexes[data_path] = ShotIndex(data_path, cache_folder=self.cache_folder)
+        return self._shot_indexes[data_path]
+
+    def get_scope_catalogue(self, diag_name, timeframe=None):
+        """Returns the header of every scope file of a diagnostic (timestamp, N, dt, channel names
+        and labels), read without loading any traces (see ScopeCatalogue). Headers are read in
+        parallel the first time, then only for new files, and kept in the cache folder (if set).
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the scope diagnostic.
+            timeframe : dict, optional
+                {'timeframe': [start_time, end_time]} or {'timestamp': [timestamp]} to restrict to. All files if None.
+
+        Returns
+        -------
+            catalogue : pd.DataFrame
+                One row per file: 'timestamp', 'filename', 'N', 'dt', 'channel_names' and 'label_names'.
+        """
+        diag_config = self.ex.diags[diag_name].config
+        if diag_config['data_type'] == self.packed_file_type:
+            return self.get_packed_scope_catalogue(diag_name, timeframe)
+        data_path = Path(self.data_folder) / diag_config['data_folder'].lstrip("/\\")
+        if data_path not in self._scope_catalogues:
+            self._scope_catalogues[data_path] = ScopeCatalogue(self.get_shot_index(data_path), extension=diag_config.get('data_ext'),
+                                                               cache_folder=self.cache_folder, workers=self.workers, backend=self.backend)
+        catalogue = self._scope_catalogues[data_path]
+
+        if timeframe is None:
+            return catalogue.select()
+        if 'timeframe' in timeframe:
+            start_time, end_time = timeframe['timeframe']
+            return catalogue.select(self.normalize_timestamp(str(start_time), 'DOWN'), self.normalize_timestamp(str(end_time), 'UP'))
+        if 'timestamp' in timeframe:
+            timestamp = timeframe['timestamp']
+            timestamp = str(timestamp[0] if isinstance(timestamp, list) else timestamp)
+            # ':' sorts directly after '9', so partial timestamps (e.g. YYYYMMDD) select every file they start
+            rows = catalogue.select(timestamp[0:14], timestamp[0:14] + ':')
+            return rows[rows['timestamp'].str.startswith(timestamp)].reset_index(drop=True)
+        raise ValueError(f"Error: timeframe {timeframe} is not a valid input for get_scope_catalogue() in Fireball DAQ. "
+                         f"Please provide a dictionary with keys 'timeframe' or 'timestamp'.")
+
+    def pack_shots(self, diag_name, filepath, timeframe=None, file_format=None, compression=None, chunk_shots=None, workers=None, backend=None):
+        """Packs the shots of a diagnostic (all of them, or a timeframe) into one chunked, compressed
+        HDF5 (.h5) or Zarr (.zarr) file with a timestamp index, see ShotPackWriter. Shots are loaded with
+        load_data() in parallel, as for get_shots_data(), and written in time order. Shots that fail to
+        load are logged and left out. To read from the pack, set the diagnostic's data_type to 'packed'
+        and its data_folder to the pack.
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            filepath : str or Path
+                The pack to write (.h5/.hdf5 or .zarr). Replaced if it exists.
+            timeframe : dict, optional
+                {'timeframe': [start_time, end_time]} to pack. All shots if None.
+            file_format : str, optional
+                'hdf5' or 'zarr'. Defaults to the format of the extension.
+            compression, chunk_shots : optional
+                See ShotPackWriter. Defaults to the [packing] section of the config.
+            workers, backend : optional
+                As for get_shots_data().
+
+        Returns
+        -------
+            filepath : Path
+                The pack written.
+        """
+        diag_config = self.ex.diags[diag_name].config
+        data_type = diag_config['data_type']
+        if data_type == self.packed_file_type:
+            raise ValueError(f"Error: {diag_name} is already packed into {self.get_pack_path(diag_name)}.")
+        if compression is None:
+            compression = self.packing_config.get('compression', 'gzip')
+        if chunk_shots is None:
+            chunk_shots = self.packing_config.get('chunk_shots', 1)
+
+        data_path = Path(self.data_folder) / diag_config['data_folder'].lstrip("/\\")
+        shot_index = self.get_shot_index(data_path)
+        if timeframe is not None:
+            start_time, end_time = timeframe['timeframe']
+            _, filenames = shot_index.select(self.normalize_timestamp(str(start_time), 'DOWN'), self.normalize_timestamp(str(end_time), 'UP'))
+        else:
+            shot_index.refresh()
+            filenames = shot_index.filenames
+        data_ext = diag_config.get('data_ext')
+        filenames = [filename for filename in filenames.tolist() if not data_ext or filename.endswith(data_ext)]
+
+        # a pack being replaced must not be held open
+        filepath = Path(filepath)
+        for pack_path in [pack_path for pack_path in self._packs if pack_path.resolve() == filepath.resolve()]:
+            self._packs.pop(pack_path).close()
+
+        n_packed = 0
+        with ShotPackWriter(filepath, data_type, file_format=file_format, compression=compression, chunk_shots=chunk_shots) as writer:
+            shot_dicts = [{'filename': filename} for filename in filenames]
+            for result in self.stream_shots_data(diag_name, shot_dicts, workers=workers, backend=backend, ordered=True):
+                if result.error is not None:
+                    continue # logged by stream_shots_data()
+                writer.append(filenames[result.index], result.data)
+                n_packed += 1
+        logger.info(f"Packed {n_packed} of {len(filenames)} {diag_name} shots into {filepath}")
+        return filepath
+
+    def get_pack_path(self, diag_name):
+        """Path of the pack of a packed diagnostic: its data_folder, relative to the data folder"""
+        diag_config = self.ex.diags[diag_name].config
+        return Path(self.data_folder) / diag_config['data_folder'].strip("/\\")
+
+    def get_pack(self, diag_name):
+        """Returns the ShotPack of a packed diagnostic (data_type 'packed'). Packs are opened once,
+        and again only if the pack is rewritten.
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+
+        Returns
+        -------
+            pack : ShotPack
+                The open pack, with its timestamp index.
+        """
+        filepath = self.get_pack_path(diag_name)
+        try:
+            mtime_ns = os.stat(filepath).st_mtime_ns
+        except OSError:
+            raise ValueError(f"Error: no pack {filepath} for {diag_name} in Fireball DAQ. Write one with pack_shots().")
+        pack = self._packs.get(filepath)
+        if pack is None or pack.mtime_ns != mtime_ns:
+            if pack is not None:
+                pack.close()
+            pack = ShotPack(filepath, file_format=self.ex.diags[diag_name].config.get('pack_format'))
+            self._packs[filepath] = pack
+        return pack
+
+    def get_packed_shot_data(self, diag_name, shot_dict, cache=False):
+        """get_shot_data() for a packed diagnostic: one shot ('filename' or 'timestamp'), or the
+        shots of a 'timeframe' as a list, which are consecutive in the pack and read together."""
+        pack = self.get_pack(diag_name)
+        if isinstance(shot_dict, dict) and 'timeframe' in shot_dict:
+            start_time, end_time = shot_dict['timeframe']
+            selected = pack.select(self.normalize_timestamp(str(start_time), 'DOWN'), self.normalize_timestamp(str(end_time), 'UP'))
+            return pack.read_range(selected.start, selected.stop)
+
+        index = pack.index_of(shot_dict)
+        if not cache:
+            return pack.read(index)
+        cache_key = self.packed_cache_key(pack, index)
+        shot_data = self.shot_cache.get(cache_key)
+        if shot_data is None:
+            shot_data = pack.read(index)
+            self.shot_cache.put(cache_key, shot_data)
+        return shot_data
+
+    def stream_packed_shots_data(self, diag_name, shot_dicts, cache=False):
+        """stream_shots_data() for a packed diagnostic. Shots are found in the pack's index, and runs
+        of shot_dicts that are consecutive in the pack (e.g. a timeframe) are read together, up to
+        [packing] read_shots at a time. Results are in the order of shot_dicts."""
+        pack = self.get_pack(diag_name)
+        max_run = self.packing_config.get('read_shots', 16)
+        indices, errors = [], {}
+        for i, shot_dict in enumerate(shot_dicts):
+            try:
+                indices.append(pack.index_of(shot_dict))
+            except (ValueError, TypeError) as e:
+                indices.append(None)
+                errors[i] = e
+
+        i = 0
+        while i < len(shot_dicts):
+            if i in errors:
+                logger.warning(f"Could not load {diag_name} shot {shot_dicts[i]}: {errors[i]}")
+                yield ShotResult(i, shot_dicts[i], None, errors[i])
+                i += 1
+                continue
+            if cache:
+                shot_data = self.shot_cache.get(self.packed_cache_key(pack, indices[i]))
+                if shot_data is not None:
+                    yield ShotResult(i, shot_dicts[i], shot_data, None)
+                    i += 1
+                    continue
+
+            j = i + 1
+            while j < len(shot_dicts) and j - i < max_run and indices[j] is not None and indices[j] == indices[j-1] + 1:
+                j += 1
+            try:
+                run_data, error = pack.read_range(indices[i], indices[j-1] + 1), None
+            except Exception as e:
+                run_data, error = [None] * (j - i), e
+                logger.warning(f"Could not load {diag_name} shots {shot_dicts[i:j]}: {e}")
+            for k, shot_data in zip(range(i, j), run_data):
+                if cache and error is None:
+                    self.shot_cache.put(self.packed_cache_key(pack, indices[k]), shot_data)
+                yield ShotResult(k, shot_dicts[k], shot_data, error)
+            i = j
+
+    @staticmethod
+    def packed_cache_key(pack, index):
+        """Shot cache key of a shot in a pack, which changes if the pack is rewritten"""
+        return (str(pack.filepath.resolve()), pack.filenames[index], Fireball_DAQ.packed_file_type, pack.mtime_ns)
+
+    def get_packed_scope_catalogue(self, diag_name, timeframe=None):
+        """get_scope_catalogue() for a packed scope diagnostic, from the metadata in the pack's index"""
+        pack = self.get_pack(diag_name)
+        if timeframe is None:
+            selected = slice(0, len(pack))
+        elif 'timeframe' in timeframe:
+            start_time, end_time = timeframe['timeframe']
+            selected = pack.select(self.normalize_timestamp(str(start_time), 'DOWN'), self.normalize_timestamp(str(end_time), 'UP'))
+        elif 'timestamp' in timeframe:
+            timestamp = timeframe['timestamp']
+            found = pack.find(timestamp[0] if isinstance(timestamp, list) else timestamp)
+            selected = slice(int(found[0]), int(found[-1]) + 1) if len(found) else slice(0, 0)
+        else:
+            raise ValueError(f"Error: timeframe {timeframe} is not a valid input for get_scope_catalogue() in Fireball DAQ. "
+                             f"Please provide a dictionary with keys 'timeframe' or 'timestamp'.")
+
+        meta = pack.meta(selected.start, selected.stop)
+        return pd.DataFrame({
+            'timestamp': pack.stamps[selected],
+            'filename': pack.filenames[selected],
+            'N': np.array([m.get('N') for m in meta], dtype=np.int64),
+            'dt': np.array([m.get('dt') for m in meta], dtype=float),
+            'channel_names': [tuple(m.get('channel_names', ())) for m in meta],
+            'label_names': [tuple(m.get('label_names', ())) for m in meta]
+        })
+
     def timestamp_to_filename(self, timestamp, data_path, extension=None):
         """Convert a timestamp to a corresponding filename in the data directory.
     
@@ -343,29 +996,8 @@ class Fireball_DAQ(DAQ):
             file_path : str
                 The full path to the file with the specified timestamp.
         """
-        file_paths = []
-    
-        for file in os.listdir(data_path):
-    
-            # Ignore hidden/system files
-            if file.startswith('.'):
-                continue
-    
-            full_path = os.path.join(data_path, file)
-    
-            # Ignore directories
-            if not os.path.isfile(full_path):
-                continue
-    
-            # Timestamp filter: substring match like old version
-            if timestamp not in file:
-                continue
-    
-            # Extension filter
-            if extension is not None and not file.endswith(extension):
-                continue
-    
-            file_paths.append(full_path)
+        file_paths = [os.path.join(data_path, file) for file in
+                      self.get_shot_index(data_path).find(timestamp, extension=extension)]
     
         if len(file_paths) == 0:
             raise ValueError(
@@ -428,21 +1060,8 @@ class Fireball_DAQ(DAQ):
 
         logger.debug(f"Looking for files with timestamps between {start_time} and {end_time} in {diag_data_path}")
         
-        timestamp_pattern = re.compile(r"\d{14}")
-
-        for file in diag_data_path.iterdir():
-            if not file.is_file():
-                continue
-
-            match = timestamp_pattern.search(file.name)
-            if not match:
-                continue
-
-            file_timestamp = match.group(0)
-
-            if start_time <= file_timestamp <= end_time:
-                file_names.append(file.name)
-
+        _, file_names = self.get_shot_index(diag_data_path).select(start_time, end_time)
+        file_names = file_names.tolist()
         file_names.sort()
         
 
@@ -469,22 +1088,12 @@ class Fireball_DAQ(DAQ):
         start_time, end_time = timeframe_dict["timeframe"]
         data_path = Path(data_path)
 
-        timestamp_pattern = re.compile(r"\d{14}")
-
-        shot_dict = []
-
-        for file in data_path.iterdir():
-            if not file.is_file():
-                continue
-
-            match = timestamp_pattern.search(file.name)
-            if not match:
-                continue
-
-            file_timestamp = match.group(0)
-
-            if start_time <= file_timestamp <= end_time:
-                shot_dict.append({"timestamp":[file_timestamp]})
+        if diag_config['data_type'] == self.packed_file_type:
+            pack = self.get_pack(diag_name)
+            keys = pack.keys[pack.select(start_time, end_time)]
+        else:
+            keys, _ = self.get_shot_index(data_path).select(start_time, end_time)
+        shot_dict = [{"timestamp":[file_timestamp]} for file_timestamp in keys.tolist()]
 
         if not shot_dict:
             print(
@@ -494,6 +1103,128 @@ class Fireball_DAQ(DAQ):
 
         return shot_dict
 
+    def get_shot_table(self, diag_names=None, timeframe=None, tolerance=None):
+        """Matches the shots of several diagnostics by time, from their shot indexes (no loading or
+        directory searches per shot). Each folder has its own timestamps, differing by milliseconds
+        or truncated to the second, so files are grouped to the nearest within tolerance (see build_shot_table()).
+
+        Parameters
+        ----------
+            diag_names : list, optional
+                The diagnostics to match. Defaults to all configured diagnostics with a data folder.
+            timeframe : dict, optional
+                {'timeframe': [start_time, end_time]} to restrict to. All shots if None.
+            tolerance : float, optional
+                Largest time difference in seconds between files of the same shot.
+                Defaults to [alignment] tolerance in the config.
+
+        Returns
+        -------
+            shot_table : pd.DataFrame
+                One row per shot, with its 'time' and each diagnostic's timestamp for it (None if missing).
+        """
+        if tolerance is None:
+            tolerance = self.alignment_tolerance
+        check_folders = diag_names is None
+        if diag_names is None:
+            diag_names = list(self.ex.diags)
+
+        if timeframe is not None:
+            start_time, end_time = timeframe['timeframe']
+            start_time = self.normalize_timestamp(str(start_time), 'DOWN')
+            end_time = self.normalize_timestamp(str(end_time), 'UP')
+
+        stamps = {}
+        for diag_name in diag_names:
+            diag_config = self.ex.diags[diag_name].config
+            data_path = Path(self.data_folder) / diag_config['data_folder'].lstrip("/\\")
+            if diag_config.get('data_type') == self.packed_file_type:
+                if check_folders and not self.get_pack_path(diag_name).exists():
+                    logger.warning(f"get_shot_table: no pack {self.get_pack_path(diag_name)} for {diag_name}, leaving it out")
+                    continue
+                pack = self.get_pack(diag_name)
+                selected = pack.select(start_time, end_time) if timeframe is not None else slice(None)
+                stamps[diag_name] = sorted(set(pack.stamps[selected].tolist()))
+                continue
+            if check_folders and not data_path.is_dir():
+                logger.warning(f"get_shot_table: no data folder {data_path} for {diag_name}, leaving it out")
+                continue
+            shot_index = self.get_shot_index(data_path)
+            if timeframe is not None:
+                _, filenames = shot_index.select(start_time, end_time)
+            else:
+                shot_index.refresh()
+                filenames = shot_index.filenames
+            data_ext = diag_config.get('data_ext')
+            diag_stamps = [TIMESTAMP_PATTERN.search(filename).group(0) for filename in filenames.tolist()
+                           if not data_ext or filename.endswith(data_ext)]
+            stamps[diag_name] = sorted(set(diag_stamps))
+
+        return build_shot_table(stamps, tolerance=tolerance)
+
+    def get_aligned_shot_dicts(self, diag_names, timeframe=None, tolerance=None, complete=True):
+        """Shot dictionaries for several diagnostics, aligned so the nth shot dictionary of each
+        diagnostic is the same shot (see get_shot_table()).
+
+        Parameters
+        ----------
+            diag_names : list
+                The diagnostics to match.
+            timeframe, tolerance : optional
+                As for get_shot_table().
+            complete : bool
+                Keep only the shots every diagnostic has a file for. Otherwise missing files are None.
+
+        Returns
+        -------
+            shot_dicts : dict
+                {diag_name: [{'timestamp': [timestamp]}, ...]}, with lists of the same length.
+        """
+        shot_table = self.get_shot_table(diag_names, timeframe=timeframe, tolerance=tolerance)
+        if complete:
+            shot_table = shot_table.dropna(subset=diag_names)
+        return {diag_name: [None if pd.isna(stamp) else {'timestamp': [stamp]} for stamp in shot_table[diag_name]]
+                for diag_name in diag_names}
+
+    def get_shot_dicts(self, diag_name, timeframe, exceptions=None):
+        """Returns a list of shot dictionaries for a timeframe, as used by the LAMP diagnostic
+        functions that loop over shots.
+
+        Parameters
+        ----------
+            diag_name : str
+                The name of the diagnostic.
+            timeframe : dict or list
+                {'timeframe': [start_time, end_time]}, {'timestamp': [...]} or a list of shot dictionaries.
+            exceptions : list, optional
+                Timestamps to leave out.
+
+        Returns
+        -------
+            shot_dicts : list
+                A list of {'timestamp': [timestamp]} dictionaries, sorted by timestamp.
+        """
+        if isinstance(timeframe, list):
+            shot_dicts = timeframe
+        elif isinstance(timeframe, dict) and 'timeframe' in timeframe:
+            shot_dicts = self.timeframe_to_shotdict(diag_name, timeframe)
+        elif isinstance(timeframe, dict) and 'timestamp' in timeframe:
+            timestamps = timeframe['timestamp']
+            if isinstance(timestamps, str):
+                timestamps = [timestamps]
+            shot_dicts = [{'timestamp': [timestamp]} for timestamp in timestamps]
+        else:
+            raise ValueError(f"Error: timeframe {timeframe} is not a valid input for get_shot_dicts() in Fireball DAQ. "
+                             f"Please provide a dictionary with keys 'timeframe' or 'timestamp', or a list of shot dictionaries.")
+
+        if exceptions:
+            exceptions = [str(exception) for exception in exceptions]
+            shot_dicts = [shot_dict for shot_dict in shot_dicts
+                          if not (isinstance(shot_dict, dict) and 'timestamp' in shot_dict
+                                  and str(shot_dict['timestamp'][0]) in exceptions)]
+
+        return shot_dicts
+
     def normalize_timestamp(self, timestamp, direction):
         """Converts timestamps of the form YYYYMMDD to YYYYMMDD000000 or YYYYMMDD235959,
         depending on direction, for timeframe searching. If timestamp is already in the
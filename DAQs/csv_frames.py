@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+# pyarrow's multi-threaded parser is used if installed, otherwise pandas' C parser
+try:
+    import pyarrow
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+
+def read_csv_frame(filepath, engine=None):
+    """Loads a DigiCam .csv frame in a single pass. The first row holds the x coordinates
+    and the first column the y coordinates of the pixels, the rest is the image.
+
+    Parameters
+    ----------
+        filepath : str or Path
+            The path to the raw .csv file where the DigiCam image is stored.
+        engine : str, optional
+            pandas.read_csv engine to use ('pyarrow' or 'c'). Defaults to CSV_ENGINE.
+
+    Returns
+    -------
+        frame : dict
+            {
+                "IMG": np.ndarray,  # image, with coordinate row and column removed
+                "X": np.ndarray,    # top row, x coordinates in mm
+                "Y": np.ndarray     # first column, y coordinates in mm
+            }
+    """
+    if engine is None:
+        engine = CSV_ENGINE
+
+    data = pd.read_csv(filepath, header=None, delimiter=',', dtype=np.float64, engine=engine).to_numpy()
+
+    return {"IMG": data[1:, 1:], "X": data[0, 1:], "Y": data[1:, 0]}
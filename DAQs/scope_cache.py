@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ScopeCache():
+    """On-disk cache of parsed scope shots, so each scope .csv only has to be parsed once.
+
+    Each shot is stored as a raw .npy array (time in the first column, then the
+    channels, as in the .csv) plus a .json sidecar holding the channel names, labels,
+    N and dt. Entries are keyed on the resolved source path and are only used if the
+    size and modification time of the source file still match. Cached arrays are
+    memory-mapped on load, so reading them back costs little more than opening the file.
+    """
+
+    __version__ = 0.1
+
+    def __init__(self, cache_folder):
+        """
+        Parameters
+        ----------
+            cache_folder : str or Path
+                Folder to store the cached shots in.
+        """
+        self.cache_folder = Path(cache_folder)
+        return
+
+    def _entry_paths(self, filepath):
+        path_hash = hashlib.sha1(str(Path(filepath).resolve()).encode()).hexdigest()
+        return self.cache_folder / f"{path_hash}.npy", self.cache_folder / f"{path_hash}.json"
+
+    def _source_key(self, filepath):
+        stat = os.stat(filepath)
+        return {"source": str(Path(filepath).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def get(self, filepath):
+        """Return the cached scope dictionary for a .csv, or None if it is missing or stale.
+
+        Parameters
+        ----------
+            filepath : str or Path
+                The path to the scope .csv file.
+
+        Returns
+        -------
+            data : dict or None
+                Same layout as Fireball_DAQ.load_scope(), with memory-mapped arrays.
+        """
+        data_path, meta_path = self._entry_paths(filepath)
+        if not meta_path.is_file() or not data_path.is_file():
+            return None
+
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if any(meta.get(k) != v for k, v in self._source_key(filepath).items()):
+                logger.debug(f"Scope cache entry for {filepath} is stale.")
+                return None
+            data = np.load(data_path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            logger.warning(f"ScopeCache: could not read cache entry for {filepath}: {e}")
+            return None
+
+        logger.debug(f"Loaded scope data for {filepath} from cache.")
+        return {
+            "time": data[:, 0],
+            "channels": data[:, 1:],
+            "channel_names": meta["channel_names"],
+            "label_names": meta["label_names"],
+            "N": meta["N"],
+            "dt": meta["dt"]
+        }
+
+    def put(self, filepath, scope_data):
+        """Write a parsed scope dictionary (from Fireball_DAQ.load_scope()) to the cache.
+
+        Parameters
+        ----------
+            filepath : str or Path
+                The path to the scope .csv file the data was parsed from.
+            scope_data : dict
+                The parsed scope data.
+        """
+        data_path, meta_path = self._entry_paths(filepath)
+        meta = self._source_key(filepath)
+        meta.update({
+            "channel_names": list(scope_data["channel_names"]),
+            "label_names": list(scope_data["label_names"]),
+            "N": int(scope_data["N"]),
+            "dt": float(scope_data["dt"])
+        })
+        data = np.column_stack((scope_data["time"], scope_data["channels"]))
+
+        try:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            # write the array before the sidecar, so an entry is never valid before its data exists
+            tmp_data_path = data_path.with_suffix('.tmp.npy')
+            np.save(tmp_data_path, data)
+            os.replace(tmp_data_path, data_path)
+            tmp_meta_path = meta_path.with_suffix('.tmp.json')
+            with open(tmp_meta_path, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_meta_path, meta_path)
+        except OSError as e:
+            logger.warning(f"ScopeCache: could not write cache entry for {filepath}: {e}")
+        return
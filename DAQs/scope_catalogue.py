@@ -0,0 +1,232 @@
+import os
+import hashlib
+import logging
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .shot_loader import run_jobs
+
+logger = logging.getLogger(__name__)
+
+
+def read_scope_header(filepath):
+    """Reads the header of a scope .csv file (see Fireball_DAQ.load_scope()), stopping at
+    the TIME line, so the record length, sample interval and channels of a shot are known
+    without parsing its traces.
+
+    Parameters
+    ----------
+        filepath : str or Path
+            The path to the scope .csv file.
+
+    Returns
+    -------
+        dict
+            {
+                "N": int,                   # number of samples
+                "dt": float,                # time step
+                "channel_names": list of str,
+                "label_names": list of str
+            }
+    """
+    N, dt, label_names, channel_names = None, None, None, None
+    with open(filepath, 'r') as f:
+        for line in f:
+            parts = line.strip().split(',')
+            if parts[0].lower() == "sample interval":
+                dt = float(parts[1])
+            elif parts[0].lower() == "record length":
+                N = int(parts[1])
+            if label_names is None and "Labels" in line:
+                label_names = parts[1:]
+            if "TIME" in line:
+                channel_names = parts[1:]
+                break
+
+    if N is None or dt is None:
+        raise ValueError(f"Could not find Sample Interval or Record Length in header of {filepath}.")
+    if label_names is None:
+        raise ValueError(f"Could not find Labels in scope CSV {filepath}.")
+    if channel_names is None:
+        raise ValueError(f"Could not find Time header in scope CSV {filepath}.")
+
+    return {"N": N, "dt": dt, "channel_names": channel_names, "label_names": label_names}
+
+
+class ScopeCatalogue():
+    """Table of the header of every scope file in a data folder: timestamp, record length N,
+    sample interval dt, channel names and labels. Built from the folder's ShotIndex by reading
+    only the file headers (read_scope_header()), in parallel, and updated with just the new
+    files as the folder grows. A query for a timeframe reads only the headers missing from that
+    timeframe, so looking up one shot does not read the whole folder. Saved to a local cache
+    folder alongside the shot index.
+    """
+
+    __version__ = 0.1
+
+    def __init__(self, shot_index, extension='.csv', cache_folder=None, workers=1, backend='thread'):
+        """
+        Parameters
+        ----------
+            shot_index : ShotIndex
+                The index of the scope data folder.
+            extension : str
+                Extension of the scope files in the folder.
+            cache_folder : str or Path, optional
+                Folder to persist the catalogue in. If None, it is kept in memory only.
+            workers : int
+                Number of parallel workers reading headers.
+            backend : str
+                'thread' or 'process', see shot_loader.run_jobs().
+        """
+        self.shot_index = shot_index
+        self.extension = extension
+        self.cache_folder = Path(cache_folder) if cache_folder is not None else None
+        self.workers = workers
+        self.backend = backend
+        self.stamps = np.array([], dtype=str)
+        self.filenames = np.array([], dtype=str)
+        self.N = np.array([], dtype=np.int64)
+        self.dt = np.array([], dtype=float)
+        self.channel_names = np.array([], dtype=str)    # comma separated, per file
+        self.label_names = np.array([], dtype=str)
+        self.keys = np.array([], dtype=str)             # YYYYMMDDHHMMSS part of stamps
+        self.index_mtime = None                         # shot index folder mtime the catalogue is up to date with
+        self._unreadable = set()                        # files whose header could not be read (warned about once)
+        self._load()
+        return
+
+    @property
+    def cache_filepath(self):
+        if self.cache_folder is None:
+            return None
+        path_hash = hashlib.sha1(str(self.shot_index.data_path.resolve()).encode()).hexdigest()[:16]
+        return self.cache_folder / f"scope_catalogue_{path_hash}.npz"
+
+    def refresh(self, start_time=None, end_time=None):
+        """Read the headers of files added to the folder since the last refresh (and forget removed ones).
+        If start_time or end_time is given, only files with start_time <= YYYYMMDDHHMMSS <= end_time
+        are read (or forgotten); the rest of the catalogue is left as it is.
+
+        Returns
+        -------
+            changed : bool
+                True if the catalogue changed.
+        """
+        self.shot_index.refresh()
+        index_state = self.shot_index.state
+        if self.index_mtime is not None and self.index_mtime == index_state.dir_mtime:
+            return False
+        full = start_time is None and end_time is None
+        index_lo, index_hi = self._range(index_state.keys, start_time, end_time)
+        stamps, filenames = index_state.stamps[index_lo:index_hi], index_state.filenames[index_lo:index_hi]
+        if self.extension:
+            keep = np.char.endswith(filenames, self.extension)
+            stamps, filenames = stamps[keep], filenames[keep]
+
+        # rows outside the timeframe are kept without checking them against the folder
+        lo, hi = self._range(self.keys, start_time, end_time)
+        known = np.ones(len(self.filenames), dtype=bool)
+        known[lo:hi] = np.isin(self.filenames[lo:hi], filenames)
+        new = ~np.isin(filenames, self.filenames[lo:hi])
+        if np.all(known) and not np.any(new):
+            if full:
+                self.index_mtime = index_state.dir_mtime
+            return False
+
+        new_stamps, new_filenames = stamps[new], filenames[new]
+        jobs = [(os.path.join(self.shot_index.data_path, filename),) for filename in new_filenames.tolist()]
+        headers = [None] * len(jobs)
+        for index, header, error in run_jobs(read_scope_header, jobs, workers=min(self.workers, max(len(jobs), 1)), backend=self.backend):
+            if error is not None:
+                # left out, and tried again on the next refresh (e.g. a file still being written)
+                log = logger.debug if new_filenames[index] in self._unreadable else logger.warning
+                log(f"ScopeCatalogue: could not read header of {new_filenames[index]}: {error}")
+                self._unreadable.add(str(new_filenames[index]))
+            headers[index] = header
+        read = np.array([header is not None for header in headers], dtype=bool)
+        headers = [header for header in headers if header is not None]
+
+        stamps = np.concatenate([self.stamps[known], new_stamps[read]])
+        filenames = np.concatenate([self.filenames[known], new_filenames[read]])
+        N = np.concatenate([self.N[known], np.array([h['N'] for h in headers], dtype=np.int64)])
+        dt = np.concatenate([self.dt[known], np.array([h['dt'] for h in headers], dtype=float)])
+        channel_names = np.concatenate([self.channel_names[known], np.array([','.join(h['channel_names']) for h in headers], dtype=str)])
+        label_names = np.concatenate([self.label_names[known], np.array([','.join(h['label_names']) for h in headers], dtype=str)])
+
+        # same order as the shot index: timestamp, then filename
+        order = np.lexsort((filenames, stamps))
+        self.stamps, self.filenames = stamps[order], filenames[order]
+        self.N, self.dt = N[order], dt[order]
+        self.channel_names, self.label_names = channel_names[order], label_names[order]
+        self.keys = np.array([s[0:14] for s in self.stamps], dtype=str)
+        # headers that could not be read, or outside the timeframe, are read on a later refresh
+        self.index_mtime = index_state.dir_mtime if full and np.all(read) else None
+        self._save()
+        return True
+
+    def select(self, start_time=None, end_time=None):
+        """Catalogue rows with start_time <= YYYYMMDDHHMMSS <= end_time (all rows if not given).
+
+        Returns
+        -------
+            catalogue : pd.DataFrame
+                One row per file: 'timestamp', 'filename', 'N', 'dt', 'channel_names' and 'label_names'
+                (tuples of str), sorted by timestamp.
+        """
+        self.refresh(start_time, end_time)
+        lo, hi = self._range(self.keys, start_time, end_time)
+        return pd.DataFrame({
+            'timestamp': self.stamps[lo:hi],
+            'filename': self.filenames[lo:hi],
+            'N': self.N[lo:hi],
+            'dt': self.dt[lo:hi],
+            'channel_names': [tuple(names.split(',')) for names in self.channel_names[lo:hi].tolist()],
+            'label_names': [tuple(names.split(',')) for names in self.label_names[lo:hi].tolist()]
+        })
+
+    @staticmethod
+    def _range(keys, start_time=None, end_time=None):
+        """Positions lo:hi of the sorted keys with start_time <= key <= end_time"""
+        lo = 0 if start_time is None else int(np.searchsorted(keys, str(start_time), side='left'))
+        hi = len(keys) if end_time is None else int(np.searchsorted(keys, str(end_time), side='right'))
+        return lo, hi
+
+    def _load(self):
+        cache_filepath = self.cache_filepath
+        if cache_filepath is None or not cache_filepath.is_file():
+            return False
+        try:
+            with np.load(cache_filepath) as cached:
+                if str(cached['data_path']) != str(self.shot_index.data_path.resolve()):
+                    return False
+                self.stamps = cached['stamps']
+                self.filenames = cached['filenames']
+                self.N = cached['N']
+                self.dt = cached['dt']
+                self.channel_names = cached['channel_names']
+                self.label_names = cached['label_names']
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"ScopeCatalogue: could not read cached catalogue {cache_filepath}: {e}")
+            return False
+        self.keys = np.array([s[0:14] for s in self.stamps], dtype=str)
+        return True
+
+    def _save(self):
+        cache_filepath = self.cache_filepath
+        if cache_filepath is None:
+            return
+        try:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            # write to a temporary file first so a half-written catalogue is never read
+            tmp_filepath = cache_filepath.with_suffix('.tmp.npz')
+            np.savez(tmp_filepath, data_path=str(self.shot_index.data_path.resolve()), stamps=self.stamps,
+                     filenames=self.filenames, N=self.N, dt=self.dt, channel_names=self.channel_names,
+                     label_names=self.label_names)
+            os.replace(tmp_filepath, cache_filepath)
+        except OSError as e:
+            logger.warning(f"ScopeCatalogue: could not save catalogue to {cache_filepath}: {e}")
+        return
+
+    def __len__(self):
+        return len(self.stamps)
@@ -0,0 +1,120 @@
+import os
+import sys
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ShotCache():
+    """In-memory LRU cache of loaded shot data, limited by size in bytes.
+
+    Entries are keyed per data file (resolved path, data type, size and modification
+    time, see ShotCache.make_key()), so overlapping timeframes share loaded shots and
+    a file that changes on disk is loaded again. Cached arrays are made read-only, as
+    the same data is handed to every caller; copy it before changing it in place.
+    Safe to share between threads (e.g. diagnostics processed in parallel).
+    """
+
+    __version__ = 0.1
+
+    def __init__(self, max_bytes=512e6):
+        """
+        Parameters
+        ----------
+            max_bytes : float
+                Maximum total size of the cached data. 0 switches the cache off.
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key: (data, nbytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        return
+
+    @staticmethod
+    def make_key(filepath, data_type):
+        """Cache key for a data file, which changes if the file is modified"""
+        stat = os.stat(filepath)
+        return (str(Path(filepath).resolve()), data_type, stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def data_nbytes(data):
+        """Approximate memory size of loaded shot data (arrays, or dicts/lists of them)"""
+        if isinstance(data, np.ndarray):
+            return data.nbytes
+        if isinstance(data, dict):
+            return sum(ShotCache.data_nbytes(value) for value in data.values())
+        if isinstance(data, (list, tuple)):
+            return sum(ShotCache.data_nbytes(value) for value in data)
+        return sys.getsizeof(data)
+
+    @staticmethod
+    def freeze(data):
+        """Make the arrays in loaded shot data read-only"""
+        if isinstance(data, np.ndarray):
+            data.setflags(write=False)
+        elif isinstance(data, dict):
+            for value in data.values():
+                ShotCache.freeze(value)
+        elif isinstance(data, (list, tuple)):
+            for value in data:
+                ShotCache.freeze(value)
+        return data
+
+    def get(self, key):
+        """Return the cached data for key, or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        """Add loaded data to the cache, evicting the least recently used entries to stay within max_bytes"""
+        if data is None:
+            return
+        nbytes = self.data_nbytes(data)
+        if nbytes > self.max_bytes:
+            logger.debug(f"ShotCache: not caching {key[0]}, {nbytes} bytes is larger than the cache")
+            return
+
+        data = self.freeze(data)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (data, nbytes)
+            self.nbytes += nbytes
+
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+                self.evictions += 1
+        return
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+        return
+
+    def stats(self):
+        """Dictionary of cache statistics"""
+        return {
+            "entries": len(self._entries),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,276 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import namedtuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# First run of at least 14 digits in a filename, e.g. scope1__ALL_20250602182440870.csv
+TIMESTAMP_PATTERN = re.compile(r"\d{14}\d*")
+
+# One consistent version of the index: stamps (full digit runs, sorted), keys (YYYYMMDDHHMMSS part
+# of stamps), filenames (matching stamps) and others (files without a timestamp), as of dir_mtime
+IndexState = namedtuple('IndexState', ['dir_mtime', 'stamps', 'keys', 'filenames', 'others'])
+
+
+class ShotIndex():
+    """Sorted index of the timestamped files in one diagnostic data folder.
+
+    The folder is scanned once and the timestamps (the first run of >= 14 digits in
+    each filename) are kept as a sorted array alongside the filenames, so timestamp
+    and timeframe lookups are binary searches rather than directory walks. The index
+    is rebuilt only when the modification time of the folder changes, and can be
+    saved to a local cache folder so that new sessions do not need to rescan EOS.
+
+    The arrays are replaced together as one IndexState (see state), never modified in place,
+    so lookups running alongside a rebuild or add() always see a matching set of arrays.
+    """
+
+    __version__ = 0.1
+
+    def __init__(self, data_path, cache_folder=None):
+        """
+        Parameters
+        ----------
+            data_path : str or Path
+                The diagnostic data folder to index.
+            cache_folder : str or Path, optional
+                Folder to persist the index in. If None, the index is kept in memory only.
+        """
+        self.data_path = Path(data_path)
+        self.cache_folder = Path(cache_folder) if cache_folder is not None else None
+        empty = np.array([], dtype=str)
+        self.state = IndexState(None, empty, empty, empty, empty)
+        self._lock = threading.Lock()   # serialises updates; lookups read state without it
+        self.refresh()
+        return
+
+    @property
+    def dir_mtime(self):
+        return self.state.dir_mtime
+
+    @property
+    def stamps(self):
+        return self.state.stamps
+
+    @property
+    def keys(self):
+        return self.state.keys
+
+    @property
+    def filenames(self):
+        return self.state.filenames
+
+    @property
+    def others(self):
+        return self.state.others
+
+    @property
+    def cache_filepath(self):
+        if self.cache_folder is None:
+            return None
+        path_hash = hashlib.sha1(str(self.data_path.resolve()).encode()).hexdigest()[:16]
+        return self.cache_folder / f"shot_index_{path_hash}.npz"
+
+    def refresh(self, force=False):
+        """Rebuild the index if the data folder has changed since it was last built.
+
+        Parameters
+        ----------
+            force : bool
+                Rescan the folder even if its modification time is unchanged.
+
+        Returns
+        -------
+            changed : bool
+                True if the index was rebuilt or reloaded.
+        """
+        try:
+            dir_mtime = os.stat(self.data_path).st_mtime_ns
+        except FileNotFoundError:
+            raise ValueError(f"ShotIndex: data folder {self.data_path} does not exist")
+
+        if not force and dir_mtime == self.dir_mtime:
+            return False
+
+        with self._lock:
+            # another thread may have updated the index while this one waited
+            if not force and dir_mtime == self.dir_mtime:
+                return False
+            if not force and self._load(dir_mtime):
+                return True
+            self.state = self._build(dir_mtime)
+            self._save()
+        return True
+
+    def _build(self, dir_mtime):
+        logger.debug(f"Building shot index for {self.data_path}")
+        stamps, filenames, others = [], [], []
+        with os.scandir(self.data_path) as entries:
+            for entry in entries:
+                # Ignore hidden/system files and directories
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                match = TIMESTAMP_PATTERN.search(entry.name)
+                if match:
+                    stamps.append(match.group(0))
+                    filenames.append(entry.name)
+                else:
+                    others.append(entry.name)
+
+        # sort by timestamp, then filename (keeps old 'latest filename wins' behaviour)
+        order = sorted(range(len(stamps)), key=lambda i: (stamps[i], filenames[i]))
+        stamps = np.array([stamps[i] for i in order], dtype=str)
+        filenames = np.array([filenames[i] for i in order], dtype=str)
+        keys = np.array([s[0:14] for s in stamps], dtype=str)
+        logger.debug(f"Indexed {len(stamps)} timestamped files in {self.data_path}")
+        return IndexState(dir_mtime, stamps, keys, filenames, np.array(sorted(others), dtype=str))
+
+    def _load(self, dir_mtime):
+        cache_filepath = self.cache_filepath
+        if cache_filepath is None or not cache_filepath.is_file():
+            return False
+        try:
+            with np.load(cache_filepath) as cached:
+                if str(cached['data_path']) != str(self.data_path.resolve()) or int(cached['dir_mtime']) != dir_mtime:
+                    return False
+                stamps = cached['stamps']
+                filenames = cached['filenames']
+                others = cached['others']
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"ShotIndex: could not read cached index {cache_filepath}: {e}")
+            return False
+        self.state = IndexState(dir_mtime, stamps, np.array([s[0:14] for s in stamps], dtype=str), filenames, others)
+        logger.debug(f"Loaded shot index for {self.data_path} from {cache_filepath}")
+        return True
+
+    def _save(self):
+        cache_filepath = self.cache_filepath
+        if cache_filepath is None:
+            return
+        state = self.state
+        try:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            # write to a temporary file first so a half-written index is never read
+            tmp_filepath = cache_filepath.with_suffix('.tmp.npz')
+            np.savez(tmp_filepath, data_path=str(self.data_path.resolve()), dir_mtime=state.dir_mtime,
+                     stamps=state.stamps, filenames=state.filenames, others=state.others)
+            os.replace(tmp_filepath, cache_filepath)
+        except OSError as e:
+            logger.warning(f"ShotIndex: could not save index to {cache_filepath}: {e}")
+        return
+
+    def add(self, filenames, dir_mtime=None):
+        """Insert newly arrived files (e.g. from inotify events) without rescanning the folder.
+
+        Parameters
+        ----------
+            filenames : list
+                Names of files added to the data folder.
+            dir_mtime : int, optional
+                Modification time (st_mtime_ns) of the folder, taken before the events listing
+                filenames were read. The index is marked up to date with that, so the next refresh()
+                does not rescan for these files but still does for anything written after it. If None,
+                the previous modification time is kept and the next refresh() rescans the folder.
+        """
+        with self._lock:
+            state = self.state
+            known = set(state.filenames.tolist()) | set(state.others.tolist())
+            stamps, new_filenames, others = [], [], []
+            for filename in filenames:
+                if filename in known or filename.startswith('.'):
+                    continue
+                known.add(filename)
+                match = TIMESTAMP_PATTERN.search(filename)
+                if match:
+                    stamps.append(match.group(0))
+                    new_filenames.append(filename)
+                else:
+                    others.append(filename)
+
+            if stamps:
+                stamps = np.concatenate([state.stamps, np.array(stamps, dtype=str)])
+                filenames = np.concatenate([state.filenames, np.array(new_filenames, dtype=str)])
+                order = np.lexsort((filenames, stamps))
+                stamps, filenames = stamps[order], filenames[order]
+                state = state._replace(stamps=stamps, keys=np.array([s[0:14] for s in stamps], dtype=str), filenames=filenames)
+            if others:
+                state = state._replace(others=np.array(sorted(state.others.tolist() + others), dtype=str))
+
+            # only the folder as it was before the events were read is known to be indexed; the current
+            # modification time may include files that have not been reported yet
+            if dir_mtime is not None:
+                state = state._replace(dir_mtime=dir_mtime)
+            self.state = state
+            if new_filenames or others:
+                self._save()
+        return
+
+    def __len__(self):
+        return len(self.stamps)
+
+    def find(self, timestamp, extension=None):
+        """Return the filenames containing a timestamp, sorted by timestamp then filename.
+
+        Timestamps at the start of a filename's digit run (e.g. '20250602182440' or
+        '20250602182440870') are found by binary search. If that finds no file with the
+        extension, it falls back to a substring match over the indexed filenames.
+
+        Parameters
+        ----------
+            timestamp : str
+                The (partial) timestamp to search for.
+            extension : str, optional
+                The file extension to filter by.
+
+        Returns
+        -------
+            filenames : list
+                The matching filenames.
+        """
+        self.refresh()
+        state = self.state
+        timestamp = str(timestamp)
+
+        def matching(filenames):
+            if extension is None:
+                return filenames
+            return [f for f in filenames if f.endswith(extension)]
+
+        lo = np.searchsorted(state.stamps, timestamp, side='left')
+        hi = np.searchsorted(state.stamps, timestamp + ':', side='left') # ':' sorts directly after '9'
+        filenames = matching(state.filenames[lo:hi].tolist())
+
+        if not filenames:
+            filenames = matching([f for f in state.filenames.tolist() if timestamp in f])
+            filenames += matching([f for f in state.others.tolist() if timestamp in f])
+
+        return filenames
+
+    def select(self, start_time, end_time):
+        """Return the slice of the index with start_time <= YYYYMMDDHHMMSS <= end_time.
+        Comparisons are on strings, as in the previous directory-walking implementation.
+
+        Parameters
+        ----------
+            start_time : str
+                The start of the timeframe.
+            end_time : str
+                The end of the timeframe.
+
+        Returns
+        -------
+            keys : np.ndarray
+                The YYYYMMDDHHMMSS timestamps in the timeframe, sorted.
+            filenames : np.ndarray
+                The corresponding filenames.
+        """
+        self.refresh()
+        state = self.state
+        lo = np.searchsorted(state.keys, str(start_time), side='left')
+        hi = np.searchsorted(state.keys, str(end_time), side='right')
+        return state.keys[lo:hi], state.filenames[lo:hi]
@@ -0,0 +1,129 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+BACKENDS = ['thread', 'process']
+
+ShotResult = namedtuple('ShotResult', ['index', 'shot_dict', 'data', 'error'])
+ShotResult.__doc__ = """Result of loading one shot with Fireball_DAQ.get_shots_data() / stream_shots_data().
+index is the position of the shot in the requested shot_dicts, and error is the exception
+raised while finding or loading the file (data is then None), or None if it loaded fine."""
+
+Done = namedtuple('Done', ['result', 'error'])
+Done.__doc__ = """A job for run_jobs() that needs no running, e.g. data already in memory or a lookup error."""
+
+# DAQ used by process pool workers, set once per worker by _init_worker()
+_worker_daq = None
+
+
+def _init_worker(daq):
+    global _worker_daq
+    _worker_daq = daq
+
+
+def _load_in_worker(filepath, data_type):
+    return _worker_daq.load_data(filepath, data_type)
+
+
+def _load_staged_in_worker(filepath, data_type, local_filepath):
+    return _worker_daq.load_staged(filepath, data_type, local_filepath=local_filepath)
+
+
+def run_jobs(func, jobs, workers=1, backend='thread', ordered=True, initializer=None, initargs=()):
+    """Runs func(*args) for each job on a thread or process pool, yielding results as they finish.
+    At most 2*workers jobs are in flight (or waiting to be yielded, if ordered) at once, so
+    long job lists stream through at constant memory.
+
+    Parameters
+    ----------
+        func : callable
+            Function to run. Must be picklable (module level) for the 'process' backend.
+        jobs : iterable
+            Argument tuples for func. A Done(result, error) instead of a tuple is passed
+            straight through.
+        workers : int
+            Number of workers. 1 runs the jobs serially in this process.
+        backend : str
+            'thread' or 'process'.
+        ordered : bool
+            If True, results are yielded in job order, otherwise in order of completion.
+        initializer, initargs : optional
+            Passed to the pool, to set up each worker.
+
+    Yields
+    ------
+        index : int
+            Position of the job in jobs.
+        result :
+            Return value of func, or None if it raised.
+        error : Exception or None
+            The exception raised by func, if any.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Error: backend '{backend}' not supported, use one of {BACKENDS}")
+
+    if workers is None or workers <= 1:
+        for index, args in enumerate(jobs):
+            if isinstance(args, Done):
+                yield index, args.result, args.error
+                continue
+            try:
+                yield index, func(*args), None
+            except Exception as e:
+                yield index, None, e
+        return
+
+    if backend == 'process':
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+
+    max_pending = 2 * workers
+    jobs = enumerate(jobs)
+    pending = {} # future: index
+    finished = {} # index: (result, error), waiting to be yielded in order
+    next_index = 0
+    jobs_left = True
+    try:
+        while jobs_left or pending or finished:
+            # top up the pool
+            while jobs_left and len(pending) + len(finished) < max_pending:
+                try:
+                    index, args = next(jobs)
+                except StopIteration:
+                    jobs_left = False
+                    break
+                if isinstance(args, Done):
+                    finished[index] = tuple(args)
+                else:
+                    pending[executor.submit(func, *args)] = index
+
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        finished[index] = (future.result(), None)
+                    except Exception as e:
+                        finished[index] = (None, e)
+
+            if ordered:
+                while next_index in finished:
+                    result, error = finished.pop(next_index)
+                    yield next_index, result, error
+                    next_index += 1
+            else:
+                for index in sorted(finished):
+                    result, error = finished.pop(index)
+                    yield index, result, error
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return
+
+
+def default_workers(backend='thread'):
+    """Default number of workers for a backend; I/O bound threads can outnumber the cores"""
+    n_cpus = os.cpu_count() or 1
+    if backend == 'process':
+        return n_cpus
+    return min(32, n_cpus + 4)
@@ -0,0 +1,353 @@
+import os
+import json
+import shutil
+import logging
+from pathlib import Path
+import numpy as np
+from .shot_index import TIMESTAMP_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# Packs are HDF5 (h5py) or Zarr stores; only the library of the format in use is needed
+try:
+    import h5py
+except ImportError:
+    h5py = None
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+PACK_FORMATS = {'.h5': 'hdf5', '.hdf5': 'hdf5', '.zarr': 'zarr'}
+PACK_VERSION = 1
+
+
+def pack_format(filepath, file_format=None):
+    """The format of a pack ('hdf5' or 'zarr'), from its extension unless given, checking the
+    library it needs is installed."""
+    if file_format is None:
+        file_format = PACK_FORMATS.get(Path(filepath).suffix.lower())
+        if file_format is None:
+            raise ValueError(f"Shot pack: cannot tell the format of {filepath}; use a .h5, .hdf5 or .zarr extension, or pass file_format")
+    if file_format not in PACK_FORMATS.values():
+        raise ValueError(f"Shot pack: file_format '{file_format}' not supported, use 'hdf5' or 'zarr'")
+    if file_format == 'hdf5' and h5py is None:
+        raise ImportError("Shot pack: HDF5 packs need h5py (pip install h5py)")
+    if file_format == 'zarr' and zarr is None:
+        raise ImportError("Shot pack: Zarr packs need zarr (pip install zarr)")
+    return file_format
+
+
+def split_shot(data):
+    """Splits shot data (as returned by Fireball_DAQ.load_data()) into the arrays stored in the
+    pack, stacked along their first axis, and the rest as JSON metadata.
+
+    Returns
+    -------
+        kind : str
+            'array', 'dict' (e.g. scope shots) or 'none'.
+        arrays : dict
+            {name: np.ndarray} of the arrays (ndim >= 1) of the shot.
+        meta : dict
+            Everything else (e.g. N, dt, channel names), as JSON types.
+    """
+    if data is None:
+        return 'none', {}, {}
+    if isinstance(data, dict):
+        arrays, meta = {}, {}
+        for key, value in data.items():
+            if isinstance(value, np.ndarray) and value.ndim > 0:
+                arrays[key] = value
+            elif isinstance(value, (np.ndarray, np.generic)):
+                meta[key] = value.tolist()
+            else:
+                meta[key] = value
+        return 'dict', arrays, meta
+    return 'array', {'data': np.asarray(data)}, {}
+
+
+class ShotPackWriter():
+    """Writes the shots of a diagnostic into one chunked, compressed HDF5 or Zarr store (a 'pack'),
+    see Fireball_DAQ.pack_shots(). Shots are appended in timestamp order.
+
+    Each array of a shot (the image, or a scope shot's time and channels) is appended to a dataset
+    of that name along its first axis, so a run of consecutive shots is one contiguous slice. The
+    timestamps, filenames, row ranges and any other metadata of every shot are kept in a JSON
+    'index' dataset, written on close(). The pack is written under a temporary name and only
+    moved into place once complete.
+    """
+
+    __version__ = 0.1
+
+    def __init__(self, filepath, data_type, file_format=None, compression='gzip', chunk_shots=1):
+        """
+        Parameters
+        ----------
+            filepath : str or Path
+                The pack to write (.h5/.hdf5 or .zarr). Replaced if it exists.
+            data_type : str
+                The diagnostic data_type the shots were loaded as, returned again when reading.
+            file_format : str, optional
+                'hdf5' or 'zarr'. Defaults to the format of the extension.
+            compression : str, optional
+                HDF5 filter ('gzip' or 'lzf'); for Zarr any value keeps the default (Zstandard)
+                compression. None or 'none' stores the data uncompressed.
+            chunk_shots : int
+                Number of shots per chunk. 1 reads single shots fastest; more compresses better.
+        """
+        self.filepath = Path(filepath)
+        self.file_format = pack_format(filepath, file_format)
+        self.data_type = data_type
+        self.compression = None if compression in (None, 'none') else compression
+        self.chunk_shots = max(int(chunk_shots), 1)
+        self.stamps, self.filenames, self.shots = [], [], []
+        self._datasets = {}
+        self._rows = {}
+
+        self.tmp_filepath = self.filepath.with_name('.' + self.filepath.name + '.tmp')
+        self._remove(self.tmp_filepath)
+        os.makedirs(self.filepath.parent, exist_ok=True)
+        if self.file_format == 'hdf5':
+            self._root = h5py.File(self.tmp_filepath, 'w')
+        else:
+            self._root = zarr.open_group(str(self.tmp_filepath), mode='w')
+        return
+
+    def append(self, filename, data, timestamp=None):
+        """Add one shot.
+
+        Parameters
+        ----------
+            filename : str
+                The shot's source filename.
+            data :
+                The shot data, as returned by Fireball_DAQ.load_data().
+            timestamp : str, optional
+                The shot's timestamp. Defaults to the first run of >= 14 digits in the filename.
+        """
+        if timestamp is None:
+            match = TIMESTAMP_PATTERN.search(filename)
+            if match is None:
+                raise ValueError(f"Shot pack: no timestamp in {filename}")
+            timestamp = match.group(0)
+        timestamp = str(timestamp)
+        if self.stamps and (timestamp, filename) < (self.stamps[-1], self.filenames[-1]):
+            raise ValueError(f"Shot pack: shots must be appended in timestamp order, {filename} is after {self.filenames[-1]}")
+
+        kind, arrays, meta = split_shot(data)
+        record = {'kind': kind, 'meta': meta, 'rows': {}}
+        if kind == 'dict':
+            record['keys'] = list(data)
+        for name, array in arrays.items():
+            dataset = self._datasets.get(name)
+            if dataset is None:
+                dataset = self._create_dataset(name, array)
+            elif array.shape[1:] != dataset.shape[1:]:
+                raise ValueError(f"Shot pack: {name} of {filename} has shape {array.shape}, "
+                                 f"but the pack holds rows of shape {dataset.shape[1:]}")
+            start = self._rows[name]
+            stop = start + len(array)
+            dataset.resize((stop,) + dataset.shape[1:])
+            dataset[start:stop] = array
+            self._rows[name] = stop
+            record['rows'][name] = [start, stop]
+
+        self.stamps.append(timestamp)
+        self.filenames.append(filename)
+        self.shots.append(record)
+        return
+
+    def _create_dataset(self, name, array):
+        shape = (0,) + array.shape[1:]
+        chunks = (max(len(array), 1) * self.chunk_shots,) + array.shape[1:]
+        if self.file_format == 'hdf5':
+            dataset = self._root.create_dataset(name, shape=shape, maxshape=(None,) + array.shape[1:], chunks=chunks,
+                                                dtype=array.dtype, compression=self.compression)
+        else:
+            kwargs = {} if self.compression is not None else {'compressors': None}
+            dataset = self._root.create_array(name, shape=shape, chunks=chunks, dtype=array.dtype, **kwargs)
+        self._datasets[name] = dataset
+        self._rows[name] = 0
+        return dataset
+
+    def close(self):
+        """Write the index and move the finished pack into place"""
+        index = {
+            'version': PACK_VERSION,
+            'data_type': self.data_type,
+            'stamps': self.stamps,
+            'filenames': self.filenames,
+            'shots': self.shots
+        }
+        blob = np.frombuffer(json.dumps(index).encode(), dtype=np.uint8)
+        if self.file_format == 'hdf5':
+            self._root.create_dataset('index', data=blob)
+            self._root.attrs['pack_version'] = PACK_VERSION
+            self._root.attrs['data_type'] = self.data_type
+            self._root.close()
+        else:
+            self._root.create_array('index', shape=blob.shape, dtype=np.uint8)[:] = blob
+            self._root.attrs.update({'pack_version': PACK_VERSION, 'data_type': self.data_type})
+        self._remove(self.filepath)
+        os.replace(self.tmp_filepath, self.filepath)
+        return
+
+    def abort(self):
+        """Stop writing and delete the unfinished pack"""
+        if self.file_format == 'hdf5':
+            self._root.close()
+        self._remove(self.tmp_filepath)
+        return
+
+    @staticmethod
+    def _remove(filepath):
+        if os.path.isdir(filepath):
+            shutil.rmtree(filepath)
+        elif os.path.exists(filepath):
+            os.remove(filepath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class ShotPack():
+    """Read access to a pack written by ShotPackWriter. The pack is opened once and its timestamp
+    index held in memory, so single shots, and runs of consecutive shots, are read with one
+    slice per dataset and no file system lookups.
+    """
+
+    __version__ = 0.1
+
+    def __init__(self, filepath, file_format=None):
+        """
+        Parameters
+        ----------
+            filepath : str or Path
+                The pack (.h5/.hdf5 or .zarr).
+            file_format : str, optional
+                'hdf5' or 'zarr'. Defaults to the format of the extension.
+        """
+        self.filepath = Path(filepath)
+        self.file_format = pack_format(filepath, file_format)
+        if self.file_format == 'hdf5':
+            self._root = h5py.File(self.filepath, 'r')
+        else:
+            self._root = zarr.open_group(str(self.filepath), mode='r')
+        self.mtime_ns = os.stat(self.filepath).st_mtime_ns
+
+        index = json.loads(np.asarray(self._root['index'][:], dtype=np.uint8).tobytes().decode())
+        if index.get('version') != PACK_VERSION:
+            raise ValueError(f"Shot pack: {self.filepath} is pack version {index.get('version')}, expected {PACK_VERSION}")
+        self.data_type = index['data_type']
+        self.stamps = np.array(index['stamps'], dtype=str)
+        self.filenames = np.array(index['filenames'], dtype=str)
+        self.keys = np.array([s[0:14] for s in self.stamps], dtype=str)   # YYYYMMDDHHMMSS part of stamps
+        self.shots = index['shots']
+        self._filename_index = {filename: i for i, filename in enumerate(self.filenames.tolist())}
+        return
+
+    def __len__(self):
+        return len(self.stamps)
+
+    def find(self, timestamp):
+        """Positions of the shots whose timestamp starts with timestamp (e.g. '20250602182440')"""
+        timestamp = str(timestamp)
+        lo = np.searchsorted(self.stamps, timestamp, side='left')
+        hi = np.searchsorted(self.stamps, timestamp + ':', side='left') # ':' sorts directly after '9'
+        return np.arange(lo, hi)
+
+    def select(self, start_time, end_time):
+        """Slice of the shots with start_time <= YYYYMMDDHHMMSS <= end_time"""
+        lo = np.searchsorted(self.keys, str(start_time), side='left')
+        hi = np.searchsorted(self.keys, str(end_time), side='right')
+        return slice(int(lo), int(hi))
+
+    def index_of(self, shot_dict):
+        """Position of a shot given as {'filename': ...} or {'timestamp': [...]} (the latest filename
+        if several files share the timestamp, as Fireball_DAQ.timestamp_to_filename())"""
+        if isinstance(shot_dict, str):
+            shot_dict = {'filename': shot_dict}
+        if 'filename' in shot_dict:
+            filename = Path(shot_dict['filename']).name
+            if filename not in self._filename_index:
+                raise ValueError(f"Shot pack: no file {filename} in {self.filepath}")
+            return self._filename_index[filename]
+        if 'timestamp' in shot_dict:
+            timestamp = shot_dict['timestamp']
+            timestamp = timestamp[0] if isinstance(timestamp, list) else timestamp
+            found = self.find(timestamp)
+            if len(found) == 0:
+                raise ValueError(f"Shot pack: no shot with timestamp {timestamp} in {self.filepath}")
+            return int(found[-1])
+        raise ValueError(f"Shot pack: shot_dict {shot_dict} needs a 'filename' or 'timestamp'")
+
+    def read(self, index):
+        """Data of the shot at a position, as Fireball_DAQ.load_data() returned it when packed"""
+        return self.read_range(index, index + 1)[0]
+
+    def read_range(self, start, stop):
+        """Data of the consecutive shots start:stop, reading one slice of each dataset.
+
+        Returns
+        -------
+            shot_data : list
+                The data of each shot.
+        """
+        records = self.shots[start:stop]
+        blocks = {}
+        for name in {name for record in records for name in record['rows']}:
+            rows = [record['rows'][name] for record in records if name in record['rows']]
+            lo, hi = rows[0][0], rows[-1][1]
+            blocks[name] = (lo, self._root[name][lo:hi])
+
+        shot_data = []
+        for record in records:
+            arrays = {}
+            for name, (row_start, row_stop) in record['rows'].items():
+                lo, block = blocks[name]
+                arrays[name] = block[row_start - lo:row_stop - lo]
+            if record['kind'] == 'none':
+                shot_data.append(None)
+            elif record['kind'] == 'array':
+                shot_data.append(arrays['data'])
+            else:
+                values = {**record['meta'], **arrays}
+                shot_data.append({key: values[key] for key in record['keys']})
+        return shot_data
+
+    def read_many(self, indices, max_run=16):
+        """Data of the shots at several positions, reading runs of consecutive shots (up to
+        max_run at a time) together. Returns a list in the order of indices."""
+        indices = [int(i) for i in indices]
+        shot_data = [None] * len(indices)
+        i = 0
+        while i < len(indices):
+            j = i + 1
+            while j < len(indices) and j - i < max_run and indices[j] == indices[j-1] + 1:
+                j += 1
+            shot_data[i:j] = self.read_range(indices[i], indices[j-1] + 1)
+            i = j
+        return shot_data
+
+    def meta(self, start=None, stop=None):
+        """Metadata of the shots start:stop (e.g. N, dt and channel names of scope shots)"""
+        return [record['meta'] for record in self.shots[start:stop]]
+
+    def close(self):
+        if self.file_format == 'hdf5':
+            self._root.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
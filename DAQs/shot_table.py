@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+
+def stamps_to_times(stamps):
+    """Converts filename timestamps (YYYYMMDDHHMMSS followed by any fractional second digits,
+    e.g. '20250602182440870') to np.datetime64 times, to the millisecond.
+
+    Parameters
+    ----------
+        stamps : list or np.ndarray
+            Timestamp strings of at least 14 digits.
+
+    Returns
+    -------
+        times : np.ndarray
+            datetime64[ms] times.
+    """
+    stamps = [str(stamp) for stamp in stamps]
+    seconds = np.array([f"{s[0:4]}-{s[4:6]}-{s[6:8]}T{s[8:10]}:{s[10:12]}:{s[12:14]}" for s in stamps], dtype='datetime64[ms]')
+    ms = np.array([int(s[14:17].ljust(3, '0')) if len(s) > 14 else 0 for s in stamps], dtype='timedelta64[ms]')
+    return seconds + ms
+
+
+def match_nearest(event_times, times, tolerance):
+    """Pairs each time with the nearest event time within tolerance, each event taking at most
+    one time. Both neighbours of a time in event_times (found with searchsorted) are candidates,
+    and conflicts go to the pair with the smallest time difference (then the earlier event).
+
+    Parameters
+    ----------
+        event_times : np.ndarray
+            Sorted reference times of the events.
+        times : np.ndarray
+            Times to match, in the same units.
+        tolerance : float
+            Largest time difference of a pair.
+
+    Returns
+    -------
+        matches : np.ndarray
+            Index in event_times for each time, or -1 if it has no event.
+    """
+    event_times, times = np.asarray(event_times), np.asarray(times)
+    matches = np.full(len(times), -1, dtype=int)
+    if len(event_times) == 0 or len(times) == 0:
+        return matches
+
+    right = np.searchsorted(event_times, times, side='left')
+    candidate_times = np.concatenate([np.arange(len(times)), np.arange(len(times))])
+    candidate_events = np.concatenate([right - 1, right])
+    valid = (candidate_events >= 0) & (candidate_events < len(event_times))
+    candidate_times, candidate_events = candidate_times[valid], candidate_events[valid]
+    distances = np.abs(times[candidate_times] - event_times[candidate_events])
+    within = distances <= tolerance
+    candidate_times, candidate_events, distances = candidate_times[within], candidate_events[within], distances[within]
+
+    # closest pairs first; a time or event already paired is not paired again
+    taken = np.zeros(len(event_times), dtype=bool)
+    for k in np.lexsort((candidate_events, distances)):
+        t, e = candidate_times[k], candidate_events[k]
+        if matches[t] < 0 and not taken[e]:
+            matches[t] = e
+            taken[e] = True
+    return matches
+
+
+def build_shot_table(stamps, tolerance=1.0):
+    """Builds a table of events (shots) across several diagnostics, from the timestamps of each
+    diagnostic's files, which differ by a few milliseconds (or are only to the second).
+
+    The files of the first diagnostic start the events. The files of each further diagnostic
+    are matched to the nearest event within tolerance (see match_nearest()), so each event has
+    at most one file per diagnostic, and files with no event within tolerance start new events.
+
+    Parameters
+    ----------
+        stamps : dict
+            {diag_name: timestamps} for each diagnostic, as filename timestamp strings.
+        tolerance : float
+            Largest time difference in seconds between a file and the event it is matched to.
+
+    Returns
+    -------
+        shot_table : pd.DataFrame
+            One row per event, sorted by 'time' (of the earliest file in the event), and a column
+            for each diagnostic with its timestamp for the event, or None if it has no file within
+            tolerance. The diagnostic columns are of object dtype.
+    """
+    diag_names = list(stamps)
+    all_stamps = [np.asarray(stamps[diag_name], dtype=str) for diag_name in diag_names]
+    if not any(len(diag_stamps) for diag_stamps in all_stamps):
+        return pd.DataFrame(columns=['time'] + diag_names)
+    tolerance_ms = tolerance * 1e3
+
+    event_times = np.array([], dtype=np.int64)                      # reference time of each event, sorted
+    first_times = np.array([], dtype=np.int64)                      # earliest file of each event
+    events = np.zeros((0, len(diag_names)), dtype=int)              # position in each diagnostic's stamps, -1 if none
+    for d, diag_stamps in enumerate(all_stamps):
+        if len(diag_stamps) == 0:
+            continue
+        times = stamps_to_times(diag_stamps).astype(np.int64)
+        matches = match_nearest(event_times, times, tolerance_ms)
+        matched = matches >= 0
+        events[matches[matched], d] = np.flatnonzero(matched)
+        first_times[matches[matched]] = np.minimum(first_times[matches[matched]], times[matched])
+
+        # unmatched files start new events
+        new = np.flatnonzero(~matched)
+        new_events = np.full((len(new), len(diag_names)), -1, dtype=int)
+        new_events[:, d] = new
+        event_times = np.concatenate([event_times, times[new]])
+        first_times = np.concatenate([first_times, times[new]])
+        events = np.concatenate([events, new_events])
+        order = np.argsort(event_times, kind='stable')
+        event_times, first_times, events = event_times[order], first_times[order], events[order]
+
+    order = np.argsort(first_times, kind='stable')
+    first_times, events = first_times[order], events[order]
+    table = {'time': first_times.astype('datetime64[ms]')}
+    for d, diag_name in enumerate(diag_names):
+        column = np.full(len(events), None, dtype=object)
+        found = events[:, d] >= 0
+        column[found] = all_stamps[d][events[found, d]]
+        table[diag_name] = pd.Series(column, dtype=object)
+    return pd.DataFrame(table)
@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import numpy as np
+from .shot_index import TIMESTAMP_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# inotify is used to wait for new files if inotify_simple is installed (Linux), otherwise the folder is polled
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+
+class ShotWatcher():
+    """Follows one diagnostic data folder during a run and reports only the files that arrive.
+
+    New files are picked up from inotify events (files closed after writing or moved in)
+    where available, and added to the ShotIndex without rescanning the folder. Otherwise
+    the folder is polled: the index is refreshed (a single stat while nothing changes) and
+    compared against the files already seen. Polled files are only reported once they have
+    not been modified for settle seconds, so half-written files are not loaded. With inotify,
+    the folder is also polled whenever a read returns no events, as some filesystems (e.g.
+    EOS FUSE mounts) accept the watch but never raise any.
+    """
+
+    __version__ = 0.1
+
+    def __init__(self, shot_index, since=None, poll_interval=1.0, settle=0.5, use_inotify=True):
+        """
+        Parameters
+        ----------
+            shot_index : ShotIndex
+                Index of the folder to watch. It is kept up to date with the new files.
+            since : str, optional
+                YYYYMMDDHHMMSS timestamp. Files already in the folder from this time on are reported
+                by the first poll() (to catch up); if None only files arriving from now are.
+            poll_interval : float
+                Seconds between checks of the folder (or inotify reads).
+            settle : float
+                Seconds a polled file must be unmodified for before it is reported.
+            use_inotify : bool
+                Use inotify if available. Set False for network filesystems that do not raise events.
+        """
+        self.shot_index = shot_index
+        self.data_path = shot_index.data_path
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.pending = set()    # new files reported by inotify, written and closed
+        self.settling = set()   # new files found in the folder, reported once unmodified for settle seconds
+
+        shot_index.refresh()
+        state = shot_index.state
+        if since is None:
+            self.seen = set(state.filenames.tolist())
+        else:
+            self.seen = set(state.filenames[state.keys < str(since)].tolist())
+            self.settling.update(set(state.filenames.tolist()) - self.seen)
+
+        self._inotify = None
+        if use_inotify and INotify is not None:
+            try:
+                self._inotify = INotify()
+                self._inotify.add_watch(str(self.data_path), inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+            except OSError as e:
+                logger.warning(f"ShotWatcher: inotify not available for {self.data_path} ({e}), polling instead")
+                self._inotify = None
+        # anything that arrived while the watch was being set up
+        self._check_folder()
+        return
+
+    @property
+    def backend(self):
+        return 'poll' if self._inotify is None else 'inotify'
+
+    def poll(self, timeout=None):
+        """Wait for new files.
+
+        Parameters
+        ----------
+            timeout : float, optional
+                Seconds to wait for new files. Waits indefinitely if None.
+
+        Returns
+        -------
+            filenames : list
+                The new (timestamped) filenames, sorted by timestamp; empty if the timeout was reached.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            filenames = self._ready()
+            if filenames:
+                return filenames
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                wait = min(self.poll_interval, remaining)
+            else:
+                wait = self.poll_interval
+
+            if self._inotify is not None:
+                # every file written after this is either in the events read below or changes the folder again
+                dir_mtime = os.stat(self.data_path).st_mtime_ns
+                events = self._inotify.read(timeout=int(wait * 1000))
+                names = [event.name for event in events if event.name and TIMESTAMP_PATTERN.search(event.name)]
+                if names:
+                    self.shot_index.add(names, dir_mtime=dir_mtime)
+                    self.pending.update(name for name in names if name not in self.seen)
+                else:
+                    # nothing reported: check the folder too, in case the filesystem raises no events
+                    self._check_folder()
+            else:
+                time.sleep(wait)
+                self._check_folder()
+
+    def _check_folder(self):
+        # cheap unless the folder has changed: ShotIndex.refresh() only stats it
+        if self.shot_index.refresh():
+            self.settling.update(set(self.shot_index.filenames.tolist()) - self.seen - self.pending)
+        return
+
+    def _ready(self):
+        ready = list(self.pending)
+        if self.settling:
+            now = time.time()
+            for filename in self.settling - self.pending:
+                try:
+                    if now - os.stat(self.data_path / filename).st_mtime >= self.settle:
+                        ready.append(filename)
+                except FileNotFoundError:
+                    self.seen.add(filename) # removed again before it was reported
+            self.settling.difference_update(self.seen)
+        if not ready:
+            return []
+
+        self.pending.difference_update(ready)
+        self.settling.difference_update(ready)
+        self.seen.update(ready)
+        return sorted(ready, key=lambda f: (TIMESTAMP_PATTERN.search(f).group(0), f))
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
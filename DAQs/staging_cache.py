@@ -0,0 +1,271 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class StagingCache():
+    """Read-through copy of data files on a slow filesystem (e.g. an EOS FUSE mount on SWAN) in a
+    local folder, so each shot file is read over the network once and then opened locally.
+
+    Files are copied on first access (stage()) and can be copied ahead of time in the background
+    (prefetch()). Each copy has a .json sidecar with the source path, size and modification time,
+    and is only used while those still match the source. The folder is limited to max_bytes, with
+    the least recently used copies removed first. Prefetching never removes copies that were
+    prefetched but not yet read. Safe to use from several threads.
+    """
+
+    __version__ = 0.1
+
+    def __init__(self, staging_folder, max_bytes=20e9, workers=2):
+        """
+        Parameters
+        ----------
+            staging_folder : str or Path
+                Local folder to copy files into (ideally on a local SSD).
+            max_bytes : float
+                Maximum total size of the copies.
+            workers : int
+                Number of background threads copying prefetched files.
+        """
+        self.staging_folder = Path(staging_folder)
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._entries = OrderedDict()   # source: (local_filepath, size, mtime_ns), least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetched = 0
+        self._pending = {}              # source: Future, files queued or being copied in the background
+        self._unread = {}               # source: size, prefetched copies not read yet
+        self._executor = None
+        self._lock = threading.RLock() # done callbacks can run in the thread submitting the prefetch
+        self._load()
+        return
+
+    def _local_filepath(self, source):
+        # keep the filename, as loaders look at the extension
+        path_hash = hashlib.sha1(source.encode()).hexdigest()[:16]
+        return self.staging_folder / f"{path_hash}_{os.path.basename(source)}"
+
+    def _valid(self, source, stat):
+        """Local copy of source if it is staged and still matches stat, else None. Call with the lock held."""
+        entry = self._entries.get(source)
+        if entry is None or entry[1] != stat.st_size or entry[2] != stat.st_mtime_ns:
+            return None
+        return entry[0]
+
+    def stage(self, filepath):
+        """Return the path of a local copy of a file, copying it first if it is not staged (or has
+        changed). Files larger than max_bytes are not copied, and their own path is returned.
+
+        Parameters
+        ----------
+            filepath : str or Path
+                The data file.
+
+        Returns
+        -------
+            local_filepath : Path
+                The path to read the file from.
+        """
+        source = os.path.abspath(filepath)
+        # a file queued for prefetching is copied here instead; one being copied is waited for
+        with self._lock:
+            future = self._pending.get(source)
+        if future is not None and not future.cancel():
+            future.exception()
+
+        stat = os.stat(source)
+        with self._lock:
+            local_filepath = self._valid(source, stat)
+            if local_filepath is not None:
+                self._entries.move_to_end(source)
+                self._unread.pop(source, None)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if local_filepath is not None:
+            self._touch(local_filepath)
+            return local_filepath
+        return self._copy(source, stat)
+
+    def prefetch(self, filepaths):
+        """Copy files in the background, so later stage() calls find them locally. Files already
+        staged or queued are skipped, and so are files that do not fit in max_bytes next to the
+        prefetched files not read yet."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(int(self.workers), 1), thread_name_prefix='staging')
+            for filepath in filepaths:
+                source = os.path.abspath(filepath)
+                # staged files are checked against the source when read, not here, to save a stat per file
+                if source in self._pending or source in self._entries:
+                    continue
+                future = self._executor.submit(self._prefetch_one, source)
+                self._pending[source] = future
+                future.add_done_callback(lambda future, source=source: self._done(source, future))
+        return
+
+    def _done(self, source, future):
+        with self._lock:
+            if self._pending.get(source) is future:
+                del self._pending[source]
+
+    def _prefetch_one(self, source):
+        # queued prefetches are dropped once the session ends, rather than holding up the exit
+        if not threading.main_thread().is_alive():
+            return
+        try:
+            stat = os.stat(source)
+        except OSError as e:
+            logger.debug(f"StagingCache: could not prefetch {source}: {e}")
+            return
+        with self._lock:
+            if self._valid(source, stat) is not None:
+                return
+            unread_bytes = sum(self._unread.values())
+        if unread_bytes + stat.st_size > self.max_bytes:
+            logger.debug(f"StagingCache: skipped prefetching {source}, the staging folder is full of unread prefetched files")
+            return
+        try:
+            local_filepath = self._copy(source, stat)
+        except OSError as e:
+            logger.warning(f"StagingCache: could not prefetch {source}: {e}")
+            return
+        if local_filepath != Path(source):
+            with self._lock:
+                self._unread[source] = stat.st_size
+                self.prefetched += 1
+        return
+
+    def _copy(self, source, stat):
+        if stat.st_size > self.max_bytes:
+            return Path(source)
+        local_filepath = self._local_filepath(source)
+        sidecar = Path(str(local_filepath) + '.json')
+        try:
+            os.makedirs(self.staging_folder, exist_ok=True)
+            # copy to a temporary file first so a half-copied file is never read
+            tmp_filepath = Path(f"{local_filepath}.{threading.get_ident()}.tmp")
+            shutil.copyfile(source, tmp_filepath)
+            # the source may have been written to while it was copied
+            copied_stat = os.stat(source)
+            if (copied_stat.st_size, copied_stat.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                os.remove(tmp_filepath)
+                return Path(source)
+            # keep the source modification time, so the copy looks the same to file based caches
+            os.utime(tmp_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmp_filepath, local_filepath)
+            with open(sidecar, 'w') as f:
+                json.dump({"source": source, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+        except OSError as e:
+            logger.warning(f"StagingCache: could not stage {source} in {self.staging_folder}, reading it directly: {e}")
+            return Path(source)
+
+        with self._lock:
+            if source in self._entries:
+                self.nbytes -= self._entries.pop(source)[1]
+            self._entries[source] = (local_filepath, stat.st_size, stat.st_mtime_ns)
+            self.nbytes += stat.st_size
+            evicted = self._evict()
+        self._remove(evicted)
+        return local_filepath
+
+    def _evict(self):
+        """Drop least recently used entries until within max_bytes. Call with the lock held;
+        returns the local files to remove (after releasing it)."""
+        evicted = []
+        for source in list(self._entries):
+            if self.nbytes <= self.max_bytes or len(self._entries) <= 1:
+                break
+            if source in self._unread and len(self._unread) < len(self._entries):
+                continue
+            local_filepath, size, _ = self._entries.pop(source)
+            self._unread.pop(source, None)
+            self.nbytes -= size
+            self.evictions += 1
+            evicted.append(local_filepath)
+        return evicted
+
+    @staticmethod
+    def _remove(local_filepaths):
+        for local_filepath in local_filepaths:
+            for filepath in (local_filepath, Path(str(local_filepath) + '.json')):
+                try:
+                    os.remove(filepath)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _touch(local_filepath):
+        # the sidecar modification time orders entries by last use across sessions
+        try:
+            os.utime(str(local_filepath) + '.json')
+        except OSError:
+            pass
+
+    def _load(self):
+        """Pick up the copies left in the staging folder by earlier sessions, least recently used first"""
+        if not self.staging_folder.is_dir():
+            return
+        self._remove(self.staging_folder.glob('*.tmp'))
+        entries = []
+        for sidecar in self.staging_folder.glob('*.json'):
+            local_filepath = Path(str(sidecar)[:-len('.json')])
+            try:
+                with open(sidecar, 'r') as f:
+                    meta = json.load(f)
+                if os.path.getsize(local_filepath) != meta["size"]:
+                    raise ValueError("size does not match the source")
+                entries.append((sidecar.stat().st_mtime_ns, meta["source"], local_filepath, meta["size"], meta["mtime_ns"]))
+            except (OSError, ValueError, KeyError) as e:
+                logger.debug(f"StagingCache: ignoring {sidecar}: {e}")
+                self._remove([local_filepath])
+        for _, source, local_filepath, size, mtime_ns in sorted(entries):
+            self._entries[source] = (local_filepath, size, mtime_ns)
+            self.nbytes += size
+        self._remove(self._evict())
+        return
+
+    def close(self):
+        """Cancel the queued prefetches and stop the background threads"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return
+
+    def clear(self):
+        """Remove every local copy"""
+        with self._lock:
+            evicted = [entry[0] for entry in self._entries.values()]
+            self._entries.clear()
+            self._unread.clear()
+            self.nbytes = 0
+        self._remove(evicted)
+        return
+
+    def stats(self):
+        """Dictionary of cache statistics"""
+        return {
+            "entries": len(self._entries),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "prefetched": self.prefetched,
+            "pending": len(self._pending)
+        }
+
+    def __len__(self):
+        return len(self._entries)
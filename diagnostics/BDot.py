@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from LAMP.diagnostic import Diagnostic
+from .scope_block import ScopeBlock
 
 
 class BDot(Diagnostic):
@@ -13,12 +14,16 @@ class BDot(Diagnostic):
     def __init__(self, exp_obj, config_filepath):
         self.data_type = config_filepath['data_type']
         super().__init__(exp_obj, config_filepath)
-        self._scope_cache = {}
 
     # ------------------------------------------------------------------
     # Caching
     # ------------------------------------------------------------------
 
+    @property
+    def cache(self):
+        """The DAQ's in-memory shot cache (size limited LRU, shared between diagnostics)"""
+        return self.DAQ.shot_cache
+
     def get_scope_data(self, shot_dict):
         """
         Get scope data from the DAQ.
@@ -26,18 +31,10 @@ class BDot(Diagnostic):
           - 'filename'
           - 'timestamp'
           - 'timeframe' (list of [start, end])
-        Uses caching to avoid reloading the same data.
+        Uses the DAQ shot cache to avoid reloading the same files;
+        overlapping timeframes share the cached traces.
         """
     
-        # Create cache key
-        cache_key = tuple(
-            (k, tuple(v) if isinstance(v, list) else v)
-            for k, v in sorted(shot_dict.items())
-        )
-        if cache_key in self._scope_cache:
-            print(f"[Cache] Using cached data for {self.config['name']}")
-            return self._scope_cache[cache_key]
-    
         # -------------------------------
         # Handle timeframe separately
         # -------------------------------
@@ -49,16 +46,18 @@ class BDot(Diagnostic):
                 print(f"[INFO] No files found in timeframe {shot_dict['timeframe']} for {self.config['name']}")
                 return None
     
-            # Load all files in that timeframe
+            # Load all files in that timeframe (in parallel, see DAQ get_shots_data)
             shot_data_list = []
-            for sd in shot_dict_list:
-                data = self.DAQ.get_shot_data(self.config['name'], sd)
+            for result in self.DAQ.get_shots_data(self.config['name'], shot_dict_list, cache=True):
+                if result.error is not None:
+                    print(f"[INFO] Skipping {result.shot_dict} for {self.config['name']}: {result.error}")
+                    continue
+                data = result.data
                 # unwrap if returned dict contains 'data'
                 if isinstance(data, dict) and 'data' in data:
                     data = data['data']
                 shot_data_list.append(data)
     
-            self._scope_cache[cache_key] = shot_data_list
             return shot_data_list
     
         # -------------------------------
@@ -67,7 +66,8 @@ class BDot(Diagnostic):
         else:
             shot_data = self.DAQ.get_shot_data(
                 self.config['name'],
-                shot_dict
+                shot_dict,
+                cache=True
             )
     
             if shot_data is None:
@@ -77,9 +77,65 @@ class BDot(Diagnostic):
             if isinstance(shot_data, dict) and 'data' in shot_data:
                 shot_data = shot_data['data']
     
-            self._scope_cache[cache_key] = shot_data
             return shot_data
 
+    def iter_scope_data(self, shot_dict, chunk_size=None):
+        """
+        Generator version of get_scope_data() for timeframes.
+        Yields (shot_dict, shot_data) one shot at a time (or lists of up
+        to chunk_size shots), loaded in parallel by the DAQ but not cached,
+        so a timeframe of any length is processed at constant memory.
+        """
+        for sd, data in self.DAQ.iter_shots(self.config['name'], shot_dict, chunk_size=chunk_size):
+            # unwrap if returned dict contains 'data'
+            if chunk_size:
+                data = [d['data'] if isinstance(d, dict) and 'data' in d else d for d in data]
+            elif isinstance(data, dict) and 'data' in data:
+                data = data['data']
+            yield sd, data
+
+    def watch_scope_data(self, since=None, timeout=None, chunk_size=None):
+        """
+        Follows the data folder during a run and yields (shot_dict, shot_data)
+        for each new scope shot as it arrives (see DAQ.watch_shots()).
+        Only new files are parsed; since (a timestamp) catches up on the
+        shots taken from then first, timeout stops after that many seconds
+        without a new shot.
+        """
+        for sd, data in self.DAQ.watch_shots(self.config['name'], since=since, timeout=timeout, chunk_size=chunk_size):
+            if chunk_size:
+                data = [d['data'] if isinstance(d, dict) and 'data' in d else d for d in data]
+            elif isinstance(data, dict) and 'data' in data:
+                data = data['data']
+            yield sd, data
+
+    def get_scope_catalogue(self, shot_dict=None):
+        """
+        Headers of the scope files (timestamp, N, dt, channel names and
+        labels) of a shot, a timeframe or the whole folder, read without
+        loading any traces (see DAQ.get_scope_catalogue()).
+        """
+        return self.DAQ.get_scope_catalogue(self.config['name'], shot_dict)
+
+    def check_channels(self, shot_dict, channels=None, same_length=False):
+        """
+        Checks the channels are in every scope file of a shot or timeframe
+        (and optionally that the record lengths match) from the catalogue
+        of file headers, so bad requests fail before any traces are loaded.
+        Returns the catalogue rows, or None if shot_dict is not a
+        timestamp or timeframe.
+        """
+        if not isinstance(shot_dict, dict) or not ('timeframe' in shot_dict or 'timestamp' in shot_dict):
+            return None
+        catalogue = self.get_scope_catalogue(shot_dict)
+        for channel_names in set(catalogue['channel_names']):
+            for ch in channels or []:
+                if ch not in channel_names:
+                    raise ValueError(f"{ch} not in {self.config['name']} data: {list(channel_names)}")
+        if same_length and len(set(catalogue['N'])) > 1:
+            raise ValueError("Record lengths differ between shots; cannot stack voltages.")
+        return catalogue
+
     # ------------------------------------------------------------------
     # Internal helper
     # ------------------------------------------------------------------
@@ -87,51 +143,47 @@ class BDot(Diagnostic):
     def _extract_voltages(self, shot_data, channels=None, subtract=None):
         """
         Extract voltage arrays from shot_data.
+        The shots are gathered into one ScopeBlock, so the channel
+        selection is a strided view of it rather than a copy per shot.
         Returns:
             voltages (stacked array),
             channel_index (dict),
             channel_names (list)
         """
 
-        if isinstance(shot_data, dict):
-            shot_data = [shot_data]
+        block = shot_data if isinstance(shot_data, ScopeBlock) else ScopeBlock.from_shots(shot_data)
+        if block.ragged:
+            raise ValueError("Record lengths differ between shots; cannot stack voltages.")
 
-        all_channel_names = shot_data[0]['channel_names']
-        channel_index = {name: i for i, name in enumerate(all_channel_names)}
+        all_channel_names = block.channel_names
+        channel_index = block.channel_index
 
         if subtract:
             chA, chB = subtract
             if chA not in channel_index or chB not in channel_index:
                 raise ValueError(f"Invalid channel names: {chA}, {chB}")
-            idxA = channel_index[chA]
-            idxB = channel_index[chB]
+            voltages = block.subtract(chA, chB)
         else:
             if channels is None:
                 channels = all_channel_names
-            for ch in channels:
-                if ch not in channel_index:
-                    raise ValueError(f"{ch} not in data: {all_channel_names}")
-            idxs = [channel_index[ch] for ch in channels]
-
-        voltages = []
-
-        for shot in shot_data:
-            chans = shot['channels']
-
-            if subtract:
-                v = chans[:, idxA] - chans[:, idxB]
+            if len(channels) == 1:
+                voltages = block.select(channels[0])
             else:
-                if len(idxs) > 1:
-                    v = chans[:, idxs]
-                else:
-                    v = chans[:, idxs[0]]
-
-            voltages.append(v)
-
-        voltages = np.stack(voltages, axis=0)
+                voltages = block.select(channels)
 
         return voltages, channel_index, all_channel_names
 
+    def get_scope_block(self, shot_dict):
+        """
+        Scope data of a shot or timeframe as a ScopeBlock: one
+        (n_shots, N, n_channels) array (or a ragged buffer if the record
+        lengths differ), with channel/time window selection as views.
+        """
+        shot_data = self.get_scope_data(shot_dict)
+        if not shot_data:
+            return None
+        return ScopeBlock.from_shots(shot_data)
+
     # ------------------------------------------------------------------
     # Time-domain plotting
     # ------------------------------------------------------------------
@@ -149,6 +201,9 @@ class BDot(Diagnostic):
                    ymin=None,
                    ymax=None):
 
+        # channel names and record lengths are checked from the file headers first
+        self.check_channels(shot_dict, subtract or channels, same_length=True)
+
         shot_data = self.get_scope_data(shot_dict)
         if isinstance(shot_data, dict):
             shot_data = [shot_data]
@@ -1,3 +1,9 @@
+import os
+import hashlib
+import tempfile
+import uuid
+import threading
+from pathlib import Path
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
@@ -10,6 +16,16 @@ from LAMP.utils.image_proc import ImageProc
 from LAMP.utils.general import dict_update, mindex
 from LAMP.utils.plotting import *
 
+from .espec_calib import ESpecCalib, ESpecCalibCache, ProcResult, process_frame, roi_selection
+from .running_stats import RunningStats
+from .lineout_metrics import lineout_metrics
+from .frame_store import FrameStore
+from .metrics_store import MetricsStore
+from .proc_shot_cache import ProcShotCache
+
+# bump when the stored spectrum metrics change definition, so MetricsStore rows are recomputed
+METRICS_VERSION = 1
+
 class ESpec_(Diagnostic):
     """Electron (charged particle?) Spectrometer.
         TODO: Tracking sims
@@ -24,7 +40,7 @@ class ESpec_(Diagnostic):
     # my (BK) thinking is that it is better to keep track of all the different units for the x/y axis
     # also, sticking to the same units (mm/MeV/mrad) helps make it easier to convert from different calibrations and simplify plotting
     curr_img = None
-    img_units = ['Counts']
+    img_units = ('Counts',)
     x_mm, y_mm = None, None
     x_mrad, y_mrad = None, None
     x_MeV, y_MeV = None, None
@@ -32,207 +48,569 @@ class ESpec_(Diagnostic):
     def __init__(self, exp_obj, config_filepath):
         """Initiate parent base Diagnostic class to get all shared attributes and funcs"""
         super().__init__(exp_obj, config_filepath)
+
+        # precompiled calibrations (see get_proc_calib), optionally saved in the cache folder
+        cache_config = self.ex.config.get('cache', {})
+        cache_folder = self.ex.config['paths'].get('cache_folder')
+        if cache_config.get('espec_calib', False) and cache_folder:
+            cache_folder = Path(self.ex.config['paths']['root']) / cache_folder / 'espec_calib'
+        else:
+            cache_folder = None
+        self.calib_cache = ESpecCalibCache(maxsize=cache_config.get('espec_calib_maxsize', 16), cache_folder=cache_folder)
+        self._calib_file_hashes = {}
+        self.proc_calib = None
+        self.img_units = list(self.img_units)
+
+        # the calibration lookup and run_img_calib() work through self.calib_dict etc., so that stage
+        # is serialised per instance; everything after it is done by process_frame() (see process_shot())
+        self._calib_lock = threading.RLock()
+
+        # processed shots (see get_proc_shot), in memory and optionally saved in the cache folder
+        cache_folder = self.ex.config['paths'].get('cache_folder')
+        if cache_config.get('espec_proc', False) and cache_folder:
+            cache_folder = Path(self.ex.config['paths']['root']) / cache_folder / 'espec_proc'
+        else:
+            cache_folder = None
+        self.proc_cache = ProcShotCache(max_bytes=cache_config.get('espec_proc_mb', 256) * 1e6, cache_folder=cache_folder)
+
+        # per-shot metrics saved in the cache folder (see get_spectra_metrics)
+        if cache_config.get('espec_metrics', False) and self.ex.config['paths'].get('cache_folder'):
+            self.metrics_store = MetricsStore(Path(self.ex.config['paths']['root']) / self.ex.config['paths']['cache_folder'] / 'metrics')
+        else:
+            self.metrics_store = None
         return
 
+    @property
+    def cache(self):
+        """The DAQ's in-memory shot cache (size limited LRU, shared between diagnostics)"""
+        return self.DAQ.shot_cache
+
+    def get_shot_data(self, shot_dict):
+        """Wrapper for getting shot data through the DAQ, using its shot cache.
+        Returns a copy, as the image processing can work in place."""
+        shot_data = self.DAQ.get_shot_data(self.config['name'], shot_dict, cache=True)
+        if shot_data is None:
+            return None
+        return np.array(shot_data)
+
     def get_proc_shot(self, shot_dict, calib_id=None, apply_disp=True, apply_div=True, apply_charge=True, roi_mm=None, roi_MeV=None, roi_mrad=None, debug=False):
         """Return a processed shot using saved or passed calibrations.
         Wraps base diagnostic class function, adding dispersion, divergence, charge.
+        These are precompiled once per calibration and cached, see get_proc_calib().
+        Processed shots are cached too (see proc_shot_key()), so repeated calls for the same
+        shot (metrics, charge, plots) load and process it once. The returned image is read-only.
+        Also sets the current image, axes and units; see process_shot() to leave them alone.
         """
 
-        # use diagnostic base function
-        # loads calib id and run_img_calib for standard calibration routines
-        img, x, y = super().get_proc_shot(shot_dict, calib_id=calib_id, debug=debug)
-        if img is None:
+        # TO DO: roi_mm? only use if not setting dispersion or divergence below...
+        result = self.process_shot(shot_dict, calib_id=calib_id, apply_disp=apply_disp, apply_div=apply_div, apply_charge=apply_charge, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
+        if result is None:
             return None, None, None
 
+        with self._calib_lock:
+            self.curr_img = result.img
+            self.set_proc_calib(result.calib)
+        return result.img, result.x, result.y
+
+    def process_shot(self, shot_dict, calib_id=None, apply_disp=True, apply_div=True, apply_charge=True, roi_MeV=None, roi_mrad=None, debug=False):
+        """Processed shot as get_proc_shot(), returned as a ProcResult rather than set as the current
+        processed image, so it can be called from several threads (e.g. a pool processing HRM5 and
+        HRM6 shots). Loading and the dispersion, divergence, ROI and charge steps (process_frame())
+        run concurrently.
+
+        This is not fully re-entrant. The calibration lookup and the standard image calibration
+        (the base Diagnostic run_img_calib()) keep their state on the instance: they set
+        self.calib_dict, self.calib_id, the dark image, self.x, self.y and self.curr_img. That stage
+        therefore runs under a per-instance lock, so calls on the same instance take turns through it,
+        and those attributes are left as the last call set them. Use separate instances (one per
+        diagnostic) to run it in parallel. Do not rely on the instance's current calibration or image
+        while other threads are processing with it.
+
+        Returns
+        -------
+            result : ProcResult
+                (img, x, y, units, calib), or None if there is no data for the shot.
+        """
+        # already processed? (not in debug, which should show the processing steps)
+        key = None
+        if not debug:
+            with self._calib_lock:
+                key = self.proc_shot_key(shot_dict, calib_id=calib_id, apply_disp=apply_disp, apply_div=apply_div, apply_charge=apply_charge, roi_MeV=roi_MeV, roi_mrad=roi_mrad)
+            if key is not None:
+                cached = self.proc_cache.get(key)
+                if cached is not None:
+                    img, calib = cached
+                    return ProcResult(img, calib.x, calib.y, calib.units, calib)
+
+        shot_data = self.get_shot_data(shot_dict)
+        if shot_data is None:
+            return None
+
+        # calibration lookup and standard image calibration (transforms, background, ROIs etc.),
+        # as the diagnostic base get_proc_shot(), then the precompiled calibration for the result
+        # NB: No other ROIs should be applied until the 'final' process_frame() step, so there are no conflicts. If wrapping this function, just pass in ROI values
+        with self._calib_lock:
+            if calib_id:
+                self.calib_dict = self.get_calib(calib_id)
+            else:
+                self.calib_dict = self.get_calib(shot_dict)
+            img, x, y = self.run_img_calib(shot_data, debug=debug)
+            if img is None:
+                return None
+            calib = self.get_proc_calib(x, y, roi_MeV=roi_MeV, roi_mrad=roi_mrad, apply_disp=apply_disp, apply_div=apply_div, apply_charge=apply_charge)
+
+        result = process_frame(img, calib)
+        if key is not None:
+            img, calib = self.proc_cache.put(key, result.img, calib)
+            result = result._replace(img=img)
+        return result
+
+    def set_proc_calib(self, calib):
+        """Set the current processed calibration, axes and image units from an ESpecCalib"""
         # assuming mm here for units
-        # either don't or use conversion functions...
-        self.x_mm = x
-        self.y_mm = y
+        self.proc_calib = calib
+        self.x_mm = calib.x_mm
+        self.y_mm = calib.y_mm
+        if calib.disp_axis == 'y':
+            self.y_MeV = calib.MeV
+        elif calib.disp_axis == 'x':
+            self.x_MeV = calib.MeV
+        if calib.div_axis == 'y':
+            self.y_mrad = calib.mrad
+        elif calib.div_axis == 'x':
+            self.x_mrad = calib.mrad
+        self.img_units = calib.units
+        return
 
-        # TO DO: roi_mm? only use if not setting dispersion or divergence below...
+    def proc_shot_key(self, shot_dict, calib_id=None, apply_disp=True, apply_div=True, apply_charge=True, roi_MeV=None, roi_mrad=None):
+        """Key of a processed shot in the proc_cache: the source file (path, size, modification time),
+        the calibration file contents and calib_id, ROIs and apply flags. Sets the calibration for
+        the shot, as get_proc_shot() does. Returns None if the shot's file cannot be found."""
+        try:
+            filepath = self.DAQ.get_filepath(self.config['name'], shot_dict)
+            stat = os.stat(filepath)
+        except (ValueError, TypeError, OSError):
+            return None
 
-        # dispersion?
-        if apply_disp and 'dispersion' in self.calib_dict:
-            MeV=self.make_dispersion(self.calib_dict['dispersion'])
-            img, MeV = self.apply_dispersion(img, self.calib_dict['dispersion'])
+        if calib_id:
+            self.calib_dict = self.get_calib(calib_id)
+        else:
+            self.calib_dict = self.get_calib(shot_dict)
 
-            # default to applying to X axis unless set
-            if 'axis' in self.calib_dict['dispersion'] and self.calib_dict['dispersion']['axis'].lower() == 'y':
-                axis = 'y'
-            else:
-                axis = 'x'
-
-            # no ROI passed? use defaults from calibration
-            if not roi_MeV:
-                # defaults in calibration dictionary?
-                if 'roi' in self.calib_dict and 'MeV' in self.calib_dict['roi']:
-                    MeV_min = np.min(self.calib_dict['roi']['MeV'])
-                    MeV_max = np.max(self.calib_dict['roi']['MeV'])   
-                # nope, no ROIs...
+        key = hashlib.sha1()
+        key.update(repr((str(Path(filepath).resolve()), stat.st_size, stat.st_mtime_ns)).encode())
+        key.update(self.calib_files_hash().encode())
+        key.update(repr((self.calib_id, roi_MeV, roi_mrad, apply_disp, apply_div, apply_charge, self.calib_dict_fixed)).encode())
+        return key.hexdigest()
+    
+    def get_proc_shots(self, shot_dicts, calib_id=None, roi_MeV=None, roi_mrad=None, chunk_size=16, store=None, debug=False):
+        """Batch version of get_proc_shot(). Raw frames are loaded in parallel (DAQ stream_shots_data())
+        and the standard image calibration (run_img_calib) is still run per shot, but dispersion,
+        divergence, ROIs and charge are built once per calibration (see get_proc_calib()) and
+        applied to chunks of up to chunk_size frames at once. If a FrameStore is passed, the
+        processed frames are also written to it.
+
+        Yields
+        ------
+            imgs : np.ndarray
+                (n, len(y), len(x)) processed images.
+            calib : ESpecCalib
+                The calibration used, with the x, y, MeV and mrad axes.
+            shot_dicts : list
+                The shot dictionaries of the images.
+        """
+        def process_chunk(frames, calib, chunk_shot_dicts):
+            imgs = process_frame(np.stack(frames), calib, in_place=True).img
+            if store is not None:
+                store.append(imgs, chunk_shot_dicts, calib=calib)
+            return imgs, calib, chunk_shot_dicts
+
+        frames, chunk_shot_dicts = [], []
+        calib = None
+        # raw frames are loaded in parallel by the DAQ, in order
+        for result in self.DAQ.stream_shots_data(self.config['name'], shot_dicts, ordered=True, cache=True):
+            shot_dict = result.shot_dict
+            if result.data is None:
+                print(f'get_proc_shots() warning; no data for {shot_dict}, skipping')
+                continue
+
+            # calibration lookup and standard image processing, as process_shot()
+            with self._calib_lock:
+                if calib_id:
+                    self.calib_dict = self.get_calib(calib_id)
                 else:
-                    MeV_min = np.min(MeV)
-                    MeV_max = np.max(MeV)     
-            # ROI passed...
-            else:
-                MeV_min = np.min(roi_MeV)
-                MeV_max = np.max(roi_MeV)
-
-            # Apply ROIs...
-            # NB: No other ROIs should be applied until this 'final' step, so there are no conflicts. If wrapping this function, just pass in ROI values
-            if axis == 'y':
-                self.y_mm = self.y_mm[(MeV >= MeV_min)]# update spatial axis with ROI selection
-                img = img[(MeV >= MeV_min), :]
-                MeV = MeV[(MeV >= MeV_min)]
-                self.y_mm = self.y_mm[(MeV <= MeV_max)] # update spatial axis with ROI selection
-                img = img[(MeV <= MeV_max), :]
-                MeV = MeV[(MeV <= MeV_max)]
-                self.y_MeV = MeV 
-                y = MeV
+                    self.calib_dict = self.get_calib(shot_dict)
+                img, x, y = self.run_img_calib(np.array(result.data), debug=debug)
+                shot_calib = None if img is None else self.get_proc_calib(x, y, roi_MeV=roi_MeV, roi_mrad=roi_mrad)
+            if img is None:
+                print(f'get_proc_shots() warning; no data for {shot_dict}, skipping')
+                continue
+
+            # new calibration (or image size)? flush what we have first
+            if shot_calib is not calib:
+                if frames:
+                    yield process_chunk(frames, calib, chunk_shot_dicts)
+                    frames, chunk_shot_dicts = [], []
+                calib = shot_calib
+
+            frames.append(img)
+            chunk_shot_dicts.append(shot_dict)
+            if len(frames) >= chunk_size:
+                yield process_chunk(frames, calib, chunk_shot_dicts)
+                frames, chunk_shot_dicts = [], []
+
+        if frames:
+            yield process_chunk(frames, calib, chunk_shot_dicts)
+
+    def iter_proc_chunks(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, chunk_size=16, exceptions=None, store=None, debug=False):
+        """Chunks of processed frames for a timeframe, as get_proc_shots(). If timeframe is a FrameStore,
+        the stored frames are read back instead of processing the shots again."""
+        if isinstance(timeframe, FrameStore):
+            yield from timeframe.iter_chunks(chunk_size)
+            return
+        shot_dicts = self.DAQ.get_shot_dicts(self.config['name'], timeframe, exceptions=exceptions)
+        yield from self.get_proc_shots(shot_dicts, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size, store=store, debug=debug)
+
+    def make_frame_store(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, filepath=None, exceptions=None, chunk_size=16, debug=False):
+        """Process every shot in a timeframe into a memory-mapped FrameStore on disk, which
+        get_spectra(), get_divs(), montage() etc. can then read in place of a timeframe.
+
+        Parameters
+        ----------
+            filepath : str or Path, optional
+                Path of the store (without extension). Defaults to a new, uniquely named store in
+                <cache_folder>/frames (or the system temporary folder if there is no cache folder).
+                The store is not removed automatically: call store.delete() once it is no longer needed.
+                montage() deletes the stores it makes itself.
+
+        Returns
+        -------
+            store : FrameStore
+        """
+        shot_dicts = self.DAQ.get_shot_dicts(self.config['name'], timeframe, exceptions=exceptions)
+        if filepath is None:
+            if getattr(self.DAQ, 'cache_folder', None) is not None:
+                folder = Path(self.DAQ.cache_folder) / 'frames'
             else:
-                # I'm sure this cam be done in one line, but I'm being lazy...
-                self.x_mm = self.x_mm[(MeV >= MeV_min)] # update spatial axis with ROI selection
-                img = img[:, (MeV >= MeV_min)]
-                MeV = MeV[(MeV >= MeV_min)]
-                self.x_mm = self.x_mm[(MeV <= MeV_max)] # update spatial axis with ROI selection
-                img = img[:, (MeV <= MeV_max)]
-                MeV = MeV[(MeV <= MeV_max)]
-                self.x_MeV = MeV 
-                x = MeV
-
-        # divergence?
-        if apply_div and 'divergence' in self.calib_dict:
-            mrad = self.make_divergence(self.calib_dict['divergence'])
-            img, mrad = self.apply_divergence(img, self.calib_dict['divergence'])
+                folder = Path(tempfile.gettempdir())
+            os.makedirs(folder, exist_ok=True)
+            # a unique name rather than tempfile.mktemp(), which is racy between processes
+            filepath = folder / f"{self.config['name']}_{uuid.uuid4().hex}"
+
+        # shot count is known, so the store is preallocated (and trimmed if shots are missing)
+        store = FrameStore(filepath, n_shots=len(shot_dicts), chunk_size=chunk_size)
+        try:
+            for _ in self.get_proc_shots(shot_dicts, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size, store=store, debug=debug):
+                pass
+        except BaseException:
+            # a half-written store is of no use to anyone
+            store.delete()
+            raise
+        store.close()
+        return store
+
+    def get_proc_calib(self, x_mm, y_mm, roi_MeV=None, roi_mrad=None, apply_disp=True, apply_div=True, apply_charge=True):
+        """Return the precompiled ESpecCalib for the current calibration, image axes and ROIs.
+        Calibrations are kept in an LRU cache (and on disk if [cache] espec_calib = true), keyed on
+        the contents of the calibration file(s), so they are only built once per calibration.
+
+        Returns
+        -------
+            calib : ESpecCalib
+        """
+        key = hashlib.sha1()
+        key.update(self.calib_files_hash().encode())
+        key.update(repr((self.calib_id, roi_MeV, roi_mrad, apply_disp, apply_div, apply_charge, self.calib_dict_fixed)).encode())
+        key.update(np.ascontiguousarray(x_mm, dtype=float).tobytes())
+        key.update(np.ascontiguousarray(y_mm, dtype=float).tobytes())
+        key = key.hexdigest()
+
+        calib = self.calib_cache.get(key)
+        if calib is None:
+            calib = self.make_proc_calib(x_mm, y_mm, roi_MeV=roi_MeV, roi_mrad=roi_mrad, apply_disp=apply_disp, apply_div=apply_div, apply_charge=apply_charge)
+            self.calib_cache.put(key, calib)
+        return calib
+
+    def calib_files_hash(self, filenames=None):
+        """Hash of the contents of the calibration files in use (master file, processed file
+        and calib_id file), for keying cached calibrations."""
+        if filenames is None:
+            filenames = [self.config.get('calib_file'), self.calib_id]
+            if self.calib_dict and 'proc_file' in self.calib_dict:
+                filenames.append(self.calib_dict['proc_file'])
+
+        file_hashes = []
+        for filename in filenames:
+            if not isinstance(filename, str):
+                continue
+            filepath = self.build_calib_filepath(filename)
+            if not os.path.isfile(filepath):
+                continue
+            stat = os.stat(filepath)
+            stat_key = (str(filepath), stat.st_size, stat.st_mtime_ns)
+            if stat_key not in self._calib_file_hashes:
+                with open(filepath, 'rb') as f:
+                    self._calib_file_hashes[stat_key] = hashlib.sha1(f.read()).hexdigest()
+            file_hashes.append(self._calib_file_hashes[stat_key])
+        return ''.join(file_hashes)
+
+    def make_proc_calib(self, x_mm, y_mm, roi_MeV=None, roi_mrad=None, apply_disp=True, apply_div=True, apply_charge=True):
+        """Precompute the dispersion, divergence, ROI and charge steps of get_proc_shot() for the
+        current calibration and image axes, so they can be applied to one or many frames at once.
+
+        Returns
+        -------
+            calib : ESpecCalib
+        """
+        x_mm, y_mm = np.asarray(x_mm), np.asarray(y_mm)
+        mm = {'x': x_mm, 'y': y_mm}
+        axes = {'x': x_mm, 'y': y_mm}
+        idx = {'x': np.arange(len(x_mm)), 'y': np.arange(len(y_mm))}
+        weight = {'x': np.ones(len(x_mm)), 'y': np.ones(len(y_mm))}
+        scale = 1.0
+        disp_axis, MeV, div_axis, mrad, dmrad, fC_per_count = None, None, None, None, None, None
 
-            # default to Y axis
-            if 'axis' in self.calib_dict['divergence'] and self.calib_dict['divergence']['axis'].lower() == 'x':
-                    axis = 'x'
-            else:
-                axis = 'y'
-
-            # no ROI passed? use defaults from calibration
-            if not roi_mrad:
-                # defaults in calibration dictionary?
-                if 'roi' in self.calib_dict and 'mrad' in self.calib_dict['roi']:
-                    mrad_min = np.min(self.calib_dict['roi']['mrad'])
-                    mrad_max = np.max(self.calib_dict['roi']['mrad'])   
-                # nope, no ROIs...
-                else:
-                    mrad_min = np.min(mrad)
-                    mrad_max = np.max(mrad)     
-            # ROI passed...
-            else:
-                mrad_min = np.min(roi_mrad)
-                mrad_max = np.max(roi_mrad)
-
-            # Apply ROIs...
-            # NB: No other ROIs should be applied until this 'final' step, so there are no conflicts. If wrapping this function, just pass in ROI values
-            if axis == 'y':
-                self.y_mm = self.y_mm[(mrad > mrad_min)] # update spatial axis with ROI selection
-                img = img[(mrad > mrad_min), :]
-                mrad = mrad[(mrad > mrad_min)]
-                self.y_mm = self.y_mm[(mrad < mrad_max)] # update spatial axis with ROI selection
-                img = img[(mrad < mrad_max), :]
-                mrad = mrad[(mrad < mrad_max)]
-                self.y_mrad = mrad
-                y = mrad
-            else:
-                self.x_mm = self.x_mm[(mrad > mrad_min)] # update spatial axis with ROI selection
-                img = img[:, (mrad > mrad_min)]
-                mrad = mrad[(mrad > mrad_min)]
-                self.x_mm = self.x_mm[(mrad < mrad_max)] # update spatial axis with ROI selection
-                img = img[:, (mrad < mrad_max)]
-                mrad = mrad[(mrad < mrad_max)]
-                self.x_mrad = mrad
-                x = mrad
-
-        # charge calibration?
-        if apply_charge and 'charge' in self.calib_dict:
-            if 'fC_per_count' in self.calib_dict['charge']:
-                img = img * self.calib_dict['charge']['fC_per_count']
-                if 'Counts' in self.img_units:
-                    self.img_units.remove('Counts')
-                if 'fC' not in self.img_units:
-                    self.img_units.insert(0,'fC')
-
-        return img, x, y
-    
-    def get_spectrum(self, shot_dict, calib_id=None, roi_MeV=None, roi_mrad=None,  debug=False):
-        """Integrate across the non-dispersive axis and return a spectral lineout"""
-        img, x, y = self.get_proc_shot(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
+        if apply_disp and 'dispersion' in self.calib_dict:
+            self.x_mm, self.y_mm = mm['x'], mm['y']
+            MeV = self.make_dispersion(self.calib_dict['dispersion'])
+            disp_dict = self.calib_dict['dispersion']
+            disp_axis = disp_dict['axis']
+
+            # counts to counts per MeV, as apply_dispersion()
+            weight[disp_axis] = abs(np.gradient(mm[disp_axis])) / abs(np.gradient(MeV))
+            if "angle to normal (rad)" in disp_dict:
+                weight[disp_axis] = weight[disp_axis] / np.cos(disp_dict["angle (mrad)"]*1e-3)
+
+            # ROI as a slice (for monotonic MeV), resolved once per calibration
+            MeV_min, MeV_max = self.roi_limits(roi_MeV, 'MeV', MeV)
+            keep = roi_selection(MeV, MeV_min, MeV_max)
+            idx[disp_axis] = idx[disp_axis][keep]
+            mm[disp_axis] = mm[disp_axis][keep]
+            MeV = MeV[keep]
+            axes[disp_axis] = MeV
 
-        if img is None:
+        if apply_div and 'divergence' in self.calib_dict:
+            self.x_mm, self.y_mm = mm['x'], mm['y']
+            mrad = self.make_divergence(self.calib_dict['divergence'])
+            div_axis = self.calib_dict['divergence']['axis']
+
+            # counts to counts per mrad, as apply_divergence()
+            dmrad = np.mean(np.diff(mrad))
+            scale = scale / dmrad
+
+            mrad_min, mrad_max = self.roi_limits(roi_mrad, 'mrad', mrad)
+            keep = roi_selection(mrad, mrad_min, mrad_max, inclusive=False)
+            idx[div_axis] = idx[div_axis][keep]
+            mm[div_axis] = mm[div_axis][keep]
+            mrad = mrad[keep]
+            axes[div_axis] = mrad
+
+        if apply_charge and 'charge' in self.calib_dict and 'fC_per_count' in self.calib_dict['charge']:
+            fC_per_count = self.calib_dict['charge']['fC_per_count']
+            scale = scale * fC_per_count
+
+        self.x_mm, self.y_mm = mm['x'], mm['y']
+
+        return ESpecCalib((len(y_mm), len(x_mm)), idx['x'], idx['y'], weight['x'], weight['y'], scale, axes['x'], axes['y'], mm['x'], mm['y'],
+                          disp_axis=disp_axis, MeV=MeV, div_axis=div_axis, mrad=mrad, dmrad=dmrad, fC_per_count=fC_per_count,
+                          calib_id=self.calib_id if isinstance(self.calib_id, str) else None)
+
+    def roi_limits(self, roi, units, axis):
+        """ROI limits in units ('MeV' or 'mrad'); passed ROI, else calibration default, else full axis"""
+        # ROI passed...
+        if roi:
+            return np.min(roi), np.max(roi)
+        # defaults in calibration dictionary?
+        if 'roi' in self.calib_dict and units in self.calib_dict['roi']:
+            return np.min(self.calib_dict['roi'][units]), np.max(self.calib_dict['roi'][units])
+        # nope, no ROIs...
+        return np.min(axis), np.max(axis)
+
+    def get_spectrum(self, shot_dict, calib_id=None, roi_MeV=None, roi_mrad=None, MeV_grid=None, debug=False):
+        """Integrate across the non-dispersive axis and return a spectral lineout (np.ndarray), with
+        MeV increasing. Pass MeV_grid (bin centres) to rebin onto a fixed (e.g. uniform) energy grid."""
+        result = self.process_shot(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
+
+        if result is None:
             return None, None
 
-        if 'axis' in self.calib_dict['dispersion'] and self.calib_dict['dispersion']['axis'].lower() == 'y':
-            spec = np.sum(img, 1)
-            MeV = y
-        else:
-            spec = np.sum(img, 0)
-            MeV = x
-        
-        # normalise out the /mrad units
-        if 'divergence' in self.calib_dict:
-            mrad = self.calib_dict['divergence']['mrad']
-            dmrad = np.mean(np.diff(mrad)) # assuming linear for now...
-            # convert counts per mrad back to counts
-            spec = spec * dmrad
-
+        # integrate, normalise out the /mrad units and sort so that MeV is increasing
         # Units?; if charge is set, it will be fC/MeV
-
-        # let's sort the arrays to make sure MeV is increasing
-        spec = [x for _, x in sorted(zip(MeV, spec))]
-        MeV = sorted(MeV)
+        spec, MeV = result.calib.spectra(result.img, MeV_grid=MeV_grid)
 
         return spec, MeV
     
-    def get_spectra(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None,  debug=False):
+    def get_spectra(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, chunk_size=16, store=None, MeV_grid=None, debug=False):
+        """Spectra for every shot in a timeframe, as a (n_shots, n_MeV) array (and matching MeV axes).
+        Shots are processed in batches with the calibration built once, see get_proc_shots().
+        With MeV_grid (bin centres), every spectrum is rebinned onto that grid, so shots with different
+        calibrations stack into one contiguous array.
+        timeframe can also be a FrameStore of processed frames (see make_frame_store()), and
+        processed frames are written to store if one is passed."""
 
-        shot_dicts = self.DAQ.timeframe_to_shotdict(self.config['name'], timeframe)
         specs = []
         MeVs = []
-        for shot_dict in shot_dicts:
-            spec, MeV = self.get_spectrum(shot_dict)
+        for _, spec, MeV in self.iter_spectra(timeframe, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, MeV_grid=MeV_grid, chunk_size=chunk_size, store=store, debug=debug):
+            spec = np.atleast_2d(spec)
             specs.append(spec)
-            MeVs.append(MeV)
-        return np.array(specs), np.array(MeVs)
+            MeVs.append(np.broadcast_to(MeV, spec.shape))
+        if not specs:
+            return np.array([]), np.array([])
+        return np.concatenate(specs), np.concatenate(MeVs)
+
+    def iter_spectra(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, chunk_size=None, exceptions=None, store=None, MeV_grid=None, debug=False):
+        """Generator version of get_spectra(), yielding one spectrum at a time (or chunks of up to
+        chunk_size spectra), so a timeframe of any length can be processed at constant memory.
+
+        Yields
+        ------
+            shot_dict : dict
+                The shot dictionary (list of shot dictionaries if chunk_size is set).
+            spec : np.ndarray
+                (n_MeV,) spectrum ((n, n_MeV) spectra if chunk_size is set).
+            MeV : np.ndarray
+                The energy axis.
+        """
+        for imgs, calib, chunk_shot_dicts in self.iter_proc_chunks(timeframe, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size or 16, exceptions=exceptions, store=store, debug=debug):
+            specs, MeV = calib.spectra(imgs, MeV_grid=MeV_grid)
+            if chunk_size:
+                yield chunk_shot_dicts, specs, MeV
+            else:
+                for shot_dict, spec in zip(chunk_shot_dicts, specs):
+                    yield shot_dict, spec, MeV
     
-    def get_divs(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None,  debug=False):
-        
-        shot_dicts = self.DAQ.timeframe_to_shotdict(self.config['name'], timeframe)
+    def watch_spectra(self, since=None, calib_id=None, roi_MeV=None, roi_mrad=None, timeout=None, chunk_size=None, debug=False):
+        """Follows the data folder during a run and yields the spectrum of each new shot as it arrives,
+        as iter_spectra(). Only new files are loaded and processed (see DAQ.watch_shot_dicts()), with the
+        cached calibration, so an online monitor keeps up with the shot rate.
+
+        Parameters
+        ----------
+            since : str, optional
+                Timestamp to catch up from; if None, only shots arriving from now are processed.
+            timeout : float, optional
+                Stop after this many seconds without a new shot. Runs until interrupted if None.
+        """
+        for shot_dicts in self.DAQ.watch_shot_dicts(self.config['name'], since=since, timeout=timeout):
+            yield from self.iter_spectra(shot_dicts, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size, debug=debug)
+
+    def get_divs(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, chunk_size=16, store=None, debug=False):
+        """Divergence lineouts for every shot in a timeframe (or FrameStore), as a (n_shots, n_mrad) array (and matching mrad axes)."""
         
         sum_lineouts = []
         mrads = []
-        for shot_dict in shot_dicts:
-            sum_lineout, mrad = self.get_div(shot_dict)
-            sum_lineouts.append(sum_lineout)
-            mrads.append(mrad)
+        for _, sum_lineout, mrad in self.iter_divs(timeframe, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size, store=store, debug=debug):
+            sum_lineouts.extend(sum_lineout)
+            mrads.extend([mrad] * len(sum_lineout))
         return np.array(sum_lineouts), np.array(mrads)
-    
-    def get_mean_and_error(self, timeframe, key="energy"):
+
+    def iter_divs(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, chunk_size=None, exceptions=None, store=None, debug=False):
+        """Generator version of get_divs(), yielding one divergence lineout at a time (or chunks of
+        up to chunk_size lineouts).
+
+        Yields
+        ------
+            shot_dict : dict
+                The shot dictionary (list of shot dictionaries if chunk_size is set).
+            sum_lineout : np.ndarray
+                (n_mrad,) lineout ((n, n_mrad) lineouts if chunk_size is set).
+            mrad : np.ndarray
+                The divergence axis.
+        """
+        for imgs, calib, chunk_shot_dicts in self.iter_proc_chunks(timeframe, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size or 16, exceptions=exceptions, store=store, debug=debug):
+            sum_lineouts, mrad = calib.divs(imgs)
+            if chunk_size:
+                yield chunk_shot_dicts, sum_lineouts, mrad
+            else:
+                for shot_dict, sum_lineout in zip(chunk_shot_dicts, sum_lineouts):
+                    yield shot_dict, sum_lineout, mrad
+
+    def watch_divs(self, since=None, calib_id=None, roi_MeV=None, roi_mrad=None, timeout=None, chunk_size=None, debug=False):
+        """As watch_spectra(), yielding the divergence lineout of each new shot, as iter_divs()."""
+        for shot_dicts in self.DAQ.watch_shot_dicts(self.config['name'], since=since, timeout=timeout):
+            yield from self.iter_divs(shot_dicts, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size, debug=debug)
+
+    def get_mean_and_error(self, timeframe, key="energy", stats=None, chunk_size=16):
+        """Mean, standard deviation and standard error of the spectra (key='energy') or divergence
+        lineouts (key='divergence') in a timeframe. Computed with a running accumulator, so memory
+        does not grow with the number of shots; see get_running_stats()."""
+        stats = self.get_running_stats(timeframe, key=key, stats=stats, chunk_size=chunk_size)
+        return stats.to_dict()
+
+    def get_running_stats(self, timeframe, key="energy", stats=None, chunk_size=16, callback=None):
+        """Add the spectra (key='energy') or divergence lineouts (key='divergence') of a timeframe
+        to a RunningStats accumulator.
+
+        Parameters
+        ----------
+            timeframe : dict or list
+                Shots to add, as for get_spectra().
+            key : str
+                'energy' or 'divergence'.
+            stats : RunningStats, optional
+                Accumulator to add to (e.g. from an earlier call, other worker, or RunningStats.load()).
+                A new one is started if None.
+            chunk_size : int
+                Number of shots processed (and added) at a time.
+            callback : callable, optional
+                Called with the accumulator after each chunk, e.g. to refresh a plot.
+
+        Returns
+        -------
+            stats : RunningStats
+        """
         # or key==divergence
         if key.lower()=="energy":
-            function = self.get_spectra
+            function = self.iter_spectra
         elif key.lower()=="divergence":
-            function = self.get_divs
-
-        
-        y, x = function(timeframe)
-        y_mean = np.mean(y, axis=0)
-        y_std = np.std(y, axis=0)
-        y_stderr = y_std/np.sqrt(y.shape[0])
-        return {"x":x[0], "y_mean":y_mean, "y_std":y_std, "y_stderr":y_stderr}
+            function = self.iter_divs
+        else:
+            raise ValueError(f"get_running_stats() error: key '{key}' not recognised, use 'energy' or 'divergence'")
+
+        if stats is None:
+            stats = RunningStats()
+        for _, y, x in function(timeframe, chunk_size=chunk_size):
+            stats.update_batch(y, x=x)
+            if callback is not None:
+                callback(stats)
+        return stats
     
-    def plot_mean_and_error(self, timeframe, key="energy", color='r'):
+    def plot_mean_and_error(self, timeframe, key="energy", color='r', stats=None, live=False, chunk_size=16):
+        """Plot the mean and standard error of the spectra or divergence lineouts in a timeframe.
+        If live, the plot is redrawn after every chunk of shots while the timeframe is processed.
+        An existing RunningStats accumulator can be passed to add to (or plotted on its own with timeframe=None).
+        """
         # or key==divergence
-        
-        summary_dict=self.get_mean_and_error(timeframe, key)
-        
+        if stats is None:
+            stats = RunningStats()
+
         fig, ax = plt.subplots(1, 1)
-        ax.plot(summary_dict["x"], summary_dict["y_mean"], color=color)
-        ax.fill_between(summary_dict["x"], summary_dict["y_mean"]-summary_dict["y_stderr"], summary_dict["y_mean"]+summary_dict["y_stderr"], alpha=0.3, color=color)
-        ax.set_title(timeframe)
+        artists = {}
+        def draw(stats):
+            summary_dict = stats.to_dict()
+            if summary_dict["y_mean"] is None:
+                return
+            if summary_dict["x"] is None:
+                summary_dict["x"] = np.arange(len(summary_dict["y_mean"]))
+            if 'line' in artists:
+                artists['line'].set_data(summary_dict["x"], summary_dict["y_mean"])
+                artists['band'].remove()
+            else:
+                artists['line'], = ax.plot(summary_dict["x"], summary_dict["y_mean"], color=color)
+            artists['band'] = ax.fill_between(summary_dict["x"], summary_dict["y_mean"]-summary_dict["y_stderr"], summary_dict["y_mean"]+summary_dict["y_stderr"], alpha=0.3, color=color)
+            if live:
+                ax.set_title(f"{timeframe} ({summary_dict['n']} shots)")
+                ax.relim()
+                ax.autoscale_view()
+                fig.canvas.draw_idle()
+                plt.pause(0.001)
+
+        if timeframe is not None:
+            stats = self.get_running_stats(timeframe, key=key, stats=stats, chunk_size=chunk_size, callback=draw if live else None)
+        if not live or timeframe is None:
+            draw(stats)
+        if not live and timeframe is not None:
+            ax.set_title(timeframe)
         
         if key.lower()=="energy":
             if 'charge' in self.calib_dict:
@@ -264,57 +642,93 @@ class ESpec_(Diagnostic):
         if spec is None:
             return None, None, None
 
+        return self.spectrum_metrics(spec, MeV, percentile=percentile, debug=debug)
+
+    def spectrum_metrics(self, spec, MeV, percentile=95, debug=False):
+        """Mean energy, energy spread and energy at percentile of a spectrum (MeV increasing)"""
+        E_means, E_stds, E_percentiles = self.spectra_metrics(np.asarray(spec)[np.newaxis], MeV, percentile=percentile, debug=debug)
+        return E_means[0], E_stds[0], E_percentiles[0]
+
+    def spectra_metrics(self, specs, MeV, percentile=95, debug=False):
+        """Mean energy, energy spread and energy at percentile for a (n_shots, n_MeV) stack of
+        spectra (MeV increasing), computed for the whole stack at once.
+
+        Returns
+        -------
+            E_means, E_stds, E_percentiles : np.ndarray
+                (n_shots,) arrays.
+        """
+        MeV = np.asarray(MeV)
+
         # first apply some smoothing, to reduce noise effects. These details could be passed as options?
-        spec = savgol_filter(spec, int(len(MeV)/50), 2)
+        specs = savgol_filter(np.asarray(specs, dtype=float), int(len(MeV)/50), 2, axis=-1)
 
         # should we do this?
-        spec[spec<0] = 0
+        specs[specs<0] = 0
 
         # ?? normalise spectrum, multiply by energy, then find mean
         #E_mean = np.mean(spec * MeV) / np.mean(spec)
         # following code is taken from GeminiRR21 code
         # normalise distribution by area under, then find mean using under under weighted spectrum?
-        spec_dist = np.abs(spec/np.trapz(spec, MeV))
+        spec_dists = np.abs(specs/np.trapz(specs, MeV, axis=-1)[:, np.newaxis])
         if debug:
             plt.figure()
-            plt.plot(MeV,spec_dist)
+            plt.plot(MeV,spec_dists.T)
             plt.xlabel('Electron Energy [MeV]')
             plt.ylabel('Normalised spectral distribution')
             plt.show(block=False)
-        E_mean = np.abs(np.trapz(spec_dist*MeV, MeV))
-        E_std = np.sqrt(np.abs(np.trapz(spec_dist*(MeV-E_mean)**2, MeV)))
+        E_means = np.abs(np.trapz(spec_dists*MeV, MeV, axis=-1))
+        E_stds = np.sqrt(np.abs(np.trapz(spec_dists*(MeV-E_means[:, np.newaxis])**2, MeV, axis=-1)))
 
         # find last array position over threshold
         # spec_thres = np.max(spec) * ((100-percentile)/100)
         # E_max = np.max(MeV[np.where(spec > spec_thres)])
 
-        # following code is taken from GeminiRR21 code
-        div = 10.0 # resolution of step in scans?
+        # following the GeminiRR21 code; the charge below every div-th energy, working back from the
+        # top of the spectrum until past the target percentile, then interpolated back.
+        # The running integrals come from one cumulative trapezoid pass.
+        div = 10 # resolution of step in scans?
         target_percentile = percentile / 100
-        N = int(len(spec_dist)/div)
-        percentile, energy = np.zeros(N), np.zeros(N)
-        for i in range(0, N):
-            max_index = len(MeV)-1-int(div)*i # work backwards
-            percentile[i] = np.abs(np.trapz(spec_dist[0:max_index], MeV[0:max_index]))
-            energy[i] = MeV[max_index]
-            if percentile[i] < target_percentile-0.05: # are we going past to interpolate back?
-                break
-        percentile_cut = percentile[percentile!=0.0]
-        energy_cut = energy[percentile!=0.0]
-        energy_cut = energy_cut[percentile_cut<0.999]
-        percentile_cut = percentile_cut[percentile_cut<0.999]
+        N = int(len(MeV)/div)
+        cum_trapz = np.zeros(np.shape(spec_dists))
+        cum_trapz[:, 1:] = np.cumsum(np.diff(MeV) * (spec_dists[:, 1:] + spec_dists[:, :-1]) / 2, axis=-1)
+        max_indexes = len(MeV) - 1 - div*np.arange(N) # work backwards
+        percentiles = np.abs(cum_trapz[:, np.maximum(max_indexes - 1, 0)]) # integral up to (not including) max_index
+        energies = MeV[max_indexes]
+
+        # only keep steps until (and including) the first one past the target
+        past_target = percentiles < target_percentile-0.05 # are we going past to interpolate back?
+        last_steps = np.where(past_target.any(axis=-1), np.argmax(past_target, axis=-1), N-1)
+        keep = (np.arange(N) <= last_steps[:, np.newaxis]) & (percentiles != 0.0) & (percentiles < 0.999)
+
+        # reversed, the steps go up in energy and the percentiles never fall (the spectra are >= 0)
+        percentiles, energies, keep = percentiles[:, ::-1], energies[::-1], keep[:, ::-1]
+        if not keep.any(axis=-1).all():
+            raise ValueError(f"spectra_metrics: no energy steps left to find the {percentile}th percentile "
+                             f"of spectra {np.flatnonzero(~keep.any(axis=-1)).tolist()}")
         if debug:
-            plt.figure()
-            plt.plot(percentile_cut,energy_cut)
-            plt.xlabel('Percentile of total counts')
-            plt.xlabel('Electron Energy [MeV]')
-            plt.show(block=False)
-        # interpolate back to answer at exact percentile. interp needs sorted arrays!
-        energy_cut = [x for _, x in sorted(zip(percentile_cut, energy_cut))]
-        percentile_cut = sorted(percentile_cut)
-        E_percentile = np.interp(target_percentile, percentile_cut, energy_cut)
-
-        return E_mean, E_std, E_percentile 
+            for i in range(len(spec_dists)):
+                plt.figure()
+                plt.plot(percentiles[i, keep[i]], energies[keep[i]])
+                plt.xlabel('Percentile of total counts')
+                plt.xlabel('Electron Energy [MeV]')
+                plt.show(block=False)
+
+        # interpolate back to the exact percentile, for every spectrum at once (as np.interp per
+        # spectrum): between the last kept step at or below the target and the first above it. Where
+        # the spectrum is flat, steps have equal percentiles; the interpolation then starts from the
+        # highest energy of the flat stretch and ends at the lowest, so ties are resolved by energy
+        below = keep & (percentiles <= target_percentile)
+        above = keep & (percentiles > target_percentile)
+        has_below, has_above = below.any(axis=-1), above.any(axis=-1)
+        lo = np.where(has_below, N - 1 - np.argmax(below[:, ::-1], axis=-1), np.argmax(above, axis=-1))
+        hi = np.where(has_above, np.argmax(above, axis=-1), lo)
+        rows = np.arange(len(spec_dists))
+        p_lo, p_hi = percentiles[rows, lo], percentiles[rows, hi]
+        fraction = np.divide(target_percentile - p_lo, p_hi - p_lo, out=np.zeros(len(rows)), where=hi != lo)
+        E_percentiles = energies[lo] + fraction * (energies[hi] - energies[lo])
+
+        return E_means, E_stds, E_percentiles 
     
     # def mean_and_std_beam_energy(self,img_raw):
     #     """ Gets mean and std of electron energy. Returns electron energy at 90th percentile of charge distribution.
@@ -342,63 +756,107 @@ class ESpec_(Diagnostic):
     #     energy_at_90th_percentile=np.interp(target_percentile, percentile_cut, energy_cut)
     #     return np.array([mean_energy, variance**0.5, energy_at_90th_percentile])
     
-    def get_spectra_metrics(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, percentile=95, debug=False):
-        """"""
-        shot_dicts = self.DAQ.get_shot_dicts(self.config['name'],timeframe)
-        E_means = []
-        E_stds = []
-        E_percentiles = []
-        E_charges = []
-        for shot_dict in shot_dicts:
-            E_mean, E_std, E_percentile = self.get_spectrum_metrics(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, percentile=percentile, debug=debug)
-            E_means.append(E_mean)
-            E_stds.append(E_std)
-            E_percentiles.append(E_percentile)
-            if 'charge' in self.calib_dict:
-                E_charge = self.get_charge(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
-            else:
-                E_charge = 0
-            E_charges.append(E_charge)
+    def get_spectra_metrics(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, percentile=95, chunk_size=16, metrics_store=None, debug=False):
+        """Spectrum metrics and charge for every shot in a timeframe (or FrameStore). Each shot is processed once, in batches.
+
+        With a MetricsStore (passed, or [cache] espec_metrics = true) the results are saved per shot,
+        and only shots missing from the store for this calibration, ROI, percentile and code version
+        (see metrics_version()) are processed.
+
+        Returns
+        -------
+            E_means, E_stds, E_percentiles, E_charges : list
+        """
+        if metrics_store is None:
+            metrics_store = self.metrics_store
+        shot_dicts = None
+        if metrics_store is not None and not isinstance(timeframe, FrameStore):
+            shot_dicts = self.DAQ.get_shot_dicts(self.config['name'], timeframe)
+            if not all(isinstance(shot_dict, dict) and 'timestamp' in shot_dict for shot_dict in shot_dicts):
+                shot_dicts = None # rows are keyed on timestamps
+
+        if shot_dicts is None:
+            chunks = list(self.iter_spectra_metrics(timeframe, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, percentile=percentile, chunk_size=chunk_size, debug=debug))
+            if not chunks:
+                return [], [], [], []
+            rows = pd.concat(chunks, ignore_index=True)
+            return rows['E_mean'].tolist(), rows['E_std'].tolist(), rows['E_percentile'].tolist(), rows['charge'].tolist()
+
+        timestamps = [str(shot_dict['timestamp'][0]) for shot_dict in shot_dicts]
+        if not timestamps:
+            return [], [], [], []
+        version = self.metrics_version(calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, percentile=percentile)
+        stored = metrics_store.read(self.config['name'], timeframe=[min(timestamps), max(timestamps)], version=version)
+        stored_timestamps = set(stored['timestamp'])
+        missing = [shot_dict for shot_dict, timestamp in zip(shot_dicts, timestamps) if timestamp not in stored_timestamps]
+
+        new_rows = []
+        if missing:
+            for rows in self.iter_spectra_metrics(missing, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, percentile=percentile, chunk_size=chunk_size, debug=debug):
+                rows['version'] = version
+                new_rows.append(rows)
+            if new_rows:
+                new_rows = pd.concat(new_rows, ignore_index=True)
+                metrics_store.append(new_rows)
+                new_rows = [new_rows]
+            if debug:
+                print(f"get_spectra_metrics: processed {len(missing)} new shots, {len(stored)} from the metrics store")
+
+        rows = pd.concat([stored] + new_rows, ignore_index=True).drop_duplicates(subset='timestamp', keep='last').set_index('timestamp')
+        rows = rows.loc[[timestamp for timestamp in timestamps if timestamp in rows.index]]
+        return rows['E_mean'].tolist(), rows['E_std'].tolist(), rows['E_percentile'].tolist(), rows['charge'].tolist()
+
+    def iter_spectra_metrics(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, percentile=95, chunk_size=16, debug=False):
+        """Generator of the spectrum metrics and charge of a timeframe, one pd.DataFrame per chunk of shots,
+        with the columns of a MetricsStore row ('timestamp', 'diag', 'calib_id', 'percentile', 'E_mean',
+        'E_std', 'E_percentile', 'charge')."""
+        for imgs, calib, chunk_shot_dicts in self.iter_proc_chunks(timeframe, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size, debug=debug):
+            specs, MeV = calib.spectra(imgs)
+            E_mean, E_std, E_percentile = self.spectra_metrics(specs, MeV, percentile=percentile, debug=debug)
+            timestamps = [str(shot_dict['timestamp'][0]) if isinstance(shot_dict, dict) and 'timestamp' in shot_dict else str(shot_dict)
+                          for shot_dict in chunk_shot_dicts]
+            yield pd.DataFrame({
+                'timestamp': timestamps,
+                'diag': self.config['name'],
+                'calib_id': str(calib_id or calib.calib_id or ''),
+                'percentile': float(percentile),
+                'E_mean': np.asarray(E_mean, dtype=float),
+                'E_std': np.asarray(E_std, dtype=float),
+                'E_percentile': np.asarray(E_percentile, dtype=float),
+                # no charge calibration gives zeros
+                'charge': np.asarray(calib.charges(imgs), dtype=float),
+            })
+
+    def metrics_version(self, calib_id=None, roi_MeV=None, roi_mrad=None, percentile=95):
+        """Hash of everything the spectrum metrics depend on besides the shot: the metrics code
+        version, calibration file contents, calib_id, ROIs and percentile. Stored with each
+        MetricsStore row, so changed calibrations or code give new rows rather than stale ones."""
+        key = hashlib.sha1()
+        key.update(str(METRICS_VERSION).encode())
+        key.update(self.calib_files_hash([self.config.get('calib_file'), calib_id]).encode())
+        key.update(repr((calib_id, roi_MeV, roi_mrad, float(percentile), self.calib_dict_fixed)).encode())
+        return key.hexdigest()[:16]
 
-        return E_means, E_stds, E_percentiles, E_charges
-    
     def get_div(self, shot_dict, calib_id=None, roi_MeV=None,  roi_mrad=None, debug=False):
         """Currently integrating across the spatial axis. Could be something more involved?"""
-        img, x, y = self.get_proc_shot(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
-        if img is None:
+        result = self.process_shot(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
+        if result is None:
             return None, None
-        if 'axis' in  self.calib_dict['divergence'] and self.calib_dict['divergence']['axis'].lower() == 'x':
-            mrad = x
-            sum_lineout = np.sum(img, 0)
-        else:
-            mrad = y
-            sum_lineout = np.sum(img, 1)
+        sum_lineout, mrad = result.calib.divs(result.img)
         return sum_lineout, mrad
     
     def get_div_FWHM(self, shot_dict, calib_id=None, roi_MeV=None, roi_mrad=None, debug=False):
-        # TODO: write library function to find FWHM from lineout
-        def FWHM(X,Y):
-            half_max = max(Y) / 2.
-            #find when function crosses line half_max (when sign of diff flips)
-            #take the 'derivative' of signum(half_max - Y[])
-            d = np.sign(half_max - np.array(Y[0:-1])) - np.sign(half_max - np.array(Y[1:]))
-            #plot(X[0:len(d)],d) #if you are interested
-            #find the left and right most indexes
-            left_idx = np.where(d > 0)[0]
-            right_idx = np.where(d < 0)[-1]
-            fwhm = X[right_idx] - X[left_idx] #return the difference (full width)
-            return fwhm[0] #return the difference (full width)
+        """FWHM (interpolated between pixels) and peak location of the smoothed divergence lineout, see lineout_metrics().
+        The FWHM is that of the highest peak; before lineout_metrics() it was that of the leftmost region above half maximum."""
         # TODO: Return Error estimate as well
         lineout, mrad = self.get_div(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
         if lineout is None:
             return None, None
-        lineout_smoothed = savgol_filter(lineout, int(len(mrad)/10), 2)
-        peak_location_i = np.argmax(lineout_smoothed)
-        peak_location = mrad[peak_location_i]
+        metrics = lineout_metrics(lineout, mrad, window=int(len(mrad)/10))
         if debug:
             plt.figure()
             plt.plot(mrad, lineout, label='Raw')
-            plt.plot(mrad, lineout_smoothed, label='Smoothed')
+            plt.plot(mrad, metrics['smoothed'][0], label='Smoothed')
             plt.title(shot_dict)
             plt.xlabel('mrad') 
             plt.ylabel('fc/mrad')
@@ -406,7 +864,24 @@ class ESpec_(Diagnostic):
             plt.legend()
             plt.show(block=False)
 
-        return FWHM(mrad, lineout_smoothed), peak_location
+        return metrics['fwhm'][0], metrics['peak'][0]
+
+    def get_divs_metrics(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, chunk_size=16, debug=False):
+        """Divergence metrics for every shot in a timeframe, computed a chunk of lineouts at a time.
+
+        Returns
+        -------
+            fwhms, peaks, centroids, rms_widths : np.ndarray
+                (n_shots,) arrays in mrad, see lineout_metrics().
+        """
+        fwhms, peaks, centroids, rms_widths = [], [], [], []
+        for _, lineouts, mrad in self.iter_divs(timeframe, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, chunk_size=chunk_size, debug=debug):
+            metrics = lineout_metrics(lineouts, mrad, window=int(len(mrad)/10))
+            fwhms.extend(metrics['fwhm'])
+            peaks.extend(metrics['peak'])
+            centroids.extend(metrics['centroid'])
+            rms_widths.extend(metrics['rms'])
+        return np.array(fwhms), np.array(peaks), np.array(centroids), np.array(rms_widths)
     
     def get_charge(self, shot_dict, calib_id=None, roi_MeV=None, roi_mrad=None, debug=False):
         """Integrate and return total charge (pC)"""
@@ -418,34 +893,12 @@ class ESpec_(Diagnostic):
             print('No charge calibration set')
             return False
 
-        img, x, y = self.get_proc_shot(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
-        if img is None:
+        result = self.process_shot(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
+        if result is None:
             return None
 
-        # we have to unfold count changes again for dMeV and dmrad
-        if 'axis' in self.calib_dict['dispersion'] and self.calib_dict['dispersion']['axis'].lower() == 'y':
-            # not tested??
-            MeV = y
-            dMeV = abs(np.gradient(MeV)) # gradient is like diff, but calculates as average of differences either side
-            dMeV_matrix = np.transpose(np.tile(dMeV, (len(x),1))) # len(y)??
-        else:
-            MeV = x
-            dMeV = abs(np.gradient(MeV)) # gradient is like diff, but calculates as average of differences either side
-            dMeV_matrix = np.tile(dMeV, (len(y),1))
-        # convert from counts per MeV to counts
-        img_res = img * dMeV_matrix
-        # we have to unfold count changes again for dMeV and dmrad
-        if 'axis' in self.calib_dict['divergence'] and self.calib_dict['divergence']['axis'].lower() == 'x':
-            mrad = x
-            dmrad = np.mean(np.diff(mrad)) # assuming linear for now...
-        else:
-            mrad = y
-            dmrad = np.mean(np.diff(mrad)) # assuming linear for now...
-        # convert counts per mrad back to counts
-        img_res = img_res * dmrad
-
-         # return pC, not fC
-        charge = np.sum(img_res) / 1000
+        # unfold count changes again for dMeV and dmrad, return pC
+        charge = result.calib.charges(result.img)
         return charge
 
     def make_dispersion(self, disp_dict, debug=False):
@@ -551,26 +1004,21 @@ class ESpec_(Diagnostic):
         MeV = disp_dict['MeV']
         dMeV = abs(np.gradient(MeV)) # gradient is like diff, but calculates as average of differences either side
 
+        # convert from counts to counts per MeV, with a 1D weight broadcast along the dispersion axis
         if disp_dict['axis'] == 'x':
             self.x_MeV = MeV
-            dMeV_matrix = np.tile(dMeV, (len(self.y_mm),1))
             dxmm = abs(np.gradient(self.x_mm))
-            dxmm_matrix = np.tile(dxmm, (len(self.y_mm),1))
-            img_data = img_data*dxmm_matrix 
+            weight = (dxmm / dMeV)[np.newaxis, :]
         elif disp_dict['axis'] == 'y':
             self.y_MeV = MeV
-            dMeV_matrix = np.transpose(np.tile(dMeV, (len(self.x_mm),1)))
             dymm = abs(np.gradient(self.y_mm))
-            dymm_matrix = np.tile(dymm, (len(self.x_mm),1))
-            img_data = img_data*dymm_matrix 
-        
-#         print("dMeV_matrix=%s"%dMeV_matrix)
-        # convert from counts to counts per MeV
-        img_data = img_data / dMeV_matrix
+            weight = (dymm / dMeV)[:, np.newaxis]
         
         if "angle to normal (rad)" in disp_dict:
             print("correct angle")
-            img_data=img_data/np.cos(disp_dict["angle (mrad)"]*1e-3)
+            weight = weight / np.cos(disp_dict["angle (mrad)"]*1e-3)
+
+        img_data = img_data * weight
 
         if '/MeV' not in self.img_units:
             self.img_units.append('/MeV')
@@ -745,7 +1193,9 @@ class ESpec_(Diagnostic):
     # ------------------------------------------------------ #
 
     def montage(self, timeframe, calib_id=None, roi_MeV=None, roi_mrad=None, x_downsample=1, y_downsample=1, exceptions=None, vmin=None, vmax=None, transpose=True, num_rows=1, debug=False):
-        """Wrapper for diagnostic make_montage() function, mainly to set axis"""
+        """Wrapper for diagnostic make_montage() function, mainly to set axis.
+        The processed images go through a memory-mapped FrameStore (see make_frame_store()),
+        so timeframe can also be an existing store."""
 
         if calib_id:
             self.calib_dict = self.get_calib(calib_id)
@@ -754,47 +1204,51 @@ class ESpec_(Diagnostic):
         #     print('Missing Calibration before using Montage... Please set using set_calib(calib_id), or pass calib_id')
         #     return False
         
-        # calling 'universal' DAQ function here, that is probably DAQ specific
-        shot_dicts = self.DAQ.get_shot_dicts(self.config['name'],timeframe,exceptions=exceptions)
-
-        shot_labels = []
-        for shot_dict in shot_dicts:
-
-            img, x, y = self.get_proc_shot(shot_dict, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, debug=debug)
-
-            if 'images' in locals():
-                images = np.concatenate((images, np.atleast_3d(img)), axis=2)
-            else:
-                images = np.atleast_3d(img)
-
-            # try build a shot label
-            if 'burst' in shot_dict:
-                m = re.search(r'\d+$', str(shot_dict['burst'])) # gets last numbers
-                burst = int(m.group())
-                burst_str = str(burst) + '|'
-            else:
-                burst_str = ''
-            if 'shotnum' in shot_dict:
-                shot_str = str(shot_dict['shotnum'])
-            else:
-                shot_str = ''
-
-            shot_labels.append(burst_str + shot_str)
-
-        if 'dispersion' in self.calib_dict:
-            axis_label = r'$E$ [MeV]'
-            if 'axis' in self.calib_dict['dispersion'] and self.calib_dict['dispersion']['axis'].lower() == 'y':
-                axis = y
-            else:
-                axis = x
+        if isinstance(timeframe, FrameStore):
+            store = timeframe
+            temp_store = False
         else:
-            axis = x # default??
-            axis_label = 'mm?'
+            store = self.make_frame_store(timeframe, calib_id=calib_id, roi_MeV=roi_MeV, roi_mrad=roi_mrad, exceptions=exceptions, debug=debug)
+            temp_store = True
+        try:
+            calib = store.calib
+
+            shot_labels = []
+            for shot_dict in store.shot_dicts:
+                # try build a shot label
+                if 'burst' in shot_dict:
+                    m = re.search(r'\d+$', str(shot_dict['burst'])) # gets last numbers
+                    burst = int(m.group())
+                    burst_str = str(burst) + '|'
+                else:
+                    burst_str = ''
+                if 'shotnum' in shot_dict:
+                    shot_str = str(shot_dict['shotnum'])
+                else:
+                    shot_str = ''
 
-        cb_label = self.make_units(self.img_units)
+                shot_labels.append(burst_str + shot_str)
 
-        fig, ax = plot_montage(images, axis=axis, x_downsample=x_downsample, y_downsample=y_downsample, title=self.shot_string(timeframe), 
-                               vmin=vmin, vmax=vmax, transpose=transpose, cb_label=cb_label, y_label=axis_label, num_rows=num_rows, shot_labels=shot_labels)
+            if calib.disp_axis is not None:
+                axis_label = r'$E$ [MeV]'
+                if calib.disp_axis == 'y':
+                    axis = calib.y
+                else:
+                    axis = calib.x
+            else:
+                axis = calib.x # default??
+                axis_label = 'mm?'
+
+            cb_label = self.make_units(calib.units)
+
+            # (n_shots, ny, nx) store to the (ny, nx, n_shots) montage layout, without copying
+            images = np.moveaxis(store.frames, 0, -1)
+            fig, ax = plot_montage(images, axis=axis, x_downsample=x_downsample, y_downsample=y_downsample, title=self.shot_string(timeframe) if temp_store else '', 
+                                   vmin=vmin, vmax=vmax, transpose=transpose, cb_label=cb_label, y_label=axis_label, num_rows=num_rows, shot_labels=shot_labels)
+        finally:
+            if temp_store:
+                images = None
+                store.delete()
 
         return fig, ax
 
@@ -0,0 +1,421 @@
+import os
+import logging
+from pathlib import Path
+from collections import OrderedDict, namedtuple
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# a processed image with its axes, units and the calibration used, see process_frame()
+ProcResult = namedtuple('ProcResult', ['img', 'x', 'y', 'units', 'calib'])
+
+
+def roi_selection(axis, vmin, vmax, inclusive=True):
+    """Pixels of an axis with values in [vmin, vmax] (or (vmin, vmax) if not inclusive).
+
+    For monotonic axes (the usual MeV and mrad axes) the ROI is found with searchsorted
+    and returned as a slice, so cropping gives a view rather than a copy. Otherwise
+    (e.g. NaNs outside the dispersion range) the matching indices are returned.
+    """
+    axis = np.asarray(axis)
+    diffs = np.diff(axis)
+    if np.all(diffs > 0):
+        sorted_axis, flipped = axis, False
+    elif np.all(diffs < 0):
+        sorted_axis, flipped = axis[::-1], True
+    else:
+        if inclusive:
+            return np.flatnonzero((axis >= vmin) & (axis <= vmax))
+        return np.flatnonzero((axis > vmin) & (axis < vmax))
+
+    if inclusive:
+        start = np.searchsorted(sorted_axis, vmin, side='left')
+        stop = np.searchsorted(sorted_axis, vmax, side='right')
+    else:
+        start = np.searchsorted(sorted_axis, vmin, side='right')
+        stop = np.searchsorted(sorted_axis, vmax, side='left')
+    stop = max(start, stop)
+
+    if flipped:
+        return slice(int(len(axis) - stop), int(len(axis) - start))
+    return slice(int(start), int(stop))
+
+
+def as_slice(idx):
+    """Index array to an equivalent slice if the indices are contiguous, otherwise unchanged"""
+    if isinstance(idx, slice):
+        return idx
+    idx = np.asarray(idx)
+    if idx.ndim == 1 and len(idx) > 0 and np.all(np.diff(idx) == 1):
+        return slice(int(idx[0]), int(idx[-1]) + 1)
+    return idx
+
+
+def sort_order(axis):
+    """Permutation sorting an axis into increasing order: a slice for monotonic axes
+    (so sorting is a view), otherwise a stable argsort."""
+    axis = np.asarray(axis)
+    diffs = np.diff(axis)
+    if np.all(diffs >= 0):
+        return slice(None)
+    if np.all(diffs <= 0):
+        return slice(None, None, -1)
+    return np.argsort(axis, kind='stable')
+
+
+def bin_edges(centres):
+    """Bin edges halfway between (increasing) bin centres, with the end bins mirrored"""
+    centres = np.asarray(centres, dtype=float)
+    mids = (centres[1:] + centres[:-1]) / 2
+    return np.concatenate([[2*centres[0] - mids[0]], mids, [2*centres[-1] - mids[-1]]])
+
+
+def rebin_matrix(x, x_new):
+    """Sparse (len(x), len(x_new)) matrix R rebinning densities (e.g. fC/MeV) sampled on bins centred
+    on x onto bins centred on x_new, conserving the integral: y_new = y @ R. Both axes increasing.
+    Each entry is the overlap of an old and a new bin over the width of the new bin."""
+    edges, new_edges = bin_edges(x), bin_edges(x_new)
+    # split the common range at every edge; each piece is in exactly one old and one new bin
+    cuts = np.union1d(edges, new_edges)
+    cuts = cuts[(cuts >= max(edges[0], new_edges[0])) & (cuts <= min(edges[-1], new_edges[-1]))]
+    if len(cuts) < 2:
+        return sparse.csr_matrix((len(edges) - 1, len(new_edges) - 1))
+    mids = (cuts[1:] + cuts[:-1]) / 2
+    i = np.searchsorted(edges, mids) - 1
+    j = np.searchsorted(new_edges, mids) - 1
+    values = np.diff(cuts) / np.diff(new_edges)[j]
+    return sparse.csr_matrix((values, (i, j)), shape=(len(edges) - 1, len(new_edges) - 1))
+
+
+def process_frame(frame, calib, in_place=False):
+    """Process one frame (after run_img_calib) with a precompiled calibration. Only reads its
+    arguments, so frames can be processed from several threads at once.
+
+    Parameters
+    ----------
+        frame : np.ndarray
+            (ny, nx) image, or a (n_shots, ny, nx) stack.
+        calib : ESpecCalib
+            The calibration, see ESpec_.get_proc_calib().
+        in_place : bool
+            Allow the frame to be overwritten, see ESpecCalib.process().
+
+    Returns
+    -------
+        result : ProcResult
+            (img, x, y, units, calib).
+    """
+    img = calib.process(frame, in_place=in_place)
+    return ProcResult(img, calib.x, calib.y, calib.units, calib)
+
+
+class ESpecCalib():
+    """Precompiled ESpec calibration for one calibration, image geometry (transformed x/y axes) and ROI.
+
+    Holds everything ESpec_.get_proc_shot() works out from the calibration dictionary
+    (dispersion, divergence, ROI selection, charge factor), so it can be applied to a
+    single frame or a whole stack of frames at once. Built by ESpec_.make_proc_calib(),
+    and read-only once built so it can be shared through ESpecCalibCache.
+
+    Processed images are raw * (y_weight outer x_weight) * scale, cropped to y_idx, x_idx.
+    Contiguous ROIs are held as slices, so the crop is a view of the raw frames.
+    """
+
+    __version = 0.2
+
+    # worked out in __init__, not saved
+    _derived = ['y_factor', 'x_factor', 'y_charge_factor', 'x_charge_factor', 'MeV_order', 'MeV_sorted', '_rebin_matrices', '_frozen']
+
+    def __init__(self, shape, x_idx, y_idx, x_weight, y_weight, scale, x, y, x_mm, y_mm,
+                 disp_axis=None, MeV=None, div_axis=None, mrad=None, dmrad=None, fC_per_count=None, calib_id=None):
+        """
+        Parameters
+        ----------
+            shape : tuple
+                (ny, nx) of the frames (after run_img_calib) this calibration applies to.
+            x_idx, y_idx : slice or np.ndarray
+                Pixels kept by the MeV/mrad ROIs along each axis.
+            x_weight, y_weight : np.ndarray
+                Per-pixel weights along each (uncropped) axis, e.g. dmm/dMeV for dispersion.
+            scale : float
+                Scalar factor applied to the whole image (1/dmrad, fC_per_count).
+            x, y : np.ndarray
+                Axes of the processed image (MeV, mrad or mm).
+            x_mm, y_mm : np.ndarray
+                Spatial axes of the processed image.
+            disp_axis, div_axis : str
+                'x' or 'y', or None if no dispersion/divergence calibration.
+            MeV, mrad : np.ndarray
+                Energy and angle axes after the ROI.
+            dmrad : float
+                Mean mrad step of the full divergence axis, as used by apply_divergence().
+            fC_per_count : float
+                Charge calibration, or None.
+            calib_id : str, optional
+                The calibration id this was built for, for labelling results.
+        """
+        self.shape = tuple(int(n) for n in shape)
+        self.x_idx = as_slice(x_idx)
+        self.y_idx = as_slice(y_idx)
+        self.x_weight = x_weight
+        self.y_weight = y_weight
+        self.scale = float(scale)
+        self.x = x
+        self.y = y
+        self.x_mm = x_mm
+        self.y_mm = y_mm
+        self.disp_axis = disp_axis
+        self.MeV = MeV
+        self.div_axis = div_axis
+        self.mrad = mrad
+        self.dmrad = dmrad
+        self.fC_per_count = fC_per_count
+        self.calib_id = calib_id
+
+        # separable weight map over the ROI, (y_factor outer x_factor), never built as a full image
+        self.y_factor = self.y_weight[self.y_idx] * self.scale
+        self.x_factor = self.x_weight[self.x_idx]
+
+        # charge integration as a weighted sum, unfolding the /MeV and /mrad units again (pC)
+        charge_factors = {'x': np.ones(len(self.x)), 'y': np.ones(len(self.y))}
+        if self.disp_axis is not None:
+            charge_factors[self.disp_axis] = np.abs(np.gradient(self.MeV))
+        charge_scale = 1 / 1000
+        if self.div_axis is not None:
+            charge_scale = charge_scale * np.mean(np.diff(self.mrad))
+        self.y_charge_factor = charge_factors['y'] * charge_scale
+        self.x_charge_factor = charge_factors['x']
+
+        # spectra are returned with MeV increasing; the permutation is worked out once here
+        if self.MeV is not None:
+            self.MeV_order = sort_order(self.MeV)
+            self.MeV_sorted = np.asarray(self.MeV)[self.MeV_order]
+        else:
+            self.MeV_order, self.MeV_sorted = None, None
+        self._rebin_matrices = {} # MeV grid: sparse rebin matrix, see rebin_matrix()
+
+        # freeze; calibrations are shared between calls through the cache
+        for name, value in self.__dict__.items():
+            if isinstance(value, np.ndarray):
+                value = np.array(value)
+                value.setflags(write=False)
+                self.__dict__[name] = value
+        self._frozen = True
+        return
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError(f"ESpecCalib is read-only; cannot set '{name}'")
+        super().__setattr__(name, value)
+
+    def save(self, filepath):
+        """Save to a .npz file (no pickling), see ESpecCalib.load()"""
+        arrays = {k: v for k, v in self.__dict__.items() if k not in self._derived and v is not None}
+        arrays['x_idx'] = np.arange(self.shape[1])[self.x_idx]
+        arrays['y_idx'] = np.arange(self.shape[0])[self.y_idx]
+        np.savez(filepath, **arrays)
+        return
+
+    @classmethod
+    def load(cls, filepath):
+        """Load a calibration saved with ESpecCalib.save()"""
+        with np.load(filepath) as saved:
+            kwargs = {k: saved[k] for k in saved.files}
+        for k in ['disp_axis', 'div_axis', 'calib_id']:
+            if k in kwargs:
+                kwargs[k] = str(kwargs[k])
+        for k in ['dmrad', 'fC_per_count', 'scale']:
+            if k in kwargs:
+                kwargs[k] = float(kwargs[k])
+        return cls(**kwargs)
+
+    @property
+    def units(self):
+        """Units of the processed image, e.g. ['fC', '/MeV', '/mrad']"""
+        units = ['Counts' if self.fC_per_count is None else 'fC']
+        if self.disp_axis is not None:
+            units.append('/MeV')
+        if self.div_axis is not None:
+            units.append('/mrad')
+        return units
+
+    def process(self, frames, out=None, in_place=False):
+        """Apply dispersion, divergence, ROIs and charge calibration to a stack of frames.
+        The weights are applied by broadcasting the separable 1D factors, without building
+        image-sized weight arrays.
+
+        Parameters
+        ----------
+            frames : np.ndarray
+                (n_shots, ny, nx) stack of images from run_img_calib(), or a single (ny, nx) image.
+            out : np.ndarray, optional
+                Array of the output shape to write the processed images to.
+            in_place : bool
+                Overwrite the ROI of frames with the processed images (and return a view of it),
+                avoiding any new image allocation. Only for frames that are not needed afterwards.
+
+        Returns
+        -------
+            imgs : np.ndarray
+                (n_shots, len(y), len(x)) processed images (or (len(y), len(x)) for a single image).
+        """
+        if not in_place:
+            frames = np.asarray(frames)
+        if frames.shape[-2:] != self.shape:
+            raise ValueError(f"ESpecCalib: frame shape {frames.shape[-2:]} does not match calibration shape {self.shape}")
+
+        # views if the ROIs are slices
+        imgs = frames[..., self.y_idx, :][..., self.x_idx]
+        # work in place on the crop if it is already a copy (index array ROIs), or if allowed
+        if out is None and np.issubdtype(imgs.dtype, np.floating) and (in_place or not np.shares_memory(imgs, frames)):
+            out = imgs
+        imgs = np.multiply(imgs, self.y_factor[:, np.newaxis], out=out)
+        imgs *= self.x_factor
+        return imgs
+
+    def spectra(self, imgs, MeV_grid=None):
+        """Integrate processed images across the non-dispersive axis, as ESpec_.get_spectrum().
+
+        Parameters
+        ----------
+            imgs : np.ndarray
+                (n_shots, ny, nx) processed images, or a single (ny, nx) image.
+            MeV_grid : np.ndarray, optional
+                Increasing (e.g. uniform) MeV bin centres to rebin the spectra onto, conserving
+                charge, so spectra from different calibrations can be stacked and compared.
+
+        Returns
+        -------
+            specs : np.ndarray
+                (n_shots, n_MeV) spectra, with MeV increasing.
+            MeV : np.ndarray
+                The sorted energy axis (or MeV_grid).
+        """
+        if self.disp_axis == 'y':
+            specs = np.sum(imgs, axis=-1)
+        else:
+            specs = np.sum(imgs, axis=-2)
+
+        # normalise out the /mrad units
+        if self.div_axis is not None:
+            specs = specs * self.dmrad
+
+        specs = specs[..., self.MeV_order]
+        if MeV_grid is None:
+            return specs, self.MeV_sorted
+
+        MeV_grid = np.asarray(MeV_grid, dtype=float)
+        flat_specs = specs.reshape(-1, specs.shape[-1])
+        rebinned = np.asarray(self.rebin_matrix(MeV_grid).T.dot(flat_specs.T)).T
+        return np.ascontiguousarray(rebinned).reshape(specs.shape[:-1] + (len(MeV_grid),)), MeV_grid
+
+    def rebin_matrix(self, MeV_grid):
+        """Sparse matrix taking this calibration's (sorted) spectra onto MeV_grid, see rebin_matrix().
+        Built once per grid and kept with the calibration."""
+        MeV_grid = np.asarray(MeV_grid, dtype=float)
+        key = MeV_grid.tobytes()
+        if key not in self._rebin_matrices:
+            self._rebin_matrices[key] = rebin_matrix(self.MeV_sorted, MeV_grid)
+        return self._rebin_matrices[key]
+
+    def divs(self, imgs):
+        """Integrate processed images across the spatial axis, as ESpec_.get_div().
+
+        Returns
+        -------
+            lineouts : np.ndarray
+                (n_shots, n_mrad) divergence lineouts.
+            mrad : np.ndarray
+                The divergence axis.
+        """
+        if self.div_axis == 'x':
+            lineouts = np.sum(imgs, axis=-2)
+        else:
+            lineouts = np.sum(imgs, axis=-1)
+        return lineouts, self.mrad
+
+    def charges(self, imgs):
+        """Total charge (pC) of processed images, as ESpec_.get_charge().
+
+        Returns
+        -------
+            charges : np.ndarray
+                (n_shots,) charge per shot.
+        """
+        if self.fC_per_count is None:
+            return np.zeros(np.shape(imgs)[:-2])
+
+        # weighted sum over both axes
+        return np.matmul(np.matmul(imgs, self.x_charge_factor), self.y_charge_factor)
+
+
+class ESpecCalibCache():
+    """LRU cache of ESpecCalib objects, with an optional on-disk tier.
+
+    Keys should identify everything a calibration is built from (calibration file
+    contents, calib_id, image axes, ROI, apply flags); see ESpec_.get_proc_calib().
+    """
+
+    __version = 0.1
+
+    def __init__(self, maxsize=16, cache_folder=None):
+        """
+        Parameters
+        ----------
+            maxsize : int
+                Number of calibrations kept in memory.
+            cache_folder : str or Path, optional
+                Folder to persist calibrations in. If None, they are kept in memory only.
+        """
+        self.maxsize = maxsize
+        self.cache_folder = Path(cache_folder) if cache_folder is not None else None
+        self._calibs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def get(self, key):
+        """Return the cached ESpecCalib for key (a hex string), or None"""
+        if key in self._calibs:
+            self._calibs.move_to_end(key)
+            self.hits += 1
+            return self._calibs[key]
+
+        if self.cache_folder is not None:
+            filepath = self.cache_folder / f"{key}.npz"
+            if filepath.is_file():
+                try:
+                    calib = ESpecCalib.load(filepath)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"ESpecCalibCache: could not read {filepath}: {e}")
+                else:
+                    self.hits += 1
+                    self._add(key, calib)
+                    return calib
+
+        self.misses += 1
+        return None
+
+    def put(self, key, calib):
+        self._add(key, calib)
+        if self.cache_folder is not None:
+            try:
+                os.makedirs(self.cache_folder, exist_ok=True)
+                tmp_filepath = self.cache_folder / f"{key}.tmp.npz"
+                calib.save(tmp_filepath)
+                os.replace(tmp_filepath, self.cache_folder / f"{key}.npz")
+            except OSError as e:
+                logger.warning(f"ESpecCalibCache: could not save calibration to {self.cache_folder}: {e}")
+        return
+
+    def _add(self, key, calib):
+        self._calibs[key] = calib
+        self._calibs.move_to_end(key)
+        while len(self._calibs) > self.maxsize:
+            self._calibs.popitem(last=False)
+        return
+
+    def clear(self):
+        self._calibs.clear()
+        return
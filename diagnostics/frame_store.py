@@ -0,0 +1,208 @@
+import os
+import json
+import logging
+from pathlib import Path
+import numpy as np
+from .espec_calib import ESpecCalib
+
+logger = logging.getLogger(__name__)
+
+
+class FrameStore():
+    """On-disk, memory-mapped (n_shots, ny, nx) stack of processed frames, with a table of shot metadata.
+
+    Frames are written as a flat binary file (<filepath>.frames) next to a .json sidecar
+    (dtype, frame shape, shot table) and the ESpecCalib the frames were processed with
+    (<filepath>.calib.npz), which holds the x/y, MeV and mrad axes. If the number of shots
+    is known the file is preallocated and written in place, otherwise frames are buffered
+    and appended a chunk at a time. Reading back (frames, iter_chunks()) memory-maps the
+    file, so stacks larger than memory can be used.
+    """
+
+    __version = 0.1
+
+    def __init__(self, filepath, frame_shape=None, n_shots=None, dtype='float32', chunk_size=16, mode='w'):
+        """
+        Parameters
+        ----------
+            filepath : str or Path
+                Path of the store, without extension.
+            frame_shape : tuple
+                (ny, nx) of the frames. Set by the first append() if None.
+            n_shots : int, optional
+                Number of shots, if known, to preallocate the file.
+            dtype : str
+                Data type frames are stored as.
+            chunk_size : int
+                Number of frames buffered before appending to the file (when not preallocated).
+            mode : str
+                'w' to create a new store, 'r' to open an existing one (see FrameStore.open()).
+        """
+        self.filepath = Path(filepath)
+        self.data_path = self.filepath.with_name(self.filepath.name + '.frames')
+        self.meta_path = self.filepath.with_name(self.filepath.name + '.json')
+        self.calib_path = self.filepath.with_name(self.filepath.name + '.calib.npz')
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._calib = None
+        self._writer = None
+
+        if mode == 'r':
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            self.dtype = np.dtype(meta['dtype'])
+            self.frame_shape = tuple(meta['frame_shape'])
+            self.n_shots = meta['n_shots']
+            self.shots = meta['shots']
+            self.count = len(self.shots)
+            return
+
+        self.dtype = np.dtype(dtype)
+        self.frame_shape = tuple(frame_shape) if frame_shape is not None else None
+        self.n_shots = n_shots
+        self.shots = []
+        self.count = 0
+        os.makedirs(self.filepath.parent, exist_ok=True)
+        open(self.data_path, 'wb').close()
+        if self.frame_shape is not None and n_shots:
+            self._preallocate()
+        return
+
+    @classmethod
+    def open(cls, filepath):
+        """Open an existing store for reading"""
+        return cls(filepath, mode='r')
+
+    def _preallocate(self):
+        self._writer = np.memmap(self.data_path, dtype=self.dtype, mode='w+', shape=(self.n_shots,) + self.frame_shape)
+
+    def append(self, frames, shot_dicts, calib=None):
+        """Add processed frames and their shot dictionaries.
+
+        Parameters
+        ----------
+            frames : np.ndarray
+                (n, ny, nx) stack of frames, or a single (ny, nx) frame.
+            shot_dicts : list or dict
+                Shot dictionary for each frame.
+            calib : ESpecCalib, optional
+                The calibration the frames were processed with. Frames from one store must share their axes.
+        """
+        if self.mode != 'w':
+            raise ValueError("FrameStore: store is read-only")
+        frames = np.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+            shot_dicts = [shot_dicts]
+
+        if self.frame_shape is None:
+            self.frame_shape = frames.shape[1:]
+            if self.n_shots:
+                self._preallocate()
+        if frames.shape[1:] != self.frame_shape:
+            raise ValueError(f"FrameStore: frame shape {frames.shape[1:]} does not match store shape {self.frame_shape}")
+
+        if calib is not None:
+            if self._calib is None:
+                self._calib = calib
+            elif calib is not self._calib and not (np.array_equal(calib.x, self._calib.x) and np.array_equal(calib.y, self._calib.y)):
+                raise ValueError("FrameStore: frames processed with a different calibration (axes) cannot share a store")
+
+        if self._writer is not None:
+            if self.count + len(frames) > self.n_shots:
+                raise ValueError(f"FrameStore: more than the {self.n_shots} preallocated shots")
+            self._writer[self.count:self.count+len(frames)] = frames
+        else:
+            self._buffer.append(frames.astype(self.dtype))
+            if sum(len(chunk) for chunk in self._buffer) >= self.chunk_size:
+                self._write_buffer()
+
+        self.shots.extend({'shot_dict': shot_dict} for shot_dict in shot_dicts)
+        self.count += len(frames)
+        return
+
+    def _write_buffer(self):
+        if self._buffer:
+            with open(self.data_path, 'ab') as f:
+                for chunk in self._buffer:
+                    f.write(np.ascontiguousarray(chunk).tobytes())
+            self._buffer = []
+
+    def flush(self):
+        """Write buffered frames, the shot table and the calibration to disk"""
+        if self.mode != 'w':
+            return
+        if self._writer is not None:
+            self._writer.flush()
+        self._write_buffer()
+        if self._calib is not None:
+            self._calib.save(self.calib_path)
+        meta = {
+            'dtype': self.dtype.str,
+            'frame_shape': list(self.frame_shape) if self.frame_shape is not None else None,
+            'n_shots': self.n_shots,
+            'shots': self.shots
+        }
+        tmp_meta_path = self.meta_path.with_suffix('.tmp.json')
+        with open(tmp_meta_path, 'w') as f:
+            json.dump(meta, f, default=str)
+        os.replace(tmp_meta_path, self.meta_path)
+        return
+
+    def close(self):
+        """Flush, and trim any preallocated shots that were never written. The store stays readable."""
+        if self.mode != 'w':
+            return
+        if self._writer is not None:
+            self._writer.flush()
+            self._writer = None
+            os.truncate(self.data_path, self.count * int(np.prod(self.frame_shape)) * self.dtype.itemsize)
+        self.n_shots = self.count
+        self.flush()
+        self.mode = 'r'
+        return
+
+    def delete(self):
+        """Remove the store files"""
+        self._writer = None
+        for path in [self.data_path, self.meta_path, self.calib_path]:
+            if path.exists():
+                os.remove(path)
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def frames(self):
+        """Memory-mapped (n_shots, ny, nx) array of the stored frames (read-only)"""
+        if self.mode == 'w':
+            self.flush()
+        if self.count == 0:
+            return np.zeros((0,) + tuple(self.frame_shape or (0, 0)), dtype=self.dtype)
+        return np.memmap(self.data_path, dtype=self.dtype, mode='r', shape=(self.count,) + self.frame_shape)
+
+    @property
+    def shot_dicts(self):
+        return [shot['shot_dict'] for shot in self.shots]
+
+    @property
+    def calib(self):
+        """The ESpecCalib the frames were processed with (with the axes), or None"""
+        if self._calib is None and self.calib_path.exists():
+            self._calib = ESpecCalib.load(self.calib_path)
+        return self._calib
+
+    def iter_chunks(self, chunk_size=16):
+        """Yields (frames, calib, shot_dicts) chunks of the store, like ESpec_.get_proc_shots()"""
+        frames = self.frames
+        shot_dicts = self.shot_dicts
+        for start in range(0, self.count, chunk_size):
+            yield np.asarray(frames[start:start+chunk_size], dtype=float), self.calib, shot_dicts[start:start+chunk_size]
@@ -0,0 +1,191 @@
+import os
+import time
+import uuid
+import threading
+from pathlib import Path
+import pandas as pd
+
+# Parquet needs pyarrow (or fastparquet); otherwise partitions are stored as pandas pickles
+try:
+    import pyarrow
+    STORE_FORMAT = 'parquet'
+except ImportError:
+    try:
+        import fastparquet
+        STORE_FORMAT = 'parquet'
+    except ImportError:
+        STORE_FORMAT = 'pickle'
+
+STORE_EXTENSIONS = {'parquet': '.parquet', 'pickle': '.pkl'}
+
+
+class MetricsStore():
+    """Columnar store of per-shot scalar results (e.g. ESpec energy metrics and charge).
+
+    One row per shot and diagnostic, with the shot 'timestamp', 'diag', 'calib_id' and a
+    'version' hash of the code and calibration the values were computed with, followed by
+    the metric columns. Rows are appended as new part files, partitioned by date
+    (<folder>/<diag>/date=YYYYMMDD/part-*.parquet), so reading a timeframe only opens the
+    partitions of its dates and filters the timestamp range on read (predicate pushdown).
+    Part filenames start with a write sequence number (nanoseconds, strictly increasing within
+    a process), so the latest appended row wins even where file modification times are coarse.
+    """
+
+    __version = 0.1
+
+    _last_sequence = 0
+    _sequence_lock = threading.Lock()
+
+    def __init__(self, folder, file_format=None):
+        """
+        Parameters
+        ----------
+            folder : str or Path
+                Root folder of the store.
+            file_format : str, optional
+                'parquet' or 'pickle'. Defaults to parquet if pyarrow or fastparquet is installed.
+        """
+        self.folder = Path(folder)
+        self.file_format = file_format or STORE_FORMAT
+        if self.file_format not in STORE_EXTENSIONS:
+            raise ValueError(f"MetricsStore: file_format '{self.file_format}' not supported, use one of {list(STORE_EXTENSIONS)}")
+        self.extension = STORE_EXTENSIONS[self.file_format]
+        return
+
+    def partition_folder(self, diag_name, date):
+        return self.folder / diag_name / f"date={date}"
+
+    def partitions(self, diag_name, start_date=None, end_date=None):
+        """Partition folders of a diagnostic, optionally only those between two YYYYMMDD dates"""
+        diag_folder = self.folder / diag_name
+        if not diag_folder.is_dir():
+            return []
+        folders = []
+        for entry in sorted(os.scandir(diag_folder), key=lambda e: e.name):
+            if not entry.is_dir() or not entry.name.startswith('date='):
+                continue
+            date = entry.name[len('date='):]
+            if start_date is not None and date < start_date:
+                continue
+            if end_date is not None and date > end_date:
+                continue
+            folders.append(Path(entry.path))
+        return folders
+
+    def append(self, rows):
+        """Add rows, written as one new part file per date.
+
+        Parameters
+        ----------
+            rows : pd.DataFrame
+                Must have 'timestamp' (YYYYMMDD...) and 'diag' columns.
+        """
+        if len(rows) == 0:
+            return
+        rows = rows.copy()
+        rows['timestamp'] = rows['timestamp'].astype(str)
+        dates = rows['timestamp'].str[0:8]
+        for (diag_name, date), part in rows.groupby([rows['diag'], dates]):
+            folder = self.partition_folder(diag_name, date)
+            os.makedirs(folder, exist_ok=True)
+            filepath = folder / f"part-{self._next_sequence():020d}-{uuid.uuid4().hex}{self.extension}"
+            # write to a temporary name first so a half-written part is never read
+            tmp_filepath = filepath.with_name('.' + filepath.name)
+            self._write(part.reset_index(drop=True), tmp_filepath)
+            os.replace(tmp_filepath, filepath)
+        return
+
+    @classmethod
+    def _next_sequence(cls):
+        with cls._sequence_lock:
+            cls._last_sequence = max(time.time_ns(), cls._last_sequence + 1)
+            return cls._last_sequence
+
+    @staticmethod
+    def _part_order(filepath):
+        """Sort key of part files in write order: by sequence number, after any parts written
+        before sequence numbers were used (by modification time)"""
+        sequence = filepath.name[len('part-'):].split('-')[0]
+        if len(sequence) == 20 and sequence.isdigit():
+            return (1, int(sequence))
+        return (0, os.path.getmtime(filepath))
+
+    def part_files(self, folder):
+        """Part files of a partition folder, in the order they were written"""
+        return sorted(folder.glob(f"part-*{self.extension}"), key=self._part_order)
+
+    def read(self, diag_name, timeframe=None, version=None, columns=None):
+        """Rows of a diagnostic, optionally for a timeframe and code/calibration version.
+        Where a shot has several rows for a version, the latest appended is kept.
+
+        Parameters
+        ----------
+            diag_name : str
+                The diagnostic.
+            timeframe : list or tuple, optional
+                [start_time, end_time] timestamps (YYYYMMDDHHMMSS), inclusive.
+            version : str, optional
+                Only rows with this version hash.
+            columns : list, optional
+                Columns to read (timestamp and version are always read).
+
+        Returns
+        -------
+            rows : pd.DataFrame
+        """
+        filters = []
+        start_date = end_date = None
+        if timeframe is not None:
+            start_time, end_time = str(timeframe[0]), str(timeframe[1])
+            start_date, end_date = start_time[0:8], end_time[0:8]
+            # end_time + ':' includes timestamps with more digits than end_time (e.g. milliseconds)
+            filters += [('timestamp', '>=', start_time), ('timestamp', '<=', end_time + ':')]
+        if version is not None:
+            filters.append(('version', '==', version))
+        if columns is not None:
+            columns = list(dict.fromkeys(['timestamp', 'version'] + list(columns)))
+
+        parts = []
+        for folder in self.partitions(diag_name, start_date, end_date):
+            for filepath in self.part_files(folder):
+                parts.append(self._read(filepath, filters, columns))
+        if not parts:
+            return pd.DataFrame(columns=columns or ['timestamp', 'diag', 'calib_id', 'version'])
+
+        rows = pd.concat(parts, ignore_index=True)
+        return rows.drop_duplicates(subset=['timestamp', 'version'], keep='last').sort_values('timestamp').reset_index(drop=True)
+
+    def compact(self, diag_name):
+        """Merge the part files of each date partition into one, dropping superseded rows"""
+        for folder in self.partitions(diag_name):
+            filepaths = self.part_files(folder)
+            if len(filepaths) <= 1:
+                continue
+            rows = pd.concat([self._read(filepath) for filepath in filepaths], ignore_index=True)
+            rows = rows.drop_duplicates(subset=['timestamp', 'version'], keep='last').reset_index(drop=True)
+            self.append(rows)
+            for filepath in filepaths:
+                os.remove(filepath)
+        return
+
+    def _write(self, rows, filepath):
+        if self.file_format == 'parquet':
+            rows.to_parquet(filepath, index=False)
+        else:
+            rows.to_pickle(filepath)
+
+    def _read(self, filepath, filters=None, columns=None):
+        if self.file_format == 'parquet':
+            # filters are pushed down to the parquet row groups
+            return pd.read_parquet(filepath, columns=columns, filters=filters or None)
+        rows = pd.read_pickle(filepath)
+        for column, op, value in filters or []:
+            if op == '>=':
+                rows = rows[rows[column] >= value]
+            elif op == '<=':
+                rows = rows[rows[column] <= value]
+            elif op == '==':
+                rows = rows[rows[column] == value]
+        if columns is not None:
+            rows = rows[[column for column in columns if column in rows.columns]]
+        return rows
@@ -0,0 +1,118 @@
+import os
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+import numpy as np
+from .espec_calib import ESpecCalib
+
+logger = logging.getLogger(__name__)
+
+
+class ProcShotCache():
+    """Cache of processed ESpec shots (image and the ESpecCalib with its axes), with an in-memory
+    LRU tier limited by size in bytes and an optional on-disk tier.
+
+    Keys should identify the source file (path, size, modification time) and everything the
+    processing depends on (calibration file contents, calib_id, ROIs, apply flags); see
+    ESpec_.proc_shot_key(). Cached images are read-only, as they are handed to every caller.
+    Safe to use from several threads, see ESpec_.process_shot().
+    """
+
+    __version = 0.1
+
+    def __init__(self, max_bytes=256e6, cache_folder=None):
+        """
+        Parameters
+        ----------
+            max_bytes : float
+                Maximum total size of the images kept in memory. 0 keeps none in memory.
+            cache_folder : str or Path, optional
+                Folder to persist processed shots in. If None, they are kept in memory only.
+        """
+        self.max_bytes = max_bytes
+        self.cache_folder = Path(cache_folder) if cache_folder is not None else None
+        self._entries = OrderedDict() # key: (img, calib)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        return
+
+    def get(self, key):
+        """Return the cached (img, calib) for key (a hex string), or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        if self.cache_folder is not None:
+            img_filepath = self.cache_folder / f"{key}.npy"
+            calib_filepath = self.cache_folder / f"{key}.calib.npz"
+            if img_filepath.is_file() and calib_filepath.is_file():
+                try:
+                    img = np.load(img_filepath)
+                    calib = ESpecCalib.load(calib_filepath)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"ProcShotCache: could not read {img_filepath}: {e}")
+                else:
+                    with self._lock:
+                        self.hits += 1
+                    return self._add(key, img, calib)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, img, calib):
+        """Add a processed image and its calibration. Returns the cached (read-only) (img, calib)."""
+        entry = self._add(key, img, calib)
+        if self.cache_folder is not None:
+            try:
+                os.makedirs(self.cache_folder, exist_ok=True)
+                # write to temporary files first so a half-written entry is never read
+                tmp_img_filepath = self.cache_folder / f"{key}.{threading.get_ident()}.tmp.npy"
+                tmp_calib_filepath = self.cache_folder / f"{key}.{threading.get_ident()}.tmp.calib.npz"
+                np.save(tmp_img_filepath, entry[0])
+                calib.save(tmp_calib_filepath)
+                os.replace(tmp_calib_filepath, self.cache_folder / f"{key}.calib.npz")
+                os.replace(tmp_img_filepath, self.cache_folder / f"{key}.npy")
+            except OSError as e:
+                logger.warning(f"ProcShotCache: could not save processed shot to {self.cache_folder}: {e}")
+        return entry
+
+    def _add(self, key, img, calib):
+        img = np.asarray(img)
+        img.setflags(write=False)
+        entry = (img, calib)
+        if img.nbytes > self.max_bytes:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[0].nbytes
+            self._entries[key] = entry
+            self.nbytes += img.nbytes
+            while self.nbytes > self.max_bytes:
+                _, (evicted_img, _) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_img.nbytes
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+        return
+
+    def stats(self):
+        """Dictionary of cache statistics"""
+        return {
+            "entries": len(self._entries),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,115 @@
+import numpy as np
+
+
+class RunningStats():
+    """Running mean and standard deviation of lineouts (spectra, divergence profiles etc.).
+
+    Shots are added one at a time or in batches with Welford/Chan updates, so memory does
+    not grow with the number of shots. Accumulators built separately (other workers, other
+    sessions via save()/load()) can be combined with merge().
+    """
+
+    __version = 0.1
+
+    def __init__(self, x=None):
+        """
+        Parameters
+        ----------
+            x : np.ndarray, optional
+                Axis of the lineouts (e.g. MeV or mrad). Set by the first update() otherwise.
+        """
+        self.x = None if x is None else np.asarray(x)
+        self.n = 0
+        self.mean = None
+        self.M2 = None # sum of squared differences from the mean
+        return
+
+    def update(self, value, x=None):
+        """Add a single lineout"""
+        return self.update_batch(np.asarray(value, dtype=float)[np.newaxis], x=x)
+
+    def update_batch(self, values, x=None):
+        """Add a (n_shots, ...) stack of lineouts"""
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return self
+        n_b = len(values)
+        mean_b = np.mean(values, axis=0)
+        M2_b = np.sum((values - mean_b)**2, axis=0)
+        return self._combine(n_b, mean_b, M2_b, x)
+
+    def merge(self, other):
+        """Add the shots of another RunningStats accumulator"""
+        if other.n == 0:
+            return self
+        return self._combine(other.n, other.mean, other.M2, other.x)
+
+    def _combine(self, n_b, mean_b, M2_b, x):
+        # Chan et al. parallel combination of (n, mean, M2)
+        if x is not None:
+            x = np.asarray(x)
+            if self.x is None:
+                self.x = x
+            elif np.shape(self.x) != np.shape(x):
+                raise ValueError(f"RunningStats: x axis of {np.shape(x)} does not match {np.shape(self.x)}")
+
+        if self.n == 0:
+            self.n = n_b
+            self.mean = np.array(mean_b, dtype=float)
+            self.M2 = np.array(M2_b, dtype=float)
+            return self
+
+        if np.shape(mean_b) != np.shape(self.mean):
+            raise ValueError(f"RunningStats: lineout shape {np.shape(mean_b)} does not match {np.shape(self.mean)}")
+
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * (n_b / n)
+        self.M2 = self.M2 + M2_b + delta**2 * (self.n * n_b / n)
+        self.n = n
+        return self
+
+    @property
+    def var(self):
+        """Population variance (as np.var)"""
+        if self.n == 0:
+            return None
+        return self.M2 / self.n
+
+    @property
+    def std(self):
+        """Population standard deviation (as np.std)"""
+        if self.n == 0:
+            return None
+        return np.sqrt(self.var)
+
+    @property
+    def stderr(self):
+        """Standard error of the mean"""
+        if self.n == 0:
+            return None
+        return self.std / np.sqrt(self.n)
+
+    def to_dict(self):
+        """Summary in the form returned by ESpec_.get_mean_and_error()"""
+        return {"x": self.x, "y_mean": self.mean, "y_std": self.std, "y_stderr": self.stderr, "n": self.n}
+
+    def save(self, filepath):
+        """Save the accumulator to a .npz file, to merge or continue later"""
+        arrays = {'n': self.n}
+        for name in ['x', 'mean', 'M2']:
+            if getattr(self, name) is not None:
+                arrays[name] = getattr(self, name)
+        np.savez(filepath, **arrays)
+        return
+
+    @classmethod
+    def load(cls, filepath):
+        """Load an accumulator saved with RunningStats.save()"""
+        with np.load(filepath) as saved:
+            stats = cls(x=saved['x'] if 'x' in saved.files else None)
+            stats.n = int(saved['n'])
+            if stats.n > 0:
+                stats.mean = saved['mean']
+                stats.M2 = saved['M2']
+        return stats
@@ -0,0 +1,136 @@
+import numpy as np
+
+
+def as_strided_index(idxs):
+    """Channel indices to an equivalent slice if they are evenly spaced and increasing
+    (e.g. one channel, neighbouring channels, every other channel), so indexing gives a
+    strided view rather than a copy. Otherwise the index array is returned unchanged."""
+    idxs = np.asarray(idxs, dtype=int)
+    if len(idxs) == 1:
+        return slice(int(idxs[0]), int(idxs[0]) + 1)
+    steps = np.diff(idxs)
+    if len(idxs) > 1 and steps[0] > 0 and np.all(steps == steps[0]):
+        return slice(int(idxs[0]), int(idxs[-1]) + 1, int(steps[0]))
+    return idxs
+
+
+class ScopeBlock():
+    """Scope shots of one scope held in a single buffer, so channel and time window selection
+    across many shots are views rather than per-shot copies.
+
+    Shots with the same record length and channels are one contiguous (n_shots, N, n_channels)
+    array. Otherwise they are concatenated along time into a ragged (sum(N), n_channels) buffer,
+    with offsets[i]:offsets[i+1] the samples of shot i.
+    """
+
+    __version = 0.1
+
+    def __init__(self, data, time, channel_names, label_names=None, dt=None, offsets=None, times=None):
+        """
+        Parameters
+        ----------
+            data : np.ndarray
+                (n_shots, N, n_channels) block, or (sum(N), n_channels) ragged buffer if offsets is set.
+            time : np.ndarray
+                Time axis of the first shot (of every shot, for a block).
+            channel_names, label_names : list
+                Names and labels of the channels.
+            dt : float
+                Time step.
+            offsets : np.ndarray, optional
+                (n_shots + 1) start of each shot in a ragged buffer.
+            times : list, optional
+                Time axis of each shot, for a ragged buffer.
+        """
+        self.data = data
+        self.time = time
+        self.channel_names = list(channel_names)
+        self.label_names = list(label_names) if label_names is not None else None
+        self.dt = dt
+        self.offsets = offsets
+        self.times = times
+        self.channel_index = {name: i for i, name in enumerate(self.channel_names)}
+        return
+
+    @classmethod
+    def from_shots(cls, shot_data):
+        """Build from scope shot dictionaries (Fireball_DAQ.load_scope()). The channels of each
+        shot are copied once into the shared buffer; a single shot is wrapped without copying."""
+        if isinstance(shot_data, dict):
+            shot_data = [shot_data]
+        first = shot_data[0]
+        for shot in shot_data[1:]:
+            if list(shot['channel_names']) != list(first['channel_names']):
+                raise ValueError(f"ScopeBlock: shots have different channels, {shot['channel_names']} and {first['channel_names']}")
+
+        shapes = {np.shape(shot['channels']) for shot in shot_data}
+        if len(shapes) == 1:
+            if len(shot_data) == 1:
+                data = np.asarray(first['channels'])[np.newaxis]
+            else:
+                data = np.empty((len(shot_data),) + shapes.pop(), dtype=np.result_type(*[shot['channels'] for shot in shot_data]))
+                for i, shot in enumerate(shot_data):
+                    data[i] = shot['channels']
+            return cls(data, first['time'], first['channel_names'], first.get('label_names'), dt=first.get('dt'))
+
+        lengths = [len(shot['channels']) for shot in shot_data]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        data = np.concatenate([shot['channels'] for shot in shot_data], axis=0)
+        return cls(data, first['time'], first['channel_names'], first.get('label_names'), dt=first.get('dt'),
+                   offsets=offsets, times=[shot['time'] for shot in shot_data])
+
+    @property
+    def ragged(self):
+        return self.offsets is not None
+
+    def __len__(self):
+        if self.ragged:
+            return len(self.offsets) - 1
+        return len(self.data)
+
+    def channel_indices(self, channels=None):
+        """Index of a channel name (int), or of a list of channel names (slice where possible)"""
+        if channels is None:
+            return slice(None)
+        if isinstance(channels, str):
+            if channels not in self.channel_index:
+                raise ValueError(f"{channels} not in data: {self.channel_names}")
+            return self.channel_index[channels]
+        for ch in channels:
+            if ch not in self.channel_index:
+                raise ValueError(f"{ch} not in data: {self.channel_names}")
+        return as_strided_index([self.channel_index[ch] for ch in channels])
+
+    def time_window(self, t_start=None, t_end=None, time=None):
+        """Slice of the samples with t_start <= time <= t_end"""
+        time = self.time if time is None else time
+        start = 0 if t_start is None else int(np.searchsorted(time, t_start - 0.5*(self.dt or 0), side='left'))
+        stop = len(time) if t_end is None else int(np.searchsorted(time, t_end + 0.5*(self.dt or 0), side='right'))
+        return slice(start, stop)
+
+    def shot(self, i):
+        """(N, n_channels) view of one shot"""
+        if self.ragged:
+            return self.data[self.offsets[i]:self.offsets[i+1]]
+        return self.data[i]
+
+    def select(self, channels=None, t_start=None, t_end=None):
+        """Voltages of some channels (names, or a single name) in a time window, for every shot.
+
+        Returns
+        -------
+            voltages : np.ndarray or list
+                (n_shots, N, n_selected) (or (n_shots, N) for a single channel name) view of the block
+                when the channels are evenly spaced; for a ragged buffer a list of per-shot arrays.
+        """
+        idx = self.channel_indices(channels)
+        if self.ragged:
+            return [self.shot(i)[self.time_window(t_start, t_end, self.times[i]), idx] for i in range(len(self))]
+        return self.data[:, self.time_window(t_start, t_end), idx]
+
+    def subtract(self, chA, chB, t_start=None, t_end=None):
+        """chA - chB for every shot in a time window, computed from views into a single new array"""
+        a, b = self.select(chA, t_start, t_end), self.select(chB, t_start, t_end)
+        if self.ragged:
+            return [va - vb for va, vb in zip(a, b)]
+        return np.subtract(a, b)
@@ -1,15 +1,53 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from .scope_block import ScopeBlock
 
 
 # ------------------------------------------------------------------
 # Internal helper
 # ------------------------------------------------------------------
 
-def _extract_cross_voltages(scopeA, scopeB, shot_dict, chA, chB):
+def _load_aligned_scope_data(scopeA, scopeB, shot_dict, tolerance=None):
+    """Scope data of both scopes for the same shots of a timeframe, matched by
+    time with the DAQ shot table rather than by position in each folder."""
 
-    dataA = scopeA.get_scope_data(shot_dict)
-    dataB = scopeB.get_scope_data(shot_dict)
+    names = [scopeA.config['name'], scopeB.config['name']]
+    aligned = scopeA.DAQ.get_aligned_shot_dicts(names, timeframe=shot_dict, tolerance=tolerance)
+
+    resultsA = scopeA.DAQ.get_shots_data(names[0], aligned[names[0]], cache=True)
+    resultsB = scopeB.DAQ.get_shots_data(names[1], aligned[names[1]], cache=True)
+
+    dataA, dataB = [], []
+    for resultA, resultB in zip(resultsA, resultsB):
+        if resultA.error is not None or resultB.error is not None:
+            print(f"[INFO] Skipping shot {resultA.shot_dict} / {resultB.shot_dict}: "
+                  f"{resultA.error or resultB.error}")
+            continue
+        # unwrap if returned dict contains 'data'
+        dataA.append(resultA.data['data'] if isinstance(resultA.data, dict) and 'data' in resultA.data else resultA.data)
+        dataB.append(resultB.data['data'] if isinstance(resultB.data, dict) and 'data' in resultB.data else resultB.data)
+
+    if not dataA:
+        raise ValueError(f"No matching shots between {names[0]} and {names[1]} in {shot_dict}")
+
+    return dataA, dataB
+
+
+def _extract_cross_voltages(scopeA, scopeB, shot_dict, chA, chB, tolerance=None):
+
+    # channels and dt are checked from the file headers before any traces are loaded
+    catalogueA = scopeA.check_channels(shot_dict, [chA])
+    catalogueB = scopeB.check_channels(shot_dict, [chB])
+    if catalogueA is not None and catalogueB is not None:
+        dts = np.concatenate([catalogueA['dt'], catalogueB['dt']])
+        if len(dts) and not np.allclose(dts, dts[0]):
+            raise ValueError("Scopes have different dt values; cannot align without interpolation.")
+
+    if isinstance(shot_dict, dict) and 'timeframe' in shot_dict:
+        dataA, dataB = _load_aligned_scope_data(scopeA, scopeB, shot_dict, tolerance=tolerance)
+    else:
+        dataA = scopeA.get_scope_data(shot_dict)
+        dataB = scopeB.get_scope_data(shot_dict)
 
     if isinstance(dataA, dict):
         dataA = [dataA]
@@ -57,15 +95,15 @@ def _extract_cross_voltages(scopeA, scopeB, shot_dict, chA, chB):
 
     time_common = dataA[0]['time'][idx_start_A:idx_end_A]
 
-    result = []
-    for shotA, shotB in zip(dataA, dataB):
-
-        vA = shotA['channels'][:, idxA][idx_start_A:idx_end_A]
-        vB = shotB['channels'][:, idxB][idx_start_B:idx_end_B]
-
-        result.append(vA - vB)
-
-    result = np.stack(result, axis=0)
+    # channel and overlap selection are views of each scope's block; only the difference is new
+    blockA = ScopeBlock.from_shots(dataA)
+    blockB = ScopeBlock.from_shots(dataB)
+    if not blockA.ragged and not blockB.ragged:
+        result = np.subtract(blockA.data[:, idx_start_A:idx_end_A, idxA],
+                             blockB.data[:, idx_start_B:idx_end_B, idxB])
+    else:
+        result = np.stack([blockA.shot(i)[idx_start_A:idx_end_A, idxA] - blockB.shot(i)[idx_start_B:idx_end_B, idxB]
+                           for i in range(len(blockA))], axis=0)
 
     return result, time_common, dt, dataA, dataB
 
@@ -87,10 +125,11 @@ def plot_cross_scope(scopeA,
                      xmax=None,
                      ymin=None,
                      ymax=None,
-                     fmax=None):
+                     fmax=None,
+                     tolerance=None):
 
         signals, time, dt, dataA, dataB = \
-            _extract_cross_voltages(scopeA, scopeB, shot_dict, chA, chB)
+            _extract_cross_voltages(scopeA, scopeB, shot_dict, chA, chB, tolerance=tolerance)
     
         fig, ax = plt.subplots(figsize=(10,5))
     
@@ -0,0 +1,52 @@
+"""Benchmark of the single-pass DigiCam .csv loader against the old np.genfromtxt path,
+on a synthetic 1024x1280 frame. Run from the repository root:
+
+    python scripts/DAQ/csv_image_benchmark.py
+"""
+import sys
+import os
+import time
+import tempfile
+from pathlib import Path
+import numpy as np
+
+ROOT_FOLDER = str(Path.cwd())
+sys.path.append(ROOT_FOLDER)
+
+from DAQs.csv_frames import read_csv_frame, CSV_ENGINE
+
+N_REPEATS = 3
+NY, NX = 1024, 1280
+
+def genfromtxt_frame(filepath):
+    """Old loading path (Fireball_DAQ.load_data 'csv_image' / FireballIII.load_csv_image)"""
+    img = np.genfromtxt(filepath, delimiter=',')
+    return {"IMG": img[1:, 1:], "X": img[0, 1:], "Y": img[1:, 0]}
+
+def best_time(func, *args, **kwargs):
+    times = []
+    for _ in range(N_REPEATS):
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+with tempfile.TemporaryDirectory() as tmp_folder:
+    # synthetic DigiCam frame: x coords in top row, y coords in first column, counts elsewhere
+    rng = np.random.default_rng(0)
+    frame = np.zeros((NY + 1, NX + 1))
+    frame[0, 1:] = np.linspace(-40, 40, NX)
+    frame[1:, 0] = np.linspace(-30, 30, NY)
+    frame[1:, 1:] = rng.poisson(200, size=(NY, NX))
+    filepath = os.path.join(tmp_folder, 'OD_HRM5_synthetic_20250602182440.csv')
+    np.savetxt(filepath, frame, delimiter=',', fmt='%.6g')
+    print(f"Synthetic frame: {NY}x{NX}, {os.path.getsize(filepath)/1e6:.1f} MB")
+
+    t_old, old = best_time(genfromtxt_frame, filepath)
+    print(f"np.genfromtxt:              {t_old:.3f} s")
+
+    engines = ['c'] if CSV_ENGINE == 'c' else ['c', CSV_ENGINE]
+    for engine in engines:
+        t_new, new = best_time(read_csv_frame, filepath, engine=engine)
+        same = all(np.array_equal(old[k], new[k]) for k in ['IMG', 'X', 'Y'])
+        print(f"read_csv_frame ({engine:>7}):   {t_new:.3f} s  ({t_old/t_new:.1f}x faster, identical output: {same})")
@@ -0,0 +1,43 @@
+"""Packs the shots of a diagnostic (or a timeframe of them) into one HDF5 or Zarr file, see
+Fireball_DAQ.pack_shots(). Run from the repository root, e.g.:
+
+    python scripts/DAQ/pack_shots.py SCOPE1 packs/SCOPE1_20250602.h5 --timeframe 20250602 20250602
+
+Then point the diagnostic's data_folder at the pack (relative to the data folder) and set its
+data_type to 'packed' to read from it.
+"""
+import sys
+import time
+import argparse
+import logging
+from pathlib import Path
+
+ROOT_FOLDER = str(Path.cwd())
+sys.path.append(ROOT_FOLDER)
+
+from LAMP import Experiment
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+parser = argparse.ArgumentParser(description="Pack the shots of a diagnostic into one HDF5 (.h5) or Zarr (.zarr) file.")
+parser.add_argument('diag_name', help="diagnostic to pack, e.g. SCOPE1")
+parser.add_argument('filepath', help="pack to write, .h5/.hdf5 or .zarr")
+parser.add_argument('--timeframe', nargs=2, metavar=('START', 'END'), help="YYYYMMDD[HHMMSS] timestamps; all shots if not given")
+parser.add_argument('--format', dest='file_format', choices=['hdf5', 'zarr'], help="defaults to the format of the extension")
+parser.add_argument('--compression', help="'gzip', 'lzf' or 'none'; defaults to [packing] compression")
+parser.add_argument('--chunk-shots', type=int, help="shots per chunk; defaults to [packing] chunk_shots")
+parser.add_argument('--workers', type=int, help="parallel loading workers; defaults to [loading] workers")
+parser.add_argument('--backend', choices=['thread', 'process'], help="defaults to [loading] backend")
+parser.add_argument('--local-config', help="local config file, as for Experiment()")
+args = parser.parse_args()
+
+ex = Experiment(ROOT_FOLDER, local_config=args.local_config) if args.local_config else Experiment(ROOT_FOLDER)
+timeframe = {'timeframe': args.timeframe} if args.timeframe else None
+
+t0 = time.perf_counter()
+filepath = ex.DAQ.pack_shots(args.diag_name, args.filepath, timeframe=timeframe, file_format=args.file_format,
+                             compression=args.compression, chunk_shots=args.chunk_shots,
+                             workers=args.workers, backend=args.backend)
+size = sum(f.stat().st_size for f in filepath.rglob('*') if f.is_file()) if filepath.is_dir() else filepath.stat().st_size
+logger.info(f"Wrote {filepath} ({size/1e6:.1f} MB) in {time.perf_counter() - t0:.1f} s")
@@ -0,0 +1,76 @@
+"""Benchmark of the ESpec MeV/mrad ROI cropping: the old boolean mask steps in get_proc_shot
+against the searchsorted slices now resolved once per calibration, on a synthetic
+full-resolution HRM frame (1024x1280). Run from the repository root:
+
+    python scripts/ESpecs/roi_benchmark.py
+"""
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+
+ROOT_FOLDER = str(Path.cwd())
+sys.path.append(ROOT_FOLDER)
+
+from diagnostics.espec_calib import roi_selection
+
+N_REPEATS = 20
+NY, NX = 1024, 1280
+MeV_min, MeV_max = 30, 120
+mrad_min, mrad_max = -4, 4
+
+def mask_roi(img, x_mm, y_mm, MeV, mrad):
+    """Old ROI path: dispersion along x (inclusive), then divergence along y (exclusive)"""
+    x_mm = x_mm[(MeV >= MeV_min)]
+    img = img[:, (MeV >= MeV_min)]
+    MeV = MeV[(MeV >= MeV_min)]
+    x_mm = x_mm[(MeV <= MeV_max)]
+    img = img[:, (MeV <= MeV_max)]
+    MeV = MeV[(MeV <= MeV_max)]
+
+    y_mm = y_mm[(mrad > mrad_min)]
+    img = img[(mrad > mrad_min), :]
+    mrad = mrad[(mrad > mrad_min)]
+    y_mm = y_mm[(mrad < mrad_max)]
+    img = img[(mrad < mrad_max), :]
+    mrad = mrad[(mrad < mrad_max)]
+    return img, x_mm, y_mm, MeV, mrad
+
+def slice_roi(img, x_mm, y_mm, x_sel, y_sel, MeV, mrad):
+    """New ROI path; x_sel, y_sel are worked out once per calibration"""
+    return img[y_sel, x_sel], x_mm[x_sel], y_mm[y_sel], MeV[x_sel], mrad[y_sel]
+
+def best_time_and_memory(func, *args):
+    times = []
+    for _ in range(N_REPEATS):
+        t0 = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    result = func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak, result
+
+rng = np.random.default_rng(0)
+img = rng.poisson(200, size=(NY, NX)).astype(float)
+x_mm = np.arange(NX) * 0.05
+y_mm = np.arange(NY) * 0.05
+MeV = 200 / (1 + x_mm / 10) # decreasing along the screen, like a dipole spectrometer
+mrad = (y_mm - y_mm.mean()) / 500 * 1e3
+print(f"Synthetic frame: {NY}x{NX}, {img.nbytes/1e6:.1f} MB")
+
+t_old, mem_old, old = best_time_and_memory(mask_roi, img, x_mm, y_mm, MeV, mrad)
+print(f"boolean masks:          {t_old*1e3:.2f} ms, peak {mem_old/1e6:.1f} MB allocated")
+
+t0 = time.perf_counter()
+x_sel = roi_selection(MeV, MeV_min, MeV_max)
+y_sel = roi_selection(mrad, mrad_min, mrad_max, inclusive=False)
+t_sel = time.perf_counter() - t0
+print(f"searchsorted (once per calibration): {t_sel*1e3:.3f} ms -> x {x_sel}, y {y_sel}")
+
+t_new, mem_new, new = best_time_and_memory(slice_roi, img, x_mm, y_mm, x_sel, y_sel, MeV, mrad)
+same = all(np.array_equal(a, b) for a, b in zip(old, new))
+print(f"slices:                 {t_new*1e3:.4f} ms, peak {mem_new/1e6:.3f} MB allocated "
+      f"({t_old/t_new:.0f}x faster, view: {np.shares_memory(new[0], img)}, identical output: {same})")
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the DAQs and diagnostics folders are imported as packages from the repository root, as LAMP does
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
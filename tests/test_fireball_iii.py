@@ -0,0 +1,94 @@
+from pathlib import Path
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from DAQs.FireballIII import FireballIII
+
+# DigiCam names: the shot number is the first 10 digits of the fifth '_' separated part
+SHOTS = {
+    'DIGICAM_HRMT68_CAM1_img_1718012300123.csv': 1718012300,
+    'DIGICAM_HRMT68_CAM1_img_1718012310456.csv': 1718012310,
+    'DIGICAM_HRMT68_CAM1_img_1718012310001.csv': 1718012310, # second file of the same shot
+    'DIGICAM_HRMT68_CAM1_img_1718012320789.csv': 1718012320,
+}
+
+
+@pytest.fixture
+def daq(tmp_path):
+    folder = tmp_path / 'CAM1'
+    folder.mkdir()
+    for filename in SHOTS:
+        (folder / filename).write_text('0')
+    (folder / 'DIGICAM_notes.txt').write_text('')
+    (folder / 'DIGICAM_HRMT68_CAM1_img.csv').write_text('0') # no shot number
+
+    daq = FireballIII.__new__(FireballIII)
+    config = {'data_folder': 'CAM1/', 'data_stem': 'DIGICAM', 'data_ext': '.csv', 'data_type': 'csv'}
+    daq.ex = SimpleNamespace(diags={'CAM1': SimpleNamespace(config=config)}, config={})
+    daq.data_folder = str(tmp_path) + '/'
+    daq._shot_indexes = {}
+    daq.backend, daq.workers = 'thread', 2
+    # the filename stands in for the loaded frame
+    daq.load_data = lambda shot_filepath, file_type=None: Path(shot_filepath).name
+    return daq
+
+
+def test_shot_index_sorted_by_shot_then_filename(daq):
+    shots, filenames = daq.shot_index('CAM1')
+    assert shots.tolist() == [1718012300, 1718012310, 1718012310, 1718012320]
+    assert filenames.tolist() == ['DIGICAM_HRMT68_CAM1_img_1718012300123.csv', 'DIGICAM_HRMT68_CAM1_img_1718012310001.csv',
+                                  'DIGICAM_HRMT68_CAM1_img_1718012310456.csv', 'DIGICAM_HRMT68_CAM1_img_1718012320789.csv']
+
+
+@pytest.mark.parametrize('shot, filename', [
+    (1718012300, 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv'),      # exact
+    (1718012300999, 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv'),   # compared on the first 10 digits
+    (1718012302, 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv'),      # nearer the earlier file
+    (1718012318, 'DIGICAM_HRMT68_CAM1_img_1718012320789.csv'),      # nearer the later file
+    (1718012315, 'DIGICAM_HRMT68_CAM1_img_1718012310001.csv'),      # tie: the earlier shot number
+    (1718012305, 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv'),      # tie: the earlier shot number
+    (1718012310, 'DIGICAM_HRMT68_CAM1_img_1718012310001.csv'),      # several files: the first by filename
+    (1000000000, 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv'),      # before the first file
+    (1999999999, 'DIGICAM_HRMT68_CAM1_img_1718012320789.csv'),      # after the last file
+])
+def test_find_nearest_file(daq, shot, filename):
+    assert daq.find_nearest_files('CAM1', shot).tolist() == [filename]
+    assert daq.find_nearest_files('CAM1', [shot]).tolist() == [filename]
+
+
+def test_find_nearest_files_keeps_request_order(daq):
+    filenames = daq.find_nearest_files('CAM1', [1718012320, 1000000000, 1718012310, 1718012320])
+    assert filenames.tolist() == ['DIGICAM_HRMT68_CAM1_img_1718012320789.csv', 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv',
+                                  'DIGICAM_HRMT68_CAM1_img_1718012310001.csv', 'DIGICAM_HRMT68_CAM1_img_1718012320789.csv']
+
+
+def test_get_shot_data_returns_every_shot_in_order(daq):
+    shot_data = daq.get_shot_data('CAM1', {'shot': [1718012320, 1718012300, 1718012311]})
+    assert shot_data == ['DIGICAM_HRMT68_CAM1_img_1718012320789.csv', 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv',
+                         'DIGICAM_HRMT68_CAM1_img_1718012310001.csv']
+    # a scalar shot number gives its data, a one element list a list
+    assert daq.get_shot_data('CAM1', {'shot': 1718012300}) == 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv'
+    assert daq.get_shot_data('CAM1', {'shot': [1718012300]}) == ['DIGICAM_HRMT68_CAM1_img_1718012300123.csv']
+    assert daq.get_shot_data('CAM1', {'shot': np.int64(1718012300)}) == 'DIGICAM_HRMT68_CAM1_img_1718012300123.csv'
+
+
+def test_failed_load_is_none(daq):
+    def load_data(shot_filepath, file_type=None):
+        if shot_filepath.endswith('1718012300123.csv'):
+            raise OSError("unreadable")
+        return Path(shot_filepath).name
+    daq.load_data = load_data
+    assert daq.get_shot_data('CAM1', {'shot': [1718012300, 1718012320]}) == [None, 'DIGICAM_HRMT68_CAM1_img_1718012320789.csv']
+
+
+def test_index_follows_folder_changes(daq, tmp_path):
+    assert daq.find_nearest_files('CAM1', 1718012399).tolist() == ['DIGICAM_HRMT68_CAM1_img_1718012320789.csv']
+    (tmp_path / 'CAM1' / 'DIGICAM_HRMT68_CAM1_img_1718012399000.csv').write_text('0')
+    assert daq.find_nearest_files('CAM1', 1718012399).tolist() == ['DIGICAM_HRMT68_CAM1_img_1718012399000.csv']
+
+
+def test_empty_folder_raises(daq, tmp_path):
+    for filepath in (tmp_path / 'CAM1').iterdir():
+        filepath.unlink()
+    with pytest.raises(ValueError):
+        daq.find_nearest_files('CAM1', 1718012300)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from diagnostics.lineout_metrics import lineout_metrics
+
+SIGMA_TO_FWHM = 2 * np.sqrt(2 * np.log(2))
+
+
+def old_FWHM(X, Y):
+    """The pixel-edge helper ESpec_.get_div_FWHM() used before lineout_metrics(), verbatim"""
+    half_max = max(Y) / 2.
+    #find when function crosses line half_max (when sign of diff flips)
+    #take the 'derivative' of signum(half_max - Y[])
+    d = np.sign(half_max - np.array(Y[0:-1])) - np.sign(half_max - np.array(Y[1:]))
+    #find the left and right most indexes
+    left_idx = np.where(d > 0)[0]
+    right_idx = np.where(d < 0)[-1]
+    fwhm = X[right_idx] - X[left_idx] #return the difference (full width)
+    return fwhm[0] #return the difference (full width)
+
+
+def gaussian(x, centre, sigma, amplitude=1.0):
+    return amplitude * np.exp(-(x - centre)**2 / (2 * sigma**2))
+
+
+def noisy_peaks(n_shots=300, seed=0):
+    rng = np.random.default_rng(seed)
+    mrad = np.linspace(-10, 10, 201)
+    centres = rng.uniform(-3, 3, n_shots)
+    sigmas = rng.uniform(0.8, 2.5, n_shots)
+    lineouts = gaussian(mrad, centres[:, np.newaxis], sigmas[:, np.newaxis], rng.uniform(0.5, 2, n_shots)[:, np.newaxis])
+    lineouts += rng.normal(scale=0.02, size=lineouts.shape)
+    return lineouts, mrad, sigmas
+
+
+def test_single_peaks_agree_with_old_helper_within_a_pixel():
+    lineouts, mrad, sigmas = noisy_peaks()
+    window = int(len(mrad) / 10) # as get_div_FWHM()
+    metrics = lineout_metrics(lineouts, mrad, window=window)
+    old = np.array([old_FWHM(mrad, smoothed) for smoothed in metrics['smoothed']])
+    pixel = mrad[1] - mrad[0]
+    assert np.all(np.abs(metrics['fwhm'] - old) <= pixel + 1e-9)
+    np.testing.assert_array_equal(metrics['peak'], mrad[np.argmax(metrics['smoothed'], axis=-1)])
+    # and the interpolated widths are close to the true ones
+    np.testing.assert_allclose(metrics['fwhm'], SIGMA_TO_FWHM * sigmas, atol=2 * pixel)
+
+
+def test_stack_matches_single_lineouts():
+    lineouts, mrad, _ = noisy_peaks(20, seed=1)
+    stacked = lineout_metrics(lineouts, mrad, window=21)
+    for i, lineout in enumerate(lineouts):
+        single = lineout_metrics(lineout, mrad, window=21)
+        for name in ['fwhm', 'peak', 'centroid', 'rms']:
+            np.testing.assert_allclose(single[name][0], stacked[name][i], rtol=1e-12)
+
+
+def test_double_peak_measures_the_highest_peak():
+    # a narrower, lower peak on the left that is also above half maximum
+    mrad = np.linspace(-10, 10, 201)
+    lineout = gaussian(mrad, -4, 0.4, 0.8) + gaussian(mrad, 3, 1.0)
+    metrics = lineout_metrics(lineout, mrad)
+    assert metrics['peak'][0] == pytest.approx(3.0)
+    assert metrics['fwhm'][0] == pytest.approx(2.3553, abs=1e-3)
+    assert metrics['fwhm'][0] == pytest.approx(SIGMA_TO_FWHM * 1.0, abs=0.01)
+    # the old helper measured the first region above half maximum from the left
+    assert old_FWHM(mrad, lineout) == pytest.approx(0.7)
+
+
+def test_moments_and_open_sides():
+    mrad = np.linspace(-10, 10, 401)
+    metrics = lineout_metrics(gaussian(mrad, 1.5, 2.0), mrad)
+    assert metrics['centroid'][0] == pytest.approx(1.5, abs=1e-3)
+    assert metrics['rms'][0] == pytest.approx(2.0, rel=1e-3)
+    # never drops below half maximum on the right
+    assert np.isnan(lineout_metrics(gaussian(mrad, 9.5, 2.0), mrad)['fwhm'][0])
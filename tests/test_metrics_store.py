@@ -0,0 +1,54 @@
+import os
+import pandas as pd
+import pytest
+from diagnostics.metrics_store import MetricsStore, STORE_FORMAT
+
+FORMATS = ['pickle'] + (['parquet'] if STORE_FORMAT == 'parquet' else [])
+
+
+def rows(value, timestamps=('20250602182440', '20250602182442')):
+    return pd.DataFrame({'timestamp': list(timestamps), 'diag': 'HRM5', 'calib_id': 'test', 'version': 'v1',
+                         'E_mean': [value] * len(timestamps)})
+
+
+@pytest.mark.parametrize('file_format', FORMATS)
+def test_latest_appended_wins_whatever_the_mtimes(tmp_path, file_format):
+    store = MetricsStore(tmp_path, file_format=file_format)
+    store.append(rows(1.0))
+    store.append(rows(2.0, timestamps=['20250602182442']))
+    store.append(rows(3.0, timestamps=['20250602182440']))
+    # coarse mtimes (or clock skew): make the earlier parts look newer
+    filepaths = store.part_files(store.partition_folder('HRM5', '20250602'))
+    for age, filepath in enumerate(filepaths):
+        os.utime(filepath, (1e9 - age, 1e9 - age))
+
+    read = store.read('HRM5')
+    assert read['timestamp'].tolist() == ['20250602182440', '20250602182442']
+    assert read['E_mean'].tolist() == [3.0, 2.0]
+
+    store.compact('HRM5')
+    assert len(store.part_files(store.partition_folder('HRM5', '20250602'))) == 1
+    assert store.read('HRM5')['E_mean'].tolist() == [3.0, 2.0]
+    store.append(rows(4.0, timestamps=['20250602182442']))
+    assert store.read('HRM5')['E_mean'].tolist() == [3.0, 4.0]
+
+
+@pytest.mark.parametrize('file_format', FORMATS)
+def test_read_filters_timeframe_and_version(tmp_path, file_format):
+    store = MetricsStore(tmp_path, file_format=file_format)
+    store.append(rows(1.0, timestamps=['20250601120000', '20250602182440870', '20250603000000']))
+    other = rows(5.0, timestamps=['20250602182440870'])
+    other['version'] = 'v2'
+    store.append(other)
+    read = store.read('HRM5', timeframe=['20250602000000', '20250602235959'], version='v1')
+    assert read['timestamp'].tolist() == ['20250602182440870']
+    assert read['E_mean'].tolist() == [1.0]
+
+
+def test_parts_before_sequence_numbers_come_first(tmp_path):
+    store = MetricsStore(tmp_path, file_format='pickle')
+    folder = store.partition_folder('HRM5', '20250602')
+    os.makedirs(folder)
+    rows(1.0).to_pickle(folder / 'part-0123456789abcdef0123456789abcdef.pkl')
+    store.append(rows(2.0))
+    assert store.read('HRM5')['E_mean'].tolist() == [2.0, 2.0]
@@ -0,0 +1,123 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from diagnostics.ESpec_ import ESpec_
+from diagnostics.espec_calib import ESpecCalib
+from diagnostics.proc_shot_cache import ProcShotCache
+
+KEY = '0123456789abcdef0123456789abcdef01234567'
+
+
+def make_calib(nx=5, ny=4):
+    x, y = np.linspace(0, 1, nx), np.linspace(0, 2, ny)
+    return ESpecCalib((ny, nx), slice(None), slice(None), np.ones(nx), np.ones(ny), 1.0, x, y, x, y, calib_id='test')
+
+
+@pytest.fixture
+def espec(tmp_path):
+    """ESpec_ with just what proc_shot_key() needs: a shot file, a master calibration file and a calib_id file"""
+    (tmp_path / 'calibs').mkdir()
+    (tmp_path / 'calibs' / 'master.toml').write_text('[test]\n')
+    (tmp_path / 'calibs' / 'test.toml').write_text('dispersion = 1\n')
+    shot_filepath = tmp_path / 'OD_HRM5_img_20250602182440.tiff'
+    shot_filepath.write_bytes(b'0' * 100)
+
+    espec = ESpec_.__new__(ESpec_)
+    espec.config = {'name': 'HRM5', 'calib_file': 'master.toml'}
+    espec.ex = SimpleNamespace(config={'paths': {'root': str(tmp_path), 'calibs_folder': 'calibs'}})
+    espec.DAQ = SimpleNamespace(get_filepath=lambda diag_name, shot_dict: shot_filepath)
+    espec.calib_dict = None
+    espec.calib_id = None
+    espec._calib_file_hashes = {}
+
+    def get_calib(calib_id):
+        espec.calib_id = calib_id
+        return {'dispersion': 1}
+    espec.get_calib = get_calib
+    espec.shot_filepath = shot_filepath
+    return espec
+
+
+def shot_key(espec, calib_id='test', **kwargs):
+    return espec.proc_shot_key({'timestamp': ['20250602182440']}, calib_id=calib_id, **kwargs)
+
+
+def bump_mtime(filepath, seconds=1):
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + int(seconds * 1e9)))
+
+
+def test_key_is_stable(espec):
+    assert shot_key(espec) == shot_key(espec)
+    assert shot_key(espec) != shot_key(espec, roi_MeV=[10, 100])
+    assert shot_key(espec) != shot_key(espec, apply_charge=False)
+
+
+def test_key_changes_with_source_file(espec):
+    key = shot_key(espec)
+    bump_mtime(espec.shot_filepath)
+    mtime_key = shot_key(espec)
+    assert mtime_key != key
+
+    stat = os.stat(espec.shot_filepath)
+    espec.shot_filepath.write_bytes(b'0' * 101)
+    os.utime(espec.shot_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert shot_key(espec) not in (key, mtime_key)
+
+
+# an id in the master calibration file, or a calibration file of its own
+@pytest.mark.parametrize('calib_id, filename', [('test', 'master.toml'), ('test.toml', 'test.toml')])
+def test_key_changes_with_calibration_contents(espec, calib_id, filename):
+    key = shot_key(espec, calib_id=calib_id)
+    filepath = espec.build_calib_filepath(filename)
+    stat = os.stat(filepath)
+    # same size, different contents
+    filepath.write_text(filepath.read_text().replace('s', 'S'))
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert os.stat(filepath).st_size == stat.st_size
+    assert shot_key(espec, calib_id=calib_id) != key
+
+
+def test_no_key_without_source_file(espec):
+    espec.shot_filepath.unlink()
+    assert shot_key(espec) is None
+
+
+def test_disk_entry_read_by_new_instance(tmp_path):
+    img = np.arange(20, dtype=float).reshape(4, 5)
+    ProcShotCache(cache_folder=tmp_path).put(KEY, img, make_calib())
+
+    cache = ProcShotCache(cache_folder=tmp_path)
+    cached = cache.get(KEY)
+    assert cached is not None and cache.hits == 1
+    cached_img, calib = cached
+    np.testing.assert_array_equal(cached_img, img)
+    assert not cached_img.flags.writeable
+    np.testing.assert_array_equal(calib.x, make_calib().x)
+    assert calib.calib_id == 'test'
+    # then served from memory
+    assert cache.get(KEY)[0] is cached_img
+    assert sorted(os.listdir(tmp_path)) == [f"{KEY}.calib.npz", f"{KEY}.npy"]
+
+
+def test_half_written_entry_is_a_miss(tmp_path):
+    ProcShotCache(cache_folder=tmp_path).put(KEY, np.ones((4, 5)), make_calib())
+    os.remove(tmp_path / f"{KEY}.calib.npz")
+    cache = ProcShotCache(cache_folder=tmp_path)
+    assert cache.get(KEY) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    ProcShotCache(cache_folder=tmp_path).put(KEY, np.ones((4, 5)), make_calib())
+    (tmp_path / f"{KEY}.npy").write_bytes(b'not an array')
+    assert ProcShotCache(cache_folder=tmp_path).get(KEY) is None
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ProcShotCache(max_bytes=2 * 160)
+    for i in range(3):
+        cache.put(f"{i}", np.full((4, 5), i, dtype=float), make_calib())
+    assert len(cache) == 2 and cache.nbytes <= cache.max_bytes
+    assert cache.get('0') is None and cache.get('2') is not None
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from diagnostics.running_stats import RunningStats
+
+
+def lineouts(n_shots, seed=0):
+    rng = np.random.default_rng(seed)
+    # large offset, small spread: where the naive sum of squares loses precision
+    return 1e6 + rng.normal(scale=3.0, size=(n_shots, 50))
+
+
+def test_update_matches_numpy():
+    values = lineouts(40)
+    stats = RunningStats()
+    for value in values:
+        stats.update(value)
+    assert stats.n == 40
+    np.testing.assert_allclose(stats.mean, np.mean(values, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(stats.std, np.std(values, axis=0), rtol=1e-9)
+
+
+@pytest.mark.parametrize('splits', [[1, 2], [17], [5, 6, 30, 31]])
+def test_merge_matches_numpy(splits):
+    values = lineouts(40, seed=1)
+    x = np.linspace(0, 1, values.shape[1])
+    merged = RunningStats()
+    for part in np.split(values, splits):
+        merged.merge(RunningStats(x=x).update_batch(part))
+
+    assert merged.n == len(values)
+    np.testing.assert_array_equal(merged.x, x)
+    np.testing.assert_allclose(merged.mean, np.mean(values, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(merged.std, np.std(values, axis=0), rtol=1e-9)
+    np.testing.assert_allclose(merged.stderr, np.std(values, axis=0) / np.sqrt(len(values)), rtol=1e-9)
+
+
+def test_merge_empty_and_into_empty():
+    values = lineouts(10, seed=2)
+    stats = RunningStats().update_batch(values)
+    stats.merge(RunningStats())
+    assert stats.n == 10
+    empty = RunningStats().merge(stats)
+    np.testing.assert_allclose(empty.mean, np.mean(values, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(empty.std, np.std(values, axis=0), rtol=1e-9)
+
+
+def test_merge_rejects_other_shapes():
+    stats = RunningStats().update_batch(np.zeros((3, 4)))
+    with pytest.raises(ValueError):
+        stats.merge(RunningStats().update_batch(np.zeros((3, 5))))
+
+
+def test_save_load_then_merge(tmp_path):
+    values = lineouts(30, seed=3)
+    RunningStats().update_batch(values[:12]).save(tmp_path / 'part.npz')
+    stats = RunningStats.load(tmp_path / 'part.npz').merge(RunningStats().update_batch(values[12:]))
+    np.testing.assert_allclose(stats.mean, np.mean(values, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(stats.std, np.std(values, axis=0), rtol=1e-9)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from diagnostics.scope_block import ScopeBlock, as_strided_index
+
+CHANNELS = ['CH1', 'CH2', 'CH3', 'CH4']
+
+
+def scope_shot(N, seed, dt=1e-9):
+    rng = np.random.default_rng(seed)
+    return {'channels': rng.normal(size=(N, len(CHANNELS))), 'time': np.arange(N) * dt, 'dt': dt,
+            'channel_names': CHANNELS, 'label_names': [ch.lower() for ch in CHANNELS]}
+
+
+def test_strided_index():
+    assert as_strided_index([2]) == slice(2, 3)
+    assert as_strided_index([0, 1, 2]) == slice(0, 3, 1)
+    assert as_strided_index([0, 2]) == slice(0, 3, 2)
+    np.testing.assert_array_equal(as_strided_index([2, 0]), [2, 0])
+    np.testing.assert_array_equal(as_strided_index([0, 1, 3]), [0, 1, 3])
+
+
+def test_block_select_returns_views():
+    shots = [scope_shot(200, seed) for seed in range(5)]
+    block = ScopeBlock.from_shots(shots)
+    assert not block.ragged and block.data.shape == (5, 200, 4)
+    window = block.time_window(20e-9, 80e-9)
+
+    for channels, idx in [('CH2', 1), (['CH1', 'CH2'], [0, 1]), (['CH1', 'CH3'], [0, 2]), (None, [0, 1, 2, 3])]:
+        selected = block.select(channels, t_start=20e-9, t_end=80e-9)
+        assert isinstance(selected, np.ndarray)
+        assert np.shares_memory(selected, block.data)
+        expected = np.array([shot['channels'][window, idx] for shot in shots])
+        np.testing.assert_array_equal(selected, expected)
+
+    # unevenly spaced channels cannot be a view, but give the same values
+    selected = block.select(['CH1', 'CH2', 'CH4'])
+    assert not np.shares_memory(selected, block.data)
+    np.testing.assert_array_equal(selected, np.array([shot['channels'][:, [0, 1, 3]] for shot in shots]))
+
+
+def test_ragged_select_matches_block():
+    shots = [scope_shot(N, seed) for seed, N in enumerate([200, 150, 180])]
+    ragged = ScopeBlock.from_shots(shots)
+    assert ragged.ragged and len(ragged) == 3 and ragged.data.shape == (530, 4)
+
+    selected = ragged.select(['CH2', 'CH3'], t_start=10e-9, t_end=120e-9)
+    assert isinstance(selected, list) and len(selected) == 3
+    for shot, voltages in zip(shots, selected):
+        assert np.shares_memory(voltages, ragged.data)
+        np.testing.assert_array_equal(voltages, shot['channels'][10:121, 1:3])
+
+    # the shots cut to one length as a block select the same samples
+    block = ScopeBlock.from_shots([dict(shot, channels=shot['channels'][:150], time=shot['time'][:150]) for shot in shots])
+    for voltages, block_voltages in zip(ragged.select('CH4', t_end=100e-9), block.select('CH4', t_end=100e-9)):
+        np.testing.assert_array_equal(voltages, block_voltages)
+
+
+def test_subtract_and_single_shot():
+    shot = scope_shot(100, 7)
+    block = ScopeBlock.from_shots(shot)
+    assert np.shares_memory(block.data, shot['channels'])
+    np.testing.assert_allclose(block.subtract('CH1', 'CH3')[0], shot['channels'][:, 0] - shot['channels'][:, 2])
+
+
+def test_unknown_channel_and_mixed_channels():
+    block = ScopeBlock.from_shots(scope_shot(10, 0))
+    with pytest.raises(ValueError):
+        block.select('CH7')
+    other = dict(scope_shot(10, 1), channel_names=['CH1', 'CH2', 'CH3', 'CH5'])
+    with pytest.raises(ValueError):
+        ScopeBlock.from_shots([scope_shot(10, 0), other])
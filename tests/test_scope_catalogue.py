@@ -0,0 +1,79 @@
+import pytest
+from DAQs import scope_catalogue
+from DAQs.scope_catalogue import ScopeCatalogue
+from DAQs.shot_index import ShotIndex
+
+
+def write_scope_file(filepath, N=100, dt=1e-9, channels=('CH1', 'CH2')):
+    lines = [f"Record Length,{N}", f"Sample Interval,{dt}", "Labels," + ','.join(ch.lower() for ch in channels),
+             "TIME," + ','.join(channels)]
+    lines += [','.join([str(i * dt)] + ['0'] * len(channels)) for i in range(3)]
+    filepath.write_text('\n'.join(lines) + '\n')
+
+
+@pytest.fixture
+def scope_folder(tmp_path):
+    folder = tmp_path / 'scope'
+    folder.mkdir()
+    for i in range(300):
+        write_scope_file(folder / f"scope1__ALL_20250602{i // 60:02d}{i % 60:02d}00870.csv", N=100 + i)
+    (folder / 'notes.txt').write_text('')
+    return folder
+
+
+@pytest.fixture
+def header_reads(monkeypatch):
+    reads = []
+    read_scope_header = scope_catalogue.read_scope_header
+
+    def counting(filepath):
+        reads.append(filepath)
+        return read_scope_header(filepath)
+    monkeypatch.setattr(scope_catalogue, 'read_scope_header', counting)
+    return reads
+
+
+def test_one_shot_reads_one_header(scope_folder, header_reads):
+    catalogue = ScopeCatalogue(ShotIndex(scope_folder))
+    rows = catalogue.select('20250602010500', '20250602010500:')
+    assert rows['filename'].tolist() == ['scope1__ALL_20250602010500870.csv']
+    assert rows['N'].tolist() == [165] and rows['channel_names'].tolist() == [('CH1', 'CH2')]
+    assert len(header_reads) == 1
+
+    # already read, and a wider timeframe only reads the headers it is missing
+    catalogue.select('20250602010500', '20250602010500:')
+    assert len(header_reads) == 1
+    rows = catalogue.select('20250602010400', '20250602010600')
+    assert len(rows) == 3 and len(header_reads) == 3
+
+
+def test_no_timeframe_reads_whole_folder_once(scope_folder, header_reads):
+    catalogue = ScopeCatalogue(ShotIndex(scope_folder))
+    catalogue.select('20250602000000', '20250602000100')
+    rows = catalogue.select()
+    assert len(rows) == 300 and rows['N'].tolist() == list(range(100, 400))
+    assert len(header_reads) == 300
+    catalogue.select()
+    catalogue.select('20250602010500', '20250602010500:')
+    assert len(header_reads) == 300
+
+
+def test_timeframe_picks_up_new_and_removed_files(scope_folder, header_reads):
+    index = ShotIndex(scope_folder)
+    catalogue = ScopeCatalogue(index)
+    assert len(catalogue.select('20250602000000', '20250602000400')) == 5
+
+    write_scope_file(scope_folder / 'scope1__ALL_20250602000030870.csv', N=7)
+    (scope_folder / 'scope1__ALL_20250602000100870.csv').unlink()
+    index.refresh(force=True)
+    rows = catalogue.select('20250602000000', '20250602000400')
+    assert rows['timestamp'].tolist() == ['20250602000000870', '20250602000030870', '20250602000200870',
+                                          '20250602000300870', '20250602000400870']
+    assert len(header_reads) == 6
+
+
+def test_catalogue_is_reused_from_cache_folder(scope_folder, tmp_path, header_reads):
+    ScopeCatalogue(ShotIndex(scope_folder), cache_folder=tmp_path / 'cache').select()
+    catalogue = ScopeCatalogue(ShotIndex(scope_folder), cache_folder=tmp_path / 'cache')
+    assert len(catalogue.select()) == 300
+    assert len(header_reads) == 300
@@ -0,0 +1,73 @@
+import os
+import threading
+from DAQs.shot_index import ShotIndex
+
+
+def write(folder, filename, dir_mtime_ns):
+    (folder / filename).write_text('0')
+    os.utime(folder, ns=(dir_mtime_ns, dir_mtime_ns))
+
+
+def test_add_keeps_late_files_visible_to_refresh(tmp_path):
+    write(tmp_path, 'shot_20250602182440.csv', 1_000_000_000)
+    index = ShotIndex(tmp_path)
+
+    # the watcher stats the folder, then reads an event for one file; a second file lands
+    # before the add and is not in the events
+    write(tmp_path, 'shot_20250602182442.csv', 2_000_000_000)
+    observed = os.stat(tmp_path).st_mtime_ns
+    write(tmp_path, 'shot_20250602182444.csv', 3_000_000_000)
+    index.add(['shot_20250602182442.csv'], dir_mtime=observed)
+    assert index.filenames.tolist() == ['shot_20250602182440.csv', 'shot_20250602182442.csv']
+
+    assert index.refresh()
+    assert index.filenames.tolist() == ['shot_20250602182440.csv', 'shot_20250602182442.csv', 'shot_20250602182444.csv']
+
+
+def test_add_without_mtime_leaves_index_stale(tmp_path):
+    write(tmp_path, 'shot_20250602182440.csv', 1_000_000_000)
+    index = ShotIndex(tmp_path)
+    write(tmp_path, 'shot_20250602182442.csv', 2_000_000_000)
+    index.add(['shot_20250602182442.csv'])
+    assert index.dir_mtime == 1_000_000_000
+    assert index.refresh()
+
+
+def test_add_with_current_mtime_skips_rescan(tmp_path):
+    write(tmp_path, 'shot_20250602182440.csv', 1_000_000_000)
+    index = ShotIndex(tmp_path)
+    write(tmp_path, 'shot_20250602182442.csv', 2_000_000_000)
+    index.add(['shot_20250602182442.csv'], dir_mtime=os.stat(tmp_path).st_mtime_ns)
+    assert not index.refresh()
+    assert len(index) == 2
+
+
+def test_find_filters_extension_before_substring_fallback(tmp_path):
+    for filename in ['shot_20250602182440.csv', 'run_120250602182440.txt']:
+        (tmp_path / filename).write_text('0')
+    index = ShotIndex(tmp_path)
+    assert index.find('20250602182440') == ['shot_20250602182440.csv']
+    assert index.find('20250602182440', extension='.csv') == ['shot_20250602182440.csv']
+    # nothing with the extension at the start of a digit run, so the substring match is used
+    assert index.find('20250602182440', extension='.txt') == ['run_120250602182440.txt']
+    assert index.find('20250602182440', extension='.png') == []
+
+
+def test_lookups_see_matching_arrays_during_add(tmp_path):
+    (tmp_path / 'shot_20250602000000.csv').write_text('0')
+    index = ShotIndex(tmp_path)
+    filenames = [f'shot_20250602{i:06d}.csv' for i in range(1, 400)]
+    mismatched = []
+
+    def lookup():
+        while len(index) < len(filenames) + 1:
+            keys, selected = index.select('20250602000000', '20250602999999')
+            if len(keys) != len(selected) or any(not f.startswith('shot_' + k) for k, f in zip(keys.tolist(), selected.tolist())):
+                mismatched.append((keys, selected))
+
+    thread = threading.Thread(target=lookup)
+    thread.start()
+    for filename in filenames:
+        index.add([filename])
+    thread.join()
+    assert not mismatched
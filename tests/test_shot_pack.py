@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from DAQs import shot_pack
+from DAQs.shot_pack import ShotPack, ShotPackWriter
+
+EXTENSIONS = [
+    pytest.param('.h5', marks=pytest.mark.skipif(shot_pack.h5py is None, reason="needs h5py")),
+    pytest.param('.zarr', marks=pytest.mark.skipif(shot_pack.zarr is None, reason="needs zarr")),
+]
+
+
+def image_shots(n_shots=5):
+    rng = np.random.default_rng(0)
+    return [(f"OD_HRM5_img_2025060218244{i}.tiff", rng.integers(0, 4096, size=(12, 16)).astype(np.uint16)) for i in range(n_shots)]
+
+
+def scope_shots():
+    rng = np.random.default_rng(1)
+    shots = []
+    for i, N in enumerate([100, 80, 100]):
+        shots.append((f"scope1__ALL_2025060218244{i}870.csv", {
+            'time': np.arange(N) * 1e-9,
+            'channels': rng.normal(size=(N, 2)),
+            'channel_names': ['CH1', 'CH2'],
+            'N': N,
+            'dt': np.float64(1e-9),
+        }))
+    return shots
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+@pytest.mark.parametrize('compression', ['gzip', None])
+def test_image_round_trip(tmp_path, extension, compression):
+    shots = image_shots()
+    filepath = tmp_path / f"HRM5{extension}"
+    with ShotPackWriter(filepath, 'image', compression=compression, chunk_shots=2) as writer:
+        for filename, image in shots:
+            writer.append(filename, image)
+        writer.append('OD_HRM5_img_20250602182450.tiff', None)
+
+    with ShotPack(filepath) as pack:
+        assert len(pack) == len(shots) + 1 and pack.data_type == 'image'
+        assert pack.filenames.tolist()[:-1] == [filename for filename, _ in shots]
+        for i, (filename, image) in enumerate(shots):
+            read = pack.read(pack.index_of({'filename': filename}))
+            assert read.dtype == image.dtype
+            np.testing.assert_array_equal(read, image)
+        assert pack.read(len(shots)) is None
+
+        # runs of consecutive shots and single shots, in the order asked for
+        read = pack.read_many([4, 0, 1, 2, 3], max_run=2)
+        for i, image in zip([4, 0, 1, 2, 3], read):
+            np.testing.assert_array_equal(image, shots[i][1])
+
+        assert pack.select('20250602182441', '20250602182443') == slice(1, 4)
+        assert pack.index_of({'timestamp': ['20250602182442']}) == 2
+        with pytest.raises(ValueError):
+            pack.index_of({'timestamp': ['20250602182459']})
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+def test_scope_round_trip(tmp_path, extension):
+    shots = scope_shots()
+    filepath = tmp_path / f"SCOPE1{extension}"
+    with ShotPackWriter(filepath, 'scope') as writer:
+        for filename, data in shots:
+            writer.append(filename, data)
+
+    with ShotPack(filepath) as pack:
+        assert pack.stamps.tolist() == [f"2025060218244{i}870" for i in range(3)]
+        for (filename, data), read in zip(shots, pack.read_range(0, len(pack))):
+            assert list(read) == list(data)
+            np.testing.assert_array_equal(read['channels'], data['channels'])
+            np.testing.assert_array_equal(read['time'], data['time'])
+            assert read['channel_names'] == data['channel_names']
+            assert read['N'] == data['N'] and read['dt'] == data['dt']
+        assert [meta['N'] for meta in pack.meta()] == [100, 80, 100]
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+def test_failed_write_leaves_no_pack(tmp_path, extension):
+    filepath = tmp_path / f"HRM5{extension}"
+    shots = image_shots(3)
+    with pytest.raises(ValueError):
+        with ShotPackWriter(filepath, 'image') as writer:
+            writer.append(*shots[1])
+            writer.append(*shots[0]) # out of order
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_format_from_extension():
+    with pytest.raises(ValueError):
+        shot_pack.pack_format('HRM5.npz')
+    with pytest.raises(ValueError):
+        shot_pack.pack_format('HRM5.h5', file_format='netcdf')
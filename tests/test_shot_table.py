@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from DAQs.shot_table import build_shot_table, match_nearest
+
+
+def test_nearest_file_wins_over_first_within_tolerance():
+    # B@40.850 is 850 ms from A@40.000 but only 50 ms from A@40.900
+    table = build_shot_table({'A': ['20250602182440000', '20250602182440900'], 'B': ['20250602182440850']}, tolerance=1.0)
+    assert table['A'].tolist() == ['20250602182440000', '20250602182440900']
+    assert table['B'].tolist() == [None, '20250602182440850']
+
+
+def test_one_file_per_diagnostic_per_shot():
+    # both B files are nearest to A@40.000; the closer one takes it, the other its own shot
+    table = build_shot_table({'A': ['20250602182440000'], 'B': ['20250602182439900', '20250602182440050']}, tolerance=0.5)
+    assert len(table) == 2
+    assert table['B'].tolist() == ['20250602182439900', '20250602182440050']
+    assert table['A'].tolist() == [None, '20250602182440000']
+
+
+def test_outside_tolerance_starts_new_shots():
+    table = build_shot_table({'A': ['20250602182440000'], 'B': ['20250602182442000']}, tolerance=1.0)
+    assert table['A'].tolist() == ['20250602182440000', None]
+    assert table['B'].tolist() == [None, '20250602182442000']
+    assert list(table['time']) == list(pd.to_datetime(['2025-06-02 18:24:40', '2025-06-02 18:24:42']))
+
+
+def test_second_resolution_camera_matches_millisecond_scopes():
+    stamps = {
+        'HRM5': ['20250602182440', '20250602182442', '20250602182444'],
+        'SCOPE1': ['20250602182440870', '20250602182442871', '20250602182444873'],
+        'SCOPE2': ['20250602182440871', '20250602182444874'],
+    }
+    table = build_shot_table(stamps, tolerance=1.0)
+    assert len(table) == 3
+    assert table['SCOPE1'].tolist() == stamps['SCOPE1']
+    assert table['SCOPE2'].tolist() == ['20250602182440871', None, '20250602182444874']
+
+
+def test_missing_files_are_none_with_object_dtype():
+    table = build_shot_table({'A': ['20250602182440000'], 'B': []})
+    assert table['B'].dtype == object
+    assert table['B'].tolist() == [None]
+    assert table.dropna(subset=['A', 'B']).empty
+
+
+def test_match_nearest_resolves_conflicts_by_distance():
+    matches = match_nearest(np.array([0, 1000, 2000]), np.array([950, 990, 2600]), tolerance=500)
+    assert matches.tolist() == [-1, 1, -1]
+    matches = match_nearest(np.array([0, 1000, 2000]), np.array([950, 990, 2600]), tolerance=1000)
+    assert matches.tolist() == [0, 1, 2]
@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+from types import SimpleNamespace
+import pytest
+from DAQs import shot_watcher
+from DAQs.shot_index import ShotIndex
+from DAQs.shot_watcher import ShotWatcher
+
+
+class SilentINotify():
+    """inotify that accepts the watch but never raises an event, as on an EOS FUSE mount"""
+
+    def add_watch(self, path, mask):
+        return 1
+
+    def read(self, timeout=None):
+        time.sleep(timeout / 1000)
+        return []
+
+    def close(self):
+        pass
+
+
+class EventINotify(SilentINotify):
+    """inotify that reports the names queued with push()"""
+
+    def __init__(self):
+        self.names = []
+
+    def push(self, name):
+        self.names.append(name)
+
+    def read(self, timeout=None):
+        if not self.names:
+            time.sleep(timeout / 1000)
+        names, self.names = self.names, []
+        return [SimpleNamespace(name=name) for name in names]
+
+
+@pytest.fixture
+def fake_inotify(monkeypatch):
+    def install(inotify):
+        monkeypatch.setattr(shot_watcher, 'INotify', lambda: inotify)
+        monkeypatch.setattr(shot_watcher, 'inotify_flags', SimpleNamespace(CLOSE_WRITE=8, MOVED_TO=128), raising=False)
+        return inotify
+    return install
+
+
+def write_later(filepath, delay=0.1):
+    def write():
+        time.sleep(delay)
+        filepath.write_text('0')
+    thread = threading.Thread(target=write)
+    thread.start()
+    return thread
+
+
+def test_silent_inotify_still_finds_files(tmp_path, fake_inotify):
+    (tmp_path / 'shot_20250602182440.csv').write_text('0')
+    fake_inotify(SilentINotify())
+    watcher = ShotWatcher(ShotIndex(tmp_path), poll_interval=0.05, settle=0.2)
+    assert watcher.backend == 'inotify'
+
+    thread = write_later(tmp_path / 'shot_20250602182442.csv')
+    t0 = time.monotonic()
+    assert watcher.poll(timeout=5) == ['shot_20250602182442.csv']
+    # found by checking the folder, so it waited to settle like a polled file
+    assert time.monotonic() - t0 >= 0.2
+    thread.join()
+    assert watcher.poll(timeout=0.2) == []
+
+
+def test_inotify_events_are_reported_without_settling(tmp_path, fake_inotify):
+    inotify = fake_inotify(EventINotify())
+    watcher = ShotWatcher(ShotIndex(tmp_path), poll_interval=0.05, settle=60)
+    (tmp_path / 'shot_20250602182442.csv').write_text('0')
+    inotify.push('shot_20250602182442.csv')
+    assert watcher.poll(timeout=5) == ['shot_20250602182442.csv']
+    assert watcher.shot_index.filenames.tolist() == ['shot_20250602182442.csv']
+    # a quiet read checks the folder, which must not report the file again
+    assert watcher.poll(timeout=0.2) == []
+
+
+def test_polling_and_catch_up(tmp_path):
+    for i in range(2):
+        (tmp_path / f'shot_2025060218244{i}.csv').write_text('0')
+        os.utime(tmp_path / f'shot_2025060218244{i}.csv', (1e9, 1e9))
+    watcher = ShotWatcher(ShotIndex(tmp_path), since='20250602182441', poll_interval=0.05, settle=0.2, use_inotify=False)
+    assert watcher.backend == 'poll'
+    assert watcher.poll(timeout=1) == ['shot_20250602182441.csv']
+
+    thread = write_later(tmp_path / 'shot_20250602182444.csv')
+    assert watcher.poll(timeout=5) == ['shot_20250602182444.csv']
+    thread.join()
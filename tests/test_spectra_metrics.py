@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from scipy.signal import savgol_filter
+from diagnostics.ESpec_ import ESpec_
+
+trapz = getattr(np, 'trapezoid', None) or np.trapz
+
+
+def old_spectrum_metrics(spec, MeV, percentile=95, tie_digits=None):
+    """ESpec_.spectrum_metrics() before it was vectorised (one spectrum, a re-integrated slice per step).
+    With tie_digits set, the step percentiles are rounded before sorting, so steps in flat parts of
+    the spectrum are exact ties (ordered by energy) rather than ordered by rounding noise."""
+    MeV = np.asarray(MeV)
+    spec = savgol_filter(spec, int(len(MeV)/50), 2)
+    spec[spec<0] = 0
+    spec_dist = np.abs(spec/trapz(spec, MeV))
+    E_mean = np.abs(trapz(spec_dist*MeV, MeV))
+    E_std = np.sqrt(np.abs(trapz(spec_dist*(MeV-E_mean)**2, MeV)))
+    div = 10.0
+    target_percentile = percentile / 100
+    N = int(len(spec_dist)/div)
+    percentile, energy = np.zeros(N), np.zeros(N)
+    for i in range(0, N):
+        max_index = len(MeV)-1-int(div)*i
+        percentile[i] = np.abs(trapz(spec_dist[0:max_index], MeV[0:max_index]))
+        energy[i] = MeV[max_index]
+        if percentile[i] < target_percentile-0.05:
+            break
+    percentile_cut = percentile[percentile!=0.0]
+    energy_cut = energy[percentile!=0.0]
+    energy_cut = energy_cut[percentile_cut<0.999]
+    percentile_cut = percentile_cut[percentile_cut<0.999]
+    if tie_digits is not None:
+        percentile_cut = np.round(percentile_cut, tie_digits)
+    energy_cut = [x for _, x in sorted(zip(percentile_cut, energy_cut))]
+    percentile_cut = sorted(percentile_cut)
+    E_percentile = np.interp(target_percentile, percentile_cut, energy_cut)
+    return E_mean, E_std, E_percentile
+
+
+MeV = np.linspace(5, 50, 600)
+
+
+def noisy_spectra(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(10, 40, n)[:, np.newaxis]
+    widths = rng.uniform(2, 10, n)[:, np.newaxis]
+    return np.exp(-(MeV - centres)**2 / (2*widths**2)) * 1e3 + rng.normal(30, 10, (n, len(MeV)))
+
+
+def flat_spectra(n, seed=1):
+    # two narrow peaks on a zero background: after clipping the spectra are exactly flat between
+    # them, and the cumulative charge has a plateau at a level that varies around the percentiles
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(10, 35, n)[:, np.newaxis]
+    amplitudes = rng.uniform(0.02, 0.6, n)[:, np.newaxis]
+    specs = np.exp(-(MeV - centres)**2 / (2*0.8**2)) + amplitudes * np.exp(-(MeV - centres - 8)**2 / (2*0.8**2))
+    return specs * 1e3 - 5
+
+
+def metrics(specs, percentile=95):
+    return ESpec_.spectra_metrics(None, specs, MeV, percentile=percentile)
+
+
+@pytest.mark.parametrize('percentile', [50, 80, 95])
+def test_matches_old_implementation_on_noisy_spectra(percentile):
+    specs = noisy_spectra(150)
+    E_means, E_stds, E_percentiles = metrics(specs, percentile)
+    old = np.array([old_spectrum_metrics(spec, MeV, percentile) for spec in specs])
+    np.testing.assert_allclose(E_means, old[:, 0], rtol=1e-9)
+    np.testing.assert_allclose(E_stds, old[:, 1], rtol=1e-9)
+    np.testing.assert_allclose(E_percentiles, old[:, 2], rtol=1e-9)
+
+
+@pytest.mark.parametrize('percentile', [50, 80, 95])
+def test_flat_spectra_resolve_ties_by_energy(percentile):
+    # in flat stretches the old code ordered equal percentiles by their rounding noise (~1e-16),
+    # which could pair the target with any energy of the stretch. The new code orders ties by
+    # energy, as the old code does once the ties are made exact by rounding.
+    specs = flat_spectra(300)
+    E_means, E_stds, E_percentiles = metrics(specs, percentile)
+    old = np.array([old_spectrum_metrics(spec, MeV, percentile, tie_digits=12) for spec in specs])
+    np.testing.assert_allclose(E_means, old[:, 0], rtol=1e-9)
+    np.testing.assert_allclose(E_stds, old[:, 1], rtol=1e-9)
+    np.testing.assert_allclose(E_percentiles, old[:, 2], rtol=1e-9)
+
+
+def test_flat_spectra_exercise_ties():
+    # without rounding, the old code differs on some of these spectra, so the test above covers ties
+    specs = flat_spectra(300)
+    differs = False
+    for percentile in [50, 80, 95]:
+        E_percentiles = metrics(specs, percentile)[2]
+        old = np.array([old_spectrum_metrics(spec, MeV, percentile)[2] for spec in specs])
+        differs |= not np.allclose(E_percentiles, old, rtol=1e-9)
+    assert differs
+
+
+def test_stack_matches_single_spectra():
+    specs = np.concatenate([noisy_spectra(20), flat_spectra(20)])
+    stacked = metrics(specs)
+    for i, spec in enumerate(specs):
+        single = ESpec_.spectra_metrics(None, spec[np.newaxis], MeV)
+        np.testing.assert_allclose([value[0] for value in single], [value[i] for value in stacked], rtol=1e-12)
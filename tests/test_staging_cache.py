@@ -0,0 +1,97 @@
+import os
+import time
+from pathlib import Path
+from DAQs.staging_cache import StagingCache
+
+
+def source_files(folder, n_files, size=1000):
+    os.makedirs(folder, exist_ok=True)
+    filepaths = []
+    for i in range(n_files):
+        filepath = folder / f"OD_HRM5_img_2025060218244{i}.csv"
+        filepath.write_bytes(bytes([i]) * size)
+        filepaths.append(filepath)
+    return filepaths
+
+
+def staged_files(staging_folder):
+    return sorted(f for f in os.listdir(staging_folder) if not f.endswith('.json'))
+
+
+def test_stage_copies_once_and_keeps_filename(tmp_path):
+    filepaths = source_files(tmp_path / 'eos', 2)
+    cache = StagingCache(tmp_path / 'staging', max_bytes=10_000)
+    local_filepath = cache.stage(filepaths[0])
+    assert local_filepath != filepaths[0] and local_filepath.name.endswith(filepaths[0].name)
+    assert local_filepath.read_bytes() == filepaths[0].read_bytes()
+    assert os.stat(local_filepath).st_mtime_ns == os.stat(filepaths[0]).st_mtime_ns
+    assert cache.stage(filepaths[0]) == local_filepath
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_eviction_keeps_within_budget_least_recently_used_first(tmp_path):
+    filepaths = source_files(tmp_path / 'eos', 5)
+    cache = StagingCache(tmp_path / 'staging', max_bytes=3000)
+    local = [cache.stage(filepath) for filepath in filepaths[:3]]
+    assert cache.nbytes == 3000 and cache.evictions == 0
+
+    cache.stage(filepaths[0]) # most recently used again
+    cache.stage(filepaths[3])
+    assert cache.nbytes <= cache.max_bytes and cache.evictions == 1
+    assert not local[1].exists() and local[0].exists() and local[2].exists()
+    assert len(staged_files(tmp_path / 'staging')) == len(cache) == 3
+
+    # files larger than the whole budget are read in place
+    big = tmp_path / 'eos' / 'big_20250602182450.csv'
+    big.write_bytes(b'0' * 4000)
+    assert cache.stage(big) == Path(os.path.abspath(big))
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_source_change_invalidates_copy(tmp_path):
+    filepath = source_files(tmp_path / 'eos', 1)[0]
+    cache = StagingCache(tmp_path / 'staging', max_bytes=10_000)
+    cache.stage(filepath)
+
+    filepath.write_bytes(b'rewritten')
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    local_filepath = cache.stage(filepath)
+    assert local_filepath.read_bytes() == b'rewritten'
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert cache.nbytes == len(b'rewritten') and len(cache) == 1
+
+    # same size, only the modification time changes
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+    cache.stage(filepath)
+    assert cache.misses == 3
+
+
+def test_later_session_reuses_copies_only_while_valid(tmp_path):
+    filepaths = source_files(tmp_path / 'eos', 2)
+    cache = StagingCache(tmp_path / 'staging', max_bytes=10_000)
+    for filepath in filepaths:
+        cache.stage(filepath)
+    cache.close()
+
+    stat = os.stat(filepaths[1])
+    os.utime(filepaths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    cache = StagingCache(tmp_path / 'staging', max_bytes=10_000)
+    assert len(cache) == 2 and cache.nbytes == 2000
+    cache.stage(filepaths[0])
+    cache.stage(filepaths[1])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_prefetch_then_stage_hits(tmp_path):
+    filepaths = source_files(tmp_path / 'eos', 4)
+    cache = StagingCache(tmp_path / 'staging', max_bytes=10_000, workers=2)
+    cache.prefetch(filepaths)
+    deadline = time.monotonic() + 10
+    while cache.stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.prefetched == 4
+    for filepath in filepaths:
+        assert cache.stage(filepath).read_bytes() == filepath.read_bytes()
+    assert cache.hits == 4 and cache.misses == 0
+    cache.close()